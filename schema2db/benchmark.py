@@ -0,0 +1,320 @@
+"""
+Throughput benchmarks
+
+Every benchmark is run at one or more scales (rows per table, or tables
+for parse) and reports the best wall time of a few runs, the throughput
+and the peak memory traced in one more run. Results can be saved as
+json and compared with an earlier run to catch regressions.
+
+Run from the command line:
+    python -m schema2db.benchmark parse --tables 5000
+    python -m schema2db.benchmark all --scales 1000 100000 --output new.json
+    python -m schema2db.benchmark all --scales 1000 100000 --baseline old.json
+    python -m schema2db.benchmark schema --tables 50 --shape wide > schema.sql
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+import pandas as pd
+import schema2db.randomdata as rd
+import schema2db.export as export
+from schema2db.gendata import DBGenerator
+from schema2db.parse_schema import SchemaParser
+
+SHAPES = ['deep', 'wide']
+# measured values, everything else in a result names the benchmark
+MEASURES = ['seconds', 'rows/s', 'MB/s', 'tables/s', 'peak_MB', 'bytes']
+DATATYPES = [('int', []), ('varchar', [20]), ('decimal', [12, 2]), ('date', [])]
+
+
+def synthetic_schema(tables=1000, columns=8, shape='deep'):
+    """DDL of tables linked by foreign keys, each with an enum check,
+    in the style of tests/testdata/testschema1.sql
+    Parameters
+    ----------
+    shape: str
+        deep chains the tables, every table references the one before
+        it. wide makes every table reference the first one
+    """
+    if shape not in SHAPES:
+        raise ValueError("Unknown shape {}, options are {}".format(shape, SHAPES))
+    types = ['int(16) unsigned', 'varchar(40)', 'decimal(12,2) signed', 'date']
+    parts = []
+    for t in range(tables):
+        lines = ['   id int(16) unsigned not null']
+        for c in range(1, columns):
+            lines.append('   c{} {} {}'.format(c, types[c % len(types)],
+                                               'null' if c % 2 else 'not null'))
+        if t:
+            lines.append('   parent int(16) unsigned not null')
+        lines.append('   primary key (id)')
+        parts.append('create table t{} (\n{}\n);\n'.format(t, ',\n'.join(lines)))
+        constraints = ['   add constraint chk_t{}_c1 check (c1 in (0, 1, 2))'.format(t)]
+        if t:
+            parent = t - 1 if shape == 'deep' else 0
+            constraints.append('   add constraint fk_t{0}_parent foreign key (parent) '
+                               'references t{1} (id)'.format(t, parent))
+        parts.append('alter table t{} (\n{}\n);\n'.format(t, '\n'.join(constraints)))
+    return '\n'.join(parts)
+
+
+def _timed(func, repeat):
+    """Best wall time of repeat calls"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _peak(func):
+    """Peak traced memory of a call in MB. numpy and pandas buffers are
+    traced as well as python objects
+    """
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+
+
+def _measure(func, repeat, memory=True, **result):
+    """result with the best time, rows/s (when result has rows) and peak
+    memory of func added
+    """
+    result['seconds'] = _timed(func, repeat)
+    if 'rows' in result:
+        result['rows/s'] = result['rows'] / result['seconds']
+    if memory:
+        result['peak_MB'] = _peak(func)
+    return result
+
+
+def _parsed(tables, columns, shape):
+    return SchemaParser().extract_sql_string(synthetic_schema(tables, columns, shape))
+
+
+def bench_parse(tables=1000, columns=8, repeat=3, memory=True):
+    """Parse a synthetic schema file of the given number of tables
+    Returns
+    -------
+    dict with the file size, best time and throughput
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'schema.sql')
+        with open(path, 'w') as f:
+            f.write(synthetic_schema(tables, columns))
+        size = os.path.getsize(path)
+        result = _measure(lambda: SchemaParser().extract_sql_doc(path), repeat, memory,
+                          name='parse', tables=tables)
+    result.update({'bytes': size, 'MB/s': size / result['seconds'] / 1e6,
+                   'tables/s': tables / result['seconds']})
+    return result
+
+
+def bench_random(rows=100000, repeat=3, memory=True):
+    """rd.random_list and rd.random_array for every data type"""
+    results = []
+    for datatype, args in DATATYPES:
+        results.append(_measure(
+            lambda: rd.random_list(datatype, args, True, rows), repeat, memory,
+            name='random_list', datatype=datatype, rows=rows))
+        results.append(_measure(
+            lambda: rd.random_array(datatype, args, True, rows, np.random.default_rng(0)),
+            repeat, memory, name='random_array', datatype=datatype, rows=rows))
+    return results
+
+
+def bench_columns(rows=100000, repeat=3, memory=True):
+    """DBGenerator.gen_column_data on plain, nullable, primary key,
+    foreign key (choices) and excluded value columns
+    """
+    choices = np.arange(max(rows // 10, 1))
+    excluded = choices[::2]
+    cases = {'int': {'isnull': False},
+             'int_null': {'isnull': True},
+             'varchar_null': {'datatype': 'varchar', 'args': [20]},
+             'int_pk': {'primary_key': True, 'isnull': False},
+             'varchar_pk': {'datatype': 'varchar', 'args': [20], 'primary_key': True,
+                            'isnull': False},
+             'choices': {'choices': choices, 'isnull': False},
+             'choices_excluded': {'choices': choices, 'excluded': excluded,
+                                  'isnull': False},
+             'int_excluded': {'excluded': excluded, 'isnull': False}}
+    results = []
+    for case, kwargs in cases.items():
+        results.append(_measure(
+            lambda: DBGenerator.gen_column_data(num_rows=rows,
+                                                rng=np.random.default_rng(0), **kwargs),
+            repeat, memory, name='gen_column_data', case=case, rows=rows))
+    return results
+
+
+def bench_generate(rows=10000, tables=20, columns=8, shape='deep', repeat=3, memory=True):
+    """DBGenerator.gen_db_data on a synthetic schema"""
+    db_gen = DBGenerator(_parsed(tables, columns, shape), seed=0)
+    return _measure(lambda: db_gen.gen_db_data(row_num=rows), repeat, memory,
+                    name='gen_db_data', shape=shape, tables=tables, columns=columns,
+                    rows=rows * tables)
+
+
+def bench_export(rows=10000, tables=20, columns=8, shape='deep', repeat=3, memory=True):
+    """export_db in every format pyarrow allows, and db_to_inserts"""
+    db_gen = DBGenerator(_parsed(tables, columns, shape), seed=0)
+    db_gen.gen_db_data(row_num=rows)
+    formats = ['csv']
+    try:
+        export._pyarrow()
+        formats += ['parquet', 'feather']
+    except ImportError:
+        pass
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt in formats:
+            results.append(_measure(lambda: db_gen.export_db(tmp, fmt=fmt), repeat, memory,
+                                    name='export_db', format=fmt, shape=shape,
+                                    tables=tables, rows=rows * tables))
+        results.append(_measure(lambda: db_gen.db_to_inserts(tmp), repeat, memory,
+                                name='db_to_inserts', shape=shape, tables=tables,
+                                rows=rows * tables))
+    return results
+
+
+BENCHMARKS = ['parse', 'random', 'columns', 'generate', 'export']
+
+
+def run_suite(benchmarks=BENCHMARKS, scales=(10000,), tables=20, columns=8,
+              shapes=SHAPES, repeat=3, memory=True):
+    """Run benchmarks at every scale
+    Parameters
+    ----------
+    scales: list
+        rows per table (column, for random and columns). parse takes them
+        as the number of tables, divided by 10
+    Returns
+    -------
+    list of result dicts
+    """
+    results = []
+    for scale in scales:
+        for name in benchmarks:
+            if name == 'parse':
+                results.append(bench_parse(max(scale // 10, 1), columns, repeat, memory))
+            elif name == 'random':
+                results += bench_random(scale, repeat, memory)
+            elif name == 'columns':
+                results += bench_columns(scale, repeat, memory)
+            elif name in ['generate', 'export']:
+                func = bench_generate if name == 'generate' else bench_export
+                for shape in shapes:
+                    result = func(scale, tables, columns, shape, repeat, memory)
+                    results += result if isinstance(result, list) else [result]
+            else:
+                raise ValueError("Unknown benchmark {}, options are {}".format(
+                    name, BENCHMARKS))
+    return results
+
+
+def save(results, path):
+    """Write results to a json file with the versions they were run on"""
+    doc = {'python': platform.python_version(), 'numpy': np.__version__,
+           'pandas': pd.__version__, 'machine': platform.machine(),
+           'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}
+    with open(path, 'w') as f:
+        json.dump(doc, f, indent=1)
+
+
+def load(path):
+    """Results saved by save"""
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+def result_key(result):
+    return tuple(sorted((k, v) for k, v in result.items() if k not in MEASURES))
+
+
+def compare(results, baseline, tolerance=0.1):
+    """Match results with the baseline run of the same benchmark
+    Returns
+    -------
+    list of (result, baseline seconds, ratio of new to old time,
+    regressed), regressed when the ratio exceeds 1 + tolerance
+    """
+    old = {result_key(r): r for r in baseline}
+    compared = []
+    for r in results:
+        base = old.get(result_key(r))
+        if base is None:
+            continue
+        ratio = r['seconds'] / base['seconds']
+        compared.append((r, base['seconds'], ratio, ratio > 1 + tolerance))
+    return compared
+
+
+def report(result):
+    return '  '.join('{}={:.4g}'.format(k, v) if isinstance(v, float)
+                     else '{}={}'.format(k, v) for k, v in result.items())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='schema2db throughput benchmarks')
+    parser.add_argument('benchmark', choices=BENCHMARKS + ['all', 'schema'],
+                        help='benchmark to run, all of them, or schema to print '
+                        'a synthetic schema')
+    parser.add_argument('--scales', type=int, nargs='+', default=[10000],
+                        help='rows per table (or column) to run at')
+    parser.add_argument('--tables', type=int, default=None,
+                        help='tables of the synthetic schema, 20 by default '
+                        '(parse: scale / 10)')
+    parser.add_argument('--columns', type=int, default=8)
+    parser.add_argument('--shape', choices=SHAPES, action='append', default=None,
+                        help='foreign key layout of the synthetic schema')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-memory', action='store_true',
+                        help='skip the traced run that measures peak memory')
+    parser.add_argument('--output', default=None, help='save results to this json file')
+    parser.add_argument('--baseline', default=None,
+                        help='compare with results saved by an earlier --output')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='slowdown over the baseline that counts as a regression')
+    args = parser.parse_args()
+
+    shapes = args.shape or SHAPES
+    if args.benchmark == 'schema':
+        print(synthetic_schema(args.tables or 20, args.columns, shapes[0]))
+        return
+    memory = not args.no_memory
+    if args.benchmark == 'parse' and args.tables:
+        results = [bench_parse(args.tables, args.columns, args.repeat, memory)]
+    else:
+        names = BENCHMARKS if args.benchmark == 'all' else [args.benchmark]
+        results = run_suite(names, args.scales, args.tables or 20, args.columns,
+                            shapes, args.repeat, memory)
+    for r in results:
+        print(report(r))
+    if args.output:
+        save(results, args.output)
+    if args.baseline:
+        regressed = False
+        print('\ncompared with {}'.format(args.baseline))
+        for r, seconds, ratio, slower in compare(results, load(args.baseline),
+                                                 args.tolerance):
+            name = ' '.join('{}={}'.format(k, v) for k, v in result_key(r))
+            print('{:<70} {:.4g}s -> {:.4g}s  x{:.2f}{}'.format(
+                name, seconds, r['seconds'], ratio, '  REGRESSION' if slower else ''))
+            regressed |= slower
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+On-disk cache of parsed schemas and generation plans
+
+Entries are pickled to <cache dir>/<key>.pkl, where the key is a hash of
+the schema file content and of everything else the entry depends on.
+When the directory grows past its size limit, the least recently used
+entries are removed. Set SCHEMA2DB_CACHE to move the cache directory.
+A cache directory that cannot be read or written is skipped, callers
+then parse the schema as if there were no cache.
+"""
+import gc
+import os
+import pickle
+import hashlib
+import tempfile
+
+CACHE_DIR = os.environ.get('SCHEMA2DB_CACHE',
+                           os.path.join(os.path.expanduser('~'), '.cache', 'schema2db'))
+MAX_BYTES = 64 << 20
+# bump when the parser or the cached plans change shape
+VERSION = 4
+
+
+def cache_key(path, *extra):
+    """Hash of a file's content and any extra values (passed through repr)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    digest.update(repr((VERSION,) + extra).encode())
+    return digest.hexdigest()
+
+
+class SchemaCache():
+    """Pickled objects stored by key in a directory
+    Parameters
+    ----------
+    path: str
+        cache directory, created on first store
+    max_bytes: int
+        size of the directory above which least recently used entries
+        are evicted
+    """
+    def __init__(self, path=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def entry_path(self, key):
+        return os.path.join(self.path, key + '.pkl')
+
+    def load(self, key):
+        """Cached object, or None if there is none (or it cannot be read)"""
+        path = self.entry_path(key)
+        # a schema unpickles to many small dicts and lists, collecting
+        # garbage while they are made takes longer than reading them
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+        finally:
+            if enabled:
+                gc.enable()
+        # mark as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def store(self, key, value):
+        """Write an entry atomically, then evict old ones if over the limit.
+        Returns False, storing nothing, if the directory cannot be written
+        """
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        except OSError:
+            return False
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.entry_path(key))
+        except BaseException as e:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            if isinstance(e, OSError):
+                # e.g. the disk is full
+                return False
+            raise
+        self.evict(keep=key)
+        return True
+
+    def entries(self):
+        """(last use, size, path) of every entry"""
+        if not os.path.isdir(self.path):
+            return []
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            return []
+        found = []
+        for name in names:
+            if name.endswith('.pkl'):
+                path = os.path.join(self.path, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                found.append((st.st_mtime, st.st_size, path))
+        return found
+
+    def evict(self, keep=None):
+        """Remove least recently used entries until the cache fits
+        max_bytes, except the entry of key keep
+        """
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        keep = keep and self.entry_path(keep)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        """Remove every entry"""
+        for _, _, path in self.entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
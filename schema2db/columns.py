@@ -0,0 +1,146 @@
+"""
+Compact pandas storage for generated columns
+
+Generated values come out of gen_column_data as numpy arrays, with None
+marking nulls in object arrays. compact_column turns them into the
+smallest pandas array that still holds every value of the sql type:
+narrow (nullable) integers, fixed-point decimals, datetime64 dates,
+Arrow backed strings and categoricals for columns drawn from a small set
+of choices.
+"""
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# columns drawn from at most this many choices are stored as categoricals,
+# as long as each choice shows up in CATEGORICAL_RATIO rows on average
+CATEGORICAL_MAX = 1 << 15
+CATEGORICAL_RATIO = 2
+# value range of generated ints, see rd.random_int and keys.KeyDomain
+RANDOM_INT_RANGE = (-10000, 10000)
+KEY_INT_RANGE = {True: (1, 2 ** 31 - 1), False: (1, 2 ** 32 - 1)}
+
+
+def int_dtype(lower, upper):
+    """Narrowest numpy integer dtype holding lower..upper"""
+    for dtype in ([np.uint8, np.uint16, np.uint32, np.uint64] if lower >= 0
+                  else [np.int8, np.int16, np.int32, np.int64]):
+        info = np.iinfo(dtype)
+        if info.min <= lower and upper <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def null_mask(values):
+    """Nulls of a generated array: None/NaN/NaT"""
+    return np.asarray(pd.isna(values), dtype=bool)
+
+
+def _ints(values, mask, lower, upper):
+    dtype = int_dtype(lower, upper)
+    if not mask.any():
+        return np.asarray(values).astype(dtype)
+    data = np.where(mask, 0, values).astype(dtype)
+    return pd.arrays.IntegerArray(data, mask.copy())
+
+
+def _decimals(values, mask, args):
+    floats = np.where(mask, np.nan, values).astype(float)
+    if pa is None or len(args) != 2:
+        return floats
+    precision, scale = args
+    # fixed-point: pyarrow stores the value scaled by 10 ** scale in an
+    # 8 byte (or 16 byte above 18 digits) integer
+    decimal = getattr(pa, 'decimal64', None)
+    if decimal is None or precision > 18:
+        decimal = pa.decimal128
+    array = pa.array(floats, mask=mask, from_pandas=True).cast(decimal(precision, scale))
+    return pd.array(array, dtype=pd.ArrowDtype(array.type))
+
+
+def _strings(values, mask):
+    storage = 'pyarrow' if pa is not None else 'python'
+    if pa is not None:
+        array = pa.array(np.where(mask, None, values) if mask.any() else values,
+                         type=pa.string(), from_pandas=True)
+        return pd.array(array, dtype=pd.StringDtype(storage))
+    return pd.array(np.where(mask, None, values), dtype=pd.StringDtype(storage))
+
+
+def row_bytes(create_sql):
+    """Rough in-memory size of one generated row of a table, in bytes,
+    for compact columns
+    """
+    size = 0
+    for col in create_sql['columns']:
+        datatype = col['type']['type'].lower()
+        args = [int(a) for a in col['type']['args']]
+        if datatype == 'int':
+            size += 4
+        elif datatype == 'varchar':
+            # two dictionary words cut to the column width, plus the
+            # 4 byte arrow offset
+            size += min(args[0] if args else 20, 20) + 4
+        else:
+            size += 8
+    return max(size, 1)
+
+
+def distinct_values(values):
+    """Distinct non-null values of a column as a numpy array, in order of
+    first appearance. Empty strings count as null
+    """
+    values = pd.Series(values)
+    keep = values.notna().to_numpy(dtype=bool, copy=True)
+    if values.dtype == object or pd.api.types.is_string_dtype(values):
+        keep &= (values != '').to_numpy(dtype=bool, na_value=False)
+    return pd.unique(values[keep].to_numpy())
+
+
+def compact_column(values, datatype='int', args=None, signed=None, choices=None,
+                   primary_key=False):
+    """Smallest pandas array for a generated column
+    Parameters
+    ----------
+    values: numpy array
+        as returned by gen_column_data
+    choices: array
+        values the column was drawn from (enum values or parent keys).
+        Unless the column is a primary key, a few choices repeated over
+        many rows (see CATEGORICAL_MAX) are stored as a categorical
+    Returns
+    -------
+    numpy or pandas extension array
+    """
+    datatype = datatype.lower()
+    args = args or []
+    mask = null_mask(values)
+    if choices is not None and not primary_key and len(choices) <= CATEGORICAL_MAX \
+            and len(choices) * CATEGORICAL_RATIO <= len(values):
+        categories = pd.unique(np.asarray(choices))
+        if datatype in ['int', 'decimal'] and \
+                not pd.api.types.is_numeric_dtype(categories.dtype):
+            # enum values are parsed as strings
+            categories = pd.unique(pd.to_numeric(categories))
+            values = pd.to_numeric(pd.Series(values)).to_numpy()
+        return pd.Categorical(values, categories=categories)
+    if datatype == 'int':
+        if choices is not None and len(choices):
+            ints = pd.to_numeric(pd.Series(choices)).to_numpy()
+            lower, upper = int(ints.min()), int(ints.max())
+        elif primary_key:
+            lower, upper = KEY_INT_RANGE[signed is not False]
+        else:
+            lower, upper = RANDOM_INT_RANGE if signed else (0, RANDOM_INT_RANGE[1])
+        return _ints(pd.to_numeric(pd.Series(values)).to_numpy() if values.dtype == object
+                     else values, mask, lower, upper)
+    elif datatype == 'decimal':
+        return _decimals(values, mask, args)
+    elif datatype in ['date', 'datetime']:
+        return np.asarray(values, dtype='datetime64[D]' if datatype == 'date'
+                          else 'datetime64[s]').astype('datetime64[s]')
+    return _strings(values, mask)
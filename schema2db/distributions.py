@@ -0,0 +1,160 @@
+"""
+Value distributions of generated columns
+
+Columns drawn from a set of choices (foreign keys and enums) are sampled
+as indices into the choices array, so skewed and uniform columns cost
+the same and the choices are never copied. A distribution is given as a
+name or a dict with a 'type' and its parameters:
+
+- uniform: every choice equally likely
+- zipf: choice k (from 1) has weight 1 / k ** s, s=1 by default
+- pareto: bounded Pareto over the choice ranks with shape a, a=1.16
+  (the 80/20 rule) by default
+- normal: ranks around loc * n with spread scale * n, loc=0.5 and
+  scale=1/6 by default
+- weighted: explicit weights, a list in the order of the choices or a
+  dict of value to weight (other values get 0)
+
+zipf, pareto and normal also shape int and decimal columns that are not
+drawn from choices, in value units, clipped to the range of the column.
+"""
+import numpy as np
+import schema2db.randomdata as rd
+
+DISTRIBUTIONS = ['uniform', 'zipf', 'pareto', 'normal', 'weighted']
+
+
+def parse_spec(spec):
+    """(type, parameters) of a distribution given by name or dict"""
+    if spec is None:
+        return 'uniform', {}
+    if isinstance(spec, str):
+        spec = {'type': spec}
+    params = dict(spec)
+    kind = params.pop('type', 'uniform')
+    if kind not in DISTRIBUTIONS:
+        raise ValueError("Unknown distribution {}, options are {}".format(kind, DISTRIBUTIONS))
+    return kind, params
+
+
+def choice_weights(kind, params, choices):
+    """Probabilities of every choice, None for uniform"""
+    n = len(choices)
+    if kind == 'zipf':
+        weights = 1 / np.arange(1, n + 1, dtype=float) ** params.get('s', 1.0)
+    elif kind == 'weighted':
+        weights = params['weights']
+        if isinstance(weights, dict):
+            lookup = {str(k): float(v) for k, v in weights.items()}
+            weights = [lookup.get(str(c), 0.0) for c in np.asarray(choices).tolist()]
+        weights = np.asarray(weights, dtype=float)
+        if len(weights) != n:
+            raise ValueError("Got {} weights for {} choices".format(len(weights), n))
+    else:
+        return None
+    if weights.sum() <= 0:
+        raise ValueError("Weights of a {} distribution must not all be 0".format(kind))
+    return weights / weights.sum()
+
+
+def sample_indices(spec, choices, size, rng=None):
+    """Indices of size values drawn from choices with a distribution
+    Parameters
+    ----------
+    spec: str or dict
+        distribution, see the module docstring
+    choices: array
+        values to draw from, only its length (and values for a weighted
+        dict) are used
+    Returns
+    -------
+    numpy int64 array
+    """
+    rng = rng or np.random.default_rng()
+    kind, params = parse_spec(spec)
+    n = len(choices)
+    if kind == 'uniform':
+        return rng.integers(0, n, size=size)
+    elif kind == 'pareto':
+        # inverse cdf of a Pareto bounded to [1, n + 1], one rank per unit
+        a = params.get('a', 1.16)
+        u = rng.random(size)
+        x = (1 - u * (1 - (n + 1.0) ** -a)) ** (-1 / a)
+        return np.minimum(np.floor(x).astype(np.int64) - 1, n - 1)
+    elif kind == 'normal':
+        x = rng.normal(params.get('loc', 0.5) * n, params.get('scale', 1 / 6) * n, size)
+        return np.clip(np.round(x), 0, n - 1).astype(np.int64)
+    cdf = np.cumsum(choice_weights(kind, params, choices))
+    return np.minimum(np.searchsorted(cdf, rng.random(size) * cdf[-1], side='right'), n - 1)
+
+
+def value_range(datatype, args, signed):
+    """Smallest and largest value of a generated int or decimal column"""
+    if datatype == 'int':
+        return (-10000 if signed else 0), 10000
+    if len(args) != 2:
+        raise ValueError("Invalid arguments ({}) for decimal".format(args))
+    bound = (10 ** args[0] - 1) / 10 ** args[1]
+    return (-bound if signed else 0), bound
+
+
+def sample_values(spec, datatype, args, signed, size, rng=None):
+    """Int or decimal values drawn from a zipf, pareto or normal
+    distribution, clipped to the column range
+    Parameters
+    ----------
+    spec: str or dict
+        zipf takes s (default 2), pareto takes a and scale (defaults
+        1.16 and 1), normal takes loc and scale (default 0 and a sixth of
+        the column range)
+    """
+    rng = rng or np.random.default_rng()
+    kind, params = parse_spec(spec)
+    datatype = datatype.lower()
+    if datatype not in ['int', 'decimal']:
+        raise ValueError("Distribution {} is only supported on int and decimal "
+                         "columns, not {}".format(kind, datatype))
+    lower, upper = value_range(datatype, args, signed)
+    if kind == 'zipf':
+        values = rng.zipf(params.get('s', 2.0), size).astype(float)
+    elif kind == 'pareto':
+        values = (rng.pareto(params.get('a', 1.16), size) + 1) * params.get('scale', 1.0)
+    elif kind == 'normal':
+        values = rng.normal(params.get('loc', 0.0),
+                            params.get('scale', (upper - lower) / 6), size)
+    elif kind == 'uniform':
+        return rd.random_array(datatype, args, signed, size, rng)
+    else:
+        raise ValueError("Distribution {} needs choices to draw from".format(kind))
+    values = np.clip(values, lower, upper)
+    if datatype == 'int':
+        return np.round(values).astype(np.int64)
+    return np.round(values, args[1])
+
+
+class FanOut():
+    """Children per parent row of a foreign key column. Every parent key
+    gets between low and high child rows, drawn once, and the child rows
+    are laid out parent by parent, so any range of rows can be made on
+    its own
+    Parameters
+    ----------
+    parents: array
+        parent keys
+    low, high: int
+        fewest and most children of a parent
+    """
+    def __init__(self, parents, low, high, rng=None):
+        if low < 0 or high < low:
+            raise ValueError("Invalid fan-out ({}, {})".format(low, high))
+        rng = rng or np.random.default_rng()
+        self.parents = parents
+        counts = rng.integers(low, high, size=len(parents), endpoint=True)
+        self.ends = np.cumsum(counts)
+        self.size = int(self.ends[-1]) if len(self.ends) else 0
+
+    def take(self, start, stop):
+        """Parent key of child rows start..stop-1"""
+        stop = min(stop, self.size)
+        rows = np.arange(start, max(start, stop))
+        return self.parents[np.searchsorted(self.ends, rows, side='right')]
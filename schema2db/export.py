@@ -0,0 +1,485 @@
+"""
+Write generated tables out as sql inserts, csv, parquet or arrow files
+"""
+import os
+import gzip
+import queue
+import threading
+import numpy as np
+import pandas as pd
+
+# one INSERT statement holds this many rows unless told otherwise
+BATCH_SIZE = 1000
+WRITE_BUFFER = 1 << 20
+# compression of text files (csv, sql) and the suffix it adds
+COMPRESSIONS = {'gzip': 'gz', 'zstd': 'zst'}
+# chunks a writer thread may have waiting before the producer blocks
+QUEUE_CHUNKS = 2
+_STR = np.dtypes.StringDType()
+
+
+def sql_literals(values, type_a='none'):
+    """Sql literals of a whole column at once
+    Parameters
+    ----------
+    values: pandas.Series or array
+    type_a: str
+        sql type of the column. varchar, date and datetime values are
+        quoted, with single quotes doubled as in standard sql
+    Returns
+    -------
+    numpy array of strings (StringDType). Missing values (NaN/None/NA)
+    become NULL, empty strings stay ''
+    """
+    type_a = type_a.lower()
+    values = pd.Series(values)
+    isnull = values.isna().to_numpy(dtype=bool, copy=True)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        unit = 'D' if type_a == 'date' else 's'
+        arr = values.to_numpy().astype('datetime64[{}]'.format(unit))
+        literals = np.datetime_as_string(arr, unit=unit).astype(_STR)
+        if unit == 's':
+            literals = np.strings.replace(literals, 'T', ' ')
+    else:
+        literals = values.to_numpy().astype(_STR)
+    if type_a in ['varchar', 'date', 'datetime']:
+        literals = np.strings.add(np.strings.add("'", np.strings.replace(literals, "'", "''")),
+                                  "'")
+    literals[isnull] = 'NULL'
+    return literals
+
+
+def insert_statements(df, tablename, col_types, batch_size=BATCH_SIZE):
+    """Multi row INSERT statements for a dataframe
+    Parameters
+    ----------
+    col_types: dict
+        column name to sql type, only these columns are written
+    batch_size: int
+        maximum number of rows per statement
+    Yields
+    ------
+    'INSERT INTO t (a,b) VALUES (..),(..);' strings
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be positive, got {}".format(batch_size))
+    names = [c for c in col_types]
+    if df.shape[0] == 0 or not names:
+        return
+    rows = np.strings.add('(', sql_literals(df[names[0]], col_types[names[0]]))
+    for c in names[1:]:
+        rows = np.strings.add(np.strings.add(rows, ','), sql_literals(df[c], col_types[c]))
+    rows = np.strings.add(rows, ')').tolist()
+    head = 'INSERT INTO {} ({}) VALUES\n'.format(tablename, ','.join(names))
+    for b in range(0, len(rows), batch_size):
+        yield head + ',\n'.join(rows[b:b + batch_size]) + ';\n'
+
+
+def write_inserts(df, tablename, col_types, path, batch_size=BATCH_SIZE, mode='w',
+                  compress=None):
+    """Write a dataframe to path as multi row INSERT statements"""
+    with open_text(path, mode, compress) as f:
+        for statement in insert_statements(df, tablename, col_types, batch_size):
+            f.write(statement)
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstd compression of text files needs zstandard, "
+                          "install it with `pip install zstandard`")
+    return zstandard
+
+
+def open_text(path, mode='w', compress=None):
+    """Text file for writing (mode 'w') or appending ('a'), compressed
+    as it is written when compress is gzip or zstd. Appending to a
+    compressed file adds a gzip member or zstd frame, which readers
+    decompress as one stream
+    """
+    if compress is None:
+        return open(path, mode, buffering=WRITE_BUFFER, newline='')
+    if compress == 'gzip':
+        # level 6 is about 3x faster than the default 9 for a few % in size
+        return gzip.open(path, mode + 't', compresslevel=6, newline='')
+    if compress == 'zstd':
+        return _zstd().open(path, mode + 't', newline='')
+    raise ValueError("Unknown compression {}, options are {}".format(
+        compress, list(COMPRESSIONS)))
+
+
+# ============== Typed table formats ====== #
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("Parquet and Arrow/Feather files need pyarrow, "
+                          "install it with `pip install pyarrow`")
+    return pyarrow
+
+
+def arrow_schema(create_sql):
+    """pyarrow schema of a table from its parsed create block"""
+    pa = _pyarrow()
+    fields = []
+    for col in create_sql['columns']:
+        datatype = col['type']['type']
+        args = [int(a) for a in col['type']['args']]
+        if datatype == 'int':
+            t = pa.int64()
+        elif datatype == 'decimal':
+            t = pa.decimal128(*args) if len(args) == 2 else pa.float64()
+        elif datatype == 'date':
+            t = pa.date32()
+        elif datatype == 'datetime':
+            t = pa.timestamp('s')
+        else:
+            t = pa.string()
+        fields.append(pa.field(col['name'], t, nullable=col.get('null') is not False))
+    return pa.schema(fields)
+
+
+def to_arrow(df, create_sql):
+    """pyarrow Table of a dataframe, typed after the create block.
+    Missing values (NaN/None/NA) become nulls
+    """
+    pa = _pyarrow()
+    schema = arrow_schema(create_sql)
+    arrays = []
+    for field in schema:
+        values = df[field.name]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = pd.Series(values.to_numpy(), index=values.index)
+        elif hasattr(values.array, '__arrow_array__'):
+            # arrow backed and masked columns already know their nulls
+            arrays.append(pa.array(values.array).cast(field.type))
+            continue
+        mask = values.isna().to_numpy(dtype=bool, copy=True)
+        if not pd.api.types.is_numeric_dtype(values) and \
+                not pd.api.types.is_datetime64_any_dtype(values):
+            values = values.where(~mask, None)
+        if pa.types.is_decimal(field.type) or pa.types.is_integer(field.type):
+            # ints and decimals are converted from numbers, not strings
+            values = pd.to_numeric(values)
+        elif pa.types.is_date(field.type) or pa.types.is_timestamp(field.type):
+            values = pd.to_datetime(values)
+        array = pa.array(values.to_numpy(), mask=mask, from_pandas=True)
+        arrays.append(array.cast(field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def pandas_dtypes(create_sql):
+    """Column dtypes to read a text file of the table with. Dates are
+    returned separately as they are parsed rather than cast
+    Returns
+    -------
+    (dict of column name to dtype, list of date columns)
+    """
+    dtypes, dates = {}, []
+    for col in create_sql['columns']:
+        datatype = col['type']['type']
+        if datatype == 'int':
+            dtypes[col['name']] = 'Int64'
+        elif datatype == 'decimal':
+            dtypes[col['name']] = 'float64'
+        elif datatype in ['date', 'datetime']:
+            dates.append(col['name'])
+        else:
+            dtypes[col['name']] = 'string'
+    return dtypes, dates
+
+
+class CsvWriter():
+    """Writes a table to csv, one chunk at a time.
+    Nulls are written as na_rep, an empty field by default. Give another
+    token (e.g. '\\N') to tell them apart from empty strings.
+    With append, rows are added to an existing file without a header.
+    compress: gzip or zstd, see open_text
+    """
+    extension = 'csv'
+
+    def __init__(self, path, create_sql=None, na_rep='', append=False, compress=None):
+        self.path = path
+        self.na_rep = na_rep
+        self.header = not append
+        self.file = open_text(path, 'a' if append else 'w', compress)
+
+    def write(self, df):
+        df.to_csv(self.file, index=False, header=self.header, na_rep=self.na_rep)
+        self.header = False
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter():
+    """Writes a table to parquet, one row group per chunk.
+    compress: parquet codec such as gzip or zstd, snappy by default
+    """
+    extension = 'parquet'
+
+    def __init__(self, path, create_sql, compress=None):
+        import pyarrow.parquet as pq
+        self.create_sql = create_sql
+        self.writer = pq.ParquetWriter(path, arrow_schema(create_sql),
+                                       compression=compress or 'snappy')
+
+    def write(self, df):
+        self.writer.write_table(to_arrow(df, self.create_sql))
+
+    def close(self):
+        self.writer.close()
+
+
+class FeatherWriter():
+    """Writes a table to an Arrow IPC (Feather v2) file, one record batch
+    per chunk.
+    compress: zstd (or lz4), the codecs Arrow IPC supports
+    """
+    extension = 'feather'
+
+    def __init__(self, path, create_sql, compress=None):
+        pa = _pyarrow()
+        if compress not in [None, 'zstd', 'lz4']:
+            raise ValueError("Arrow files can be compressed with zstd or lz4, "
+                             "not {}".format(compress))
+        self.create_sql = create_sql
+        self.sink = pa.OSFile(path, 'wb')
+        self.writer = pa.ipc.new_file(self.sink, arrow_schema(create_sql),
+                                      options=pa.ipc.IpcWriteOptions(compression=compress))
+
+    def write(self, df):
+        self.writer.write_table(to_arrow(df, self.create_sql))
+
+    def close(self):
+        self.writer.close()
+        self.sink.close()
+
+
+WRITERS = {'csv': CsvWriter, 'parquet': ParquetWriter,
+           'feather': FeatherWriter, 'arrow': FeatherWriter}
+FORMATS = {'csv': 'csv', 'parquet': 'parquet', 'pq': 'parquet',
+           'feather': 'feather', 'arrow': 'feather', 'ipc': 'feather'}
+
+
+def open_writer(fmt, path, create_sql, **options):
+    """Writer for a table in format fmt (see WRITERS). It has write(df)
+    for each chunk and close() at the end. options go to the writer,
+    such as na_rep for csv
+    """
+    if fmt not in WRITERS:
+        raise ValueError("Unknown format {}, options are {}".format(fmt, list(WRITERS)))
+    return WRITERS[fmt](path, create_sql, **options)
+
+
+def table_path(outpath, tablename, fmt='csv', compress=None, part=None):
+    """<outpath>/<table>[.<part>].<ext>, with .gz or .zst added to
+    compressed csv files (parquet and arrow files compress inside)
+    """
+    name = tablename if part is None else '{}.{}'.format(tablename, part)
+    extension = WRITERS[fmt].extension
+    if compress is not None and fmt == 'csv':
+        extension += '.' + COMPRESSIONS[compress]
+    return os.path.join(outpath, "{}.{}".format(name, extension))
+
+
+class TableWriter():
+    """Writes a table to <outpath>/<table>.<ext>, or with part_rows to
+    numbered part files <table>.part00000.<ext>, ... of at most part_rows
+    rows each. files lists the names written so far
+    """
+    def __init__(self, fmt, outpath, tablename, create_sql, part_rows=None, **options):
+        if part_rows is not None and part_rows < 1:
+            raise ValueError("part_rows must be positive, got {}".format(part_rows))
+        self.fmt = fmt
+        self.outpath = outpath
+        self.tablename = tablename
+        self.create_sql = create_sql
+        self.part_rows = part_rows
+        self.options = options
+        self.files = []
+        self.writer = None
+        self.rows = 0
+
+    def _next(self):
+        if self.writer is not None:
+            self.writer.close()
+        part = None if self.part_rows is None else 'part{:05d}'.format(len(self.files))
+        path = table_path(self.outpath, self.tablename, self.fmt,
+                          self.options.get('compress'), part)
+        self.writer = open_writer(self.fmt, path, self.create_sql, **self.options)
+        self.files.append(os.path.basename(path))
+        self.rows = 0
+
+    def write(self, df):
+        if self.part_rows is None:
+            if self.writer is None:
+                self._next()
+            self.writer.write(df)
+            return
+        offset = 0
+        while offset < df.shape[0]:
+            if self.writer is None or self.rows == self.part_rows:
+                self._next()
+            take = min(self.part_rows - self.rows, df.shape[0] - offset)
+            self.writer.write(df.iloc[offset:offset + take])
+            self.rows += take
+            offset += take
+
+    def close(self):
+        if self.writer is None:
+            # an empty table still gets a file
+            self._next()
+        self.writer.close()
+
+
+class ExportPipeline():
+    """Runs writes on background threads while the caller goes on
+    generating. All the tasks of a key (a table) go to the same thread,
+    in order. A thread has at most queue_chunks tasks waiting; submit
+    blocks when they are all taken, which caps the chunks held in memory.
+    With writers=0 tasks run right away in the calling thread.
+    Use as a context manager, leaving it waits for every task and raises
+    the first error of a writer thread
+    """
+    def __init__(self, writers=2, queue_chunks=QUEUE_CHUNKS):
+        self.queues = [queue.Queue(maxsize=queue_chunks) for _ in range(writers)]
+        self.lanes = {}
+        self.errors = []
+        self.threads = [threading.Thread(target=self._run, args=(q,), daemon=True)
+                        for q in self.queues]
+        for t in self.threads:
+            t.start()
+
+    def _run(self, tasks):
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            if self.errors:
+                # keep draining so the producer never blocks on a dead writer
+                continue
+            func, args = task
+            try:
+                func(*args)
+            except BaseException as e:
+                self.errors.append(e)
+
+    def submit(self, key, func, *args):
+        """Run func(*args) after the earlier tasks of key"""
+        if self.errors:
+            raise self.errors[0]
+        if not self.queues:
+            func(*args)
+            return
+        if key not in self.lanes:
+            self.lanes[key] = len(self.lanes) % len(self.queues)
+        self.queues[self.lanes[key]].put((func, args))
+
+    def close(self):
+        for q in self.queues:
+            q.put(None)
+        for t in self.threads:
+            t.join()
+        self.queues = []
+        if self.errors:
+            raise self.errors[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # the caller's error comes first, writer errors are dropped
+            try:
+                self.close()
+            except BaseException:
+                pass
+        return False
+
+
+def _from_arrow(table):
+    """Dataframe of a pyarrow Table. Decimals stay arrow backed instead of
+    becoming one python Decimal per value
+    """
+    pa = _pyarrow()
+
+    def types_mapper(t):
+        return pd.ArrowDtype(t) if pa.types.is_decimal(t) else None
+    return table.to_pandas(types_mapper=types_mapper)
+
+
+def read_table(path, fmt=None, create_sql=None, columns=None, na_rep=None):
+    """Read a table written in any of the supported formats. The format
+    is taken from the file extension unless given. With create_sql, csv
+    columns get the schema's types instead of guessed ones. With na_rep,
+    only that csv token is read as null and empty fields stay strings
+    """
+    fmt = _format_of(path, fmt)
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        return _from_arrow(pq.read_table(path, columns=columns))
+    elif fmt == 'feather':
+        import pyarrow.feather as feather
+        return _from_arrow(feather.read_table(path, columns=columns))
+    return pd.read_csv(path, **_csv_options(create_sql, columns, na_rep))
+
+
+def iter_table(path, fmt=None, create_sql=None, columns=None, na_rep=None,
+               chunk_rows=100000):
+    """Read a table chunk by chunk, as read_table does at once. Parquet
+    and csv chunks have at most chunk_rows rows, arrow files are read
+    one record batch at a time
+    """
+    fmt = _format_of(path, fmt)
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        pa = _pyarrow()
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows,
+                                                       columns=columns):
+            yield _from_arrow(pa.Table.from_batches([batch]))
+    elif fmt == 'feather':
+        pa = _pyarrow()
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                if columns is not None:
+                    batch = batch.select(columns)
+                yield _from_arrow(pa.Table.from_batches([batch]))
+    else:
+        with pd.read_csv(path, chunksize=chunk_rows,
+                         **_csv_options(create_sql, columns, na_rep)) as reader:
+            yield from reader
+
+
+def _format_of(path, fmt=None):
+    """Format of a table file, from its extension unless given"""
+    if fmt is None:
+        name = path
+        for suffix in COMPRESSIONS.values():
+            if name.endswith('.' + suffix):
+                name = name[:-len(suffix) - 1]
+        fmt = FORMATS.get(os.path.splitext(name)[1].lstrip('.').lower(), 'csv')
+    fmt = FORMATS.get(fmt, fmt)
+    if fmt not in WRITERS:
+        raise ValueError("Unknown format {}, options are {}".format(fmt, list(WRITERS)))
+    return fmt
+
+
+def _csv_options(create_sql=None, columns=None, na_rep=None):
+    """pandas.read_csv arguments typing columns after the schema"""
+    options = {'usecols': columns}
+    if na_rep is not None:
+        options.update({'na_values': [na_rep], 'keep_default_na': False})
+    if create_sql is not None:
+        dtypes, dates = pandas_dtypes(create_sql)
+        if columns is not None:
+            dtypes = {c: dtypes[c] for c in columns if c in dtypes}
+            dates = [c for c in dates if c in columns]
+        options.update({'dtype': dtypes, 'parse_dates': dates})
+    return options
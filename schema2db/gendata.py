@@ -2,104 +2,662 @@
 Generate data based on database schema written in sql format
 """
 import os
+import sys
+import json
+import zlib
+import time
 import argparse
+import warnings
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 import pandas as pd
 import numpy as np
 import schema2db.randomdata as rd
+import schema2db.keys as keys
+import schema2db.graph as graph
+import schema2db.export as export
+import schema2db.columns as cols
+import schema2db.distributions as dist
+import schema2db.cache as schema_cache
+import schema2db.instrument as instrument
 from schema2db.parse_schema import SchemaParser
 
+# random values are drawn in blocks of rows, each from its own stream, so
+# a row gets the same values whichever chunk or process generates it
+BLOCK_ROWS = 8192
+# the first rows of a table come in smaller blocks, doubling from
+# FIRST_BLOCK_ROWS up to BLOCK_ROWS, so small tables draw few rows
+FIRST_BLOCK_ROWS = 128
+_SMALL_BLOCKS = (BLOCK_ROWS // FIRST_BLOCK_ROWS).bit_length() - 1
+# rows of a table not given its own count
+DEFAULT_ROW_NUM = 100
+# rounds of drawing again the values outside the slice of a mutually
+# exclusive table before giving up
+MAX_REDRAWS = 10000
+# memory the tables (or the chunk of a table) in flight may take, in bytes
+MEMORY_BUDGET = 1 << 30
+# written next to exported tables, so more rows can be appended later
+STATE_FILE = 'schema2db_state.json'
+
 
 class DBGenerator():
-    def __init__(self, schema, exclusive_list=None, exclude_on=None):
+    def __init__(self, schema, exclusive_list=None, exclude_on=None,
+                 exclusive_proportions=None, key_strategy='permutation', seed=None, compact=True,
+                 null_rate=rd.NULL_RATE, distributions=None, fanout=None, scale=1,
+                 cache=True, profiler=None):
         """
         Parameters
         ----------
         schema : dict or str
         exclusive_list
         exclude_on
+        exclusive_proportions : list or dict
+            share of the key space each table of exclusive_list draws
+            from, see parse_exclusive_tables
+        key_strategy : str or dict
+            how primary keys are generated, one of keys.STRATEGIES. A dict
+            maps 'table' or 'table.column' to a strategy, other columns use
+            'permutation'
+        seed : int
+            seed of every random stream. The same seed gives the same
+            data whether tables are generated at once, in chunks or in
+            worker processes. Without a seed, one is drawn from the OS
+        compact : bool
+            store generated columns in the smallest pandas dtype of their
+            sql type (see schema2db.columns) instead of plain numpy and
+            object arrays
+        null_rate : float or dict
+            share of nulls in nullable columns. A dict maps 'table' or
+            'table.column' to a rate, other columns use rd.NULL_RATE
+        distributions : dict
+            'table.column' to the distribution its values are drawn from,
+            see schema2db.distributions. Other columns are uniform
+        fanout : dict
+            'table.column' of a foreign key to (fewest, most) child rows
+            per parent row. The table then gets as many rows as its
+            parents' children add up to, whatever row_num says
+        scale : float
+            multiplies the row count of every table, for scale factor
+            sweeps
+        cache : bool or cache.SchemaCache
+            reuse the parsed schema, table order and column plans of a
+            schema file from an on-disk cache (see schema2db.cache).
+            False parses the file every time
+        profiler : instrument.Profiler
+            records timings of every table, column and export, and
+            reports progress (see schema2db.instrument)
         """
+        if exclusive_list and not exclude_on:
+            raise ValueError("You must specify the columns to be mutually exclusive")
+        # table order and static column plans, see get_generation_order and
+        # column_specs
+        self.order = None
+        self.column_plans = {}
         if isinstance(schema, dict):
             self.schema = schema
+            if exclusive_list:
+                self.parse_exclusive_tables(exclusive_list, exclude_on, exclusive_proportions)
         elif isinstance(schema, str):
-            parser = SchemaParser()
-            self.schema = parser.extract_sql_doc(schema)
+            self.load_schema(schema, exclusive_list, exclude_on, exclusive_proportions, cache)
         else:
             raise ValueError("Unsupported input type {}".format(type(schema)))
-
-        if exclusive_list:
-            if exclude_on:
-                self.parse_exclusive_tables(exclusive_list, exclude_on)
-            else:
-                raise ValueError("You must specify the columns to be mutually exclusive")
-        self.db = {}
+        self.key_strategy = key_strategy
+        self.seed = seed if seed is not None else np.random.SeedSequence().entropy
+        self.compact = compact
+        self.null_rate = null_rate
+        self.distributions = distributions or {}
+        self.fanout = fanout or {}
+        if scale < 0:
+            raise ValueError("scale must not be negative, got {}".format(scale))
+        self.scale = scale
+        self.profiler = profiler or instrument.NULL_PROFILER
+        self.reset_db()
 
     def get_db(self):
         """Return generated database"""
         return self.db
 
+    def load_schema(self, path, exclusive_list=None, exclude_on=None,
+                    exclusive_proportions=None, cache=True):
+        """Parse a schema file and plan its tables, or take both from the
+        cache when the file has not changed
+        """
+        if cache is True:
+            cache = schema_cache.SchemaCache()
+        key = None
+        if cache:
+            key = schema_cache.cache_key(path, exclusive_list, exclude_on,
+                                         exclusive_proportions)
+            entry = cache.load(key)
+            if entry is not None:
+                self.schema, self.order, self.column_plans = entry
+                return
+        self.schema = SchemaParser().extract_sql_doc(path)
+        if exclusive_list:
+            self.parse_exclusive_tables(exclusive_list, exclude_on, exclusive_proportions)
+        if cache:
+            self.order = self.get_generation_order()
+            for t in self.schema['create']:
+                self.column_plans[t] = self.column_specs(
+                    self.schema['create'][t], self.schema.get('alter', {}).get(t, {}))
+            cache.store(key, (self.schema, self.order, self.column_plans))
+
     def reset_db(self):
         self.db = {}
+        self.pools = {}
+        self.key_generators = {}
+        self.virtual_plans = {}
+        # rows generated so far per table, the next row number to make
+        self.high_water = {}
 
-    def export_db(self, outpath):
-        for tablename in self.db:
-            self.db[tablename].to_csv(os.path.join(outpath, "{}.csv".format(tablename)),
-                                      index=False)
+    def get_rng(self, *path):
+        """Random generator for a path such as (table, column, block).
+        Every path gets an independent stream spawned from the seed, and
+        the same path always gives the same stream, in any process
+        """
+        spawn_key = tuple(p if isinstance(p, int) else zlib.crc32(str(p).encode())
+                          for p in path)
+        sequence = np.random.SeedSequence(self.seed, spawn_key=spawn_key)
+        return np.random.Generator(np.random.Philox(sequence))
 
-    def gen_db_data(self, preload={}, row_num=100):
-        """Top level method that generates a database that complies with
-        the schema
-        preload: preload some tables from csv files or dataframe
+    def get_pool(self, tablename, column):
+        """Distinct non-null values of a generated column, as a numpy array.
+        Computed once per (table, column) and shared by every child table
+        that references or excludes on it
+        """
+        key = (tablename, column)
+        if key not in self.pools:
+            self.pools[key] = cols.distinct_values(self.db[tablename][column])
+        return self.pools[key]
+
+    def retained_columns(self):
+        """Columns other tables draw values from, the referenced foreign
+        key columns.
+        Returns a dict of table name to set of column names
+        """
+        retained = {}
+        for table, constraints in self.schema.get('alter', {}).items():
+            for fk in constraints.get('foreign_keys', []):
+                retained.setdefault(fk['referenced'], set()).add(fk['source_column'])
+        return retained
+
+    def export_db(self, outpath, fmt='csv', writers=0, part_rows=None, **options):
+        """Write every table to <outpath>/<table>.<ext>
+        fmt: one of export.WRITERS, csv, parquet or feather/arrow
+        writers: number of threads writing tables side by side, 0 writes
+        them one by one in this thread
+        part_rows: split every table into part files of this many rows,
+        see export.TableWriter
+        options: passed to the writer, e.g. na_rep='\\N' for csv or
+        compress='zstd'
+        """
+        files = {}
+        with export.ExportPipeline(writers) as pipeline:
+            for tablename in self.db:
+                writer = export.TableWriter(fmt, outpath, tablename,
+                                            self.schema['create'].get(tablename),
+                                            part_rows, **options)
+                files[tablename] = writer.files
+                pipeline.submit(tablename, self._write_chunk, writer, self.db[tablename])
+                pipeline.submit(tablename, writer.close)
+        self.write_state(outpath, fmt, files, **options)
+
+    def _write_chunk(self, writer, df):
+        with self.profiler.span('export', table=writer.tablename, format=writer.fmt,
+                                rows=df.shape[0]):
+            writer.write(df)
+
+    def write_state(self, outpath, fmt, files, **options):
+        """Save what append_db_data needs to extend exported tables to
+        <outpath>/STATE_FILE: seed, key strategy, format, high-water
+        marks and the files of every table
+        files: dict of table name to the names of its files
+        """
+        state = {'seed': self.seed, 'key_strategy': self.key_strategy, 'format': fmt,
+                 'options': options,
+                 'rows': {t: self.high_water.get(t, 0) for t in files},
+                 'files': {t: list(files[t]) for t in files}}
+        with open(os.path.join(outpath, STATE_FILE), 'w') as f:
+            json.dump(state, f, indent=1)
+
+    @staticmethod
+    def read_state(outpath):
+        """State saved by write_state"""
+        path = os.path.join(outpath, STATE_FILE)
+        if not os.path.exists(path):
+            raise ValueError("No {} in {}, export the database with this version "
+                             "before appending to it".format(STATE_FILE, outpath))
+        with open(path) as f:
+            return json.load(f)
+
+    def load_preload(self, preload):
+        """Put preloaded tables (file paths or dataframes) into the database.
+        Files can be csv, parquet or feather, told apart by extension
         """
-        self.reset_db()
         for p in preload:
             entry = preload[p]
             if isinstance(entry, str):
-                self.db[p] = pd.read_csv(entry)
+                self.db[p] = export.read_table(entry, create_sql=self.schema['create'].get(p))
             elif isinstance(entry, pd.DataFrame):
                 self.db[p] = entry
             else:
                 raise ValueError("Unknown preloaded data type")
-        processed = [p for p in preload]
-        create = [p for p in self.schema.get('create') if p not in preload]
-        waiting_room = create
-
-        while waiting_room:
-            start_count = len(waiting_room)
-            end_count = start_count
-            for i in range(start_count):
-                cand = waiting_room.pop()
-                valid = True
-                foreign_tables = [ref['referenced']
-                                  for ref in self.schema.get('alter')
-                                  .get(cand, {})
-                                  .get('foreign_keys', [])]
-                for f in foreign_tables:
-                    if f not in processed:
-                        waiting_room.insert(0, cand)
-                        valid = False
-                        break
-                if valid:
-                    table_args = self.schema['create'][cand]
-                    constraints = self.schema.get('alter', {}).get(cand, {})
-                    exclusive = self.schema.get('exclusive', {}).get(cand, {})
-                    self.db[cand] = self.gen_table(table_args,
-                                                   constraints,
-                                                   exclusive,
-                                                   row_num=row_num)
-                    processed.append(cand)
-                    end_count -= 1
-
-            if start_count == end_count:
-                raise ValueError('''There are some circular dependencies in foreign keys.
-                Please double check your constraints''')
+            self.high_water[p] = self.db[p].shape[0]
+
+    def get_generation_order(self, preload={}):
+        """Table names in an order where every table comes after the
+        tables its foreign keys reference
+        """
+        if not preload and self.order is not None:
+            return list(self.order)
+        return graph.topological_order(graph.build_fk_graph(self.schema, preload))
+
+    def get_row_num(self, tablename, row_num=DEFAULT_ROW_NUM):
+        """Rows to generate for a table, times the scale factor
+        row_num: int, or dict of table name to rows. Tables missing from
+        the dict get DEFAULT_ROW_NUM
+        """
+        if isinstance(row_num, dict):
+            row_num = row_num.get(tablename, DEFAULT_ROW_NUM)
+        return int(round(row_num * self.scale))
+
+    def plan_rows(self, preload={}, row_num=DEFAULT_ROW_NUM):
+        """Expected row count of every table to generate, before any is
+        made. Tables with a fan-out get their parent's count times the
+        mean number of children
+        Returns
+        -------
+        dict of table name to rows, in generation order
+        """
+        rows = {}
+        for cand in self.get_generation_order(preload):
+            rows[cand] = self.get_row_num(cand, row_num)
+            for fk in self.schema.get('alter', {}).get(cand, {}).get('foreign_keys', []):
+                spec = '{}.{}'.format(cand, fk['column'])
+                if spec in self.fanout:
+                    parent = fk['referenced']
+                    if parent in rows:
+                        parent_rows = rows[parent]
+                    elif isinstance(preload.get(parent), pd.DataFrame):
+                        parent_rows = preload[parent].shape[0]
+                    else:
+                        # a preloaded file, not read yet
+                        parent_rows = self.get_row_num(parent, row_num)
+                    low, high = self.fanout[spec]
+                    rows[cand] = int(parent_rows * (low + high) / 2)
+                    break
+        return rows
+
+    def plan_chunk_rows(self, rows, memory=MEMORY_BUDGET):
+        """Chunk size keeping a chunk of any table within memory bytes,
+        or None if the whole database fits and needs no chunking
+        rows: dict of table name to rows, see plan_rows
+        """
+        sizes = {t: cols.row_bytes(self.schema['create'][t]) for t in rows}
+        if sum(rows[t] * sizes[t] for t in rows) <= memory:
+            return None
+        return max(1, memory // max(sizes.values()))
+
+    def gen_db_data(self, preload={}, row_num=DEFAULT_ROW_NUM, workers=1):
+        """Top level method that generates a database that complies with
+        the schema
+        preload: preload some tables from csv files or dataframe
+        row_num: rows per table, an int or a dict of table name to rows
+        (see get_row_num)
+        workers: number of processes. With more than one, tables whose
+        parents are done are generated concurrently
+        """
+        with self.profiler.span('db', workers=workers) as span:
+            self.reset_db()
+            self.load_preload(preload)
+            if workers > 1:
+                self._gen_db_parallel(preload, row_num, workers)
+            else:
+                self._gen_db_serial(preload, row_num)
+            span.tables = len(self.db)
+            span.rows = sum(df.shape[0] for df in self.db.values())
+
+    def _gen_db_serial(self, preload, row_num):
+        order = self.get_generation_order(preload)
+        for step, cand in enumerate(order, 1):
+            table_args = self.schema['create'][cand]
+            constraints = self.schema.get('alter', {}).get(cand, {})
+            exclusive = self.schema.get('exclusive', {}).get(cand, {})
+            with self.profiler.span('table', table=cand, step=step,
+                                    steps=len(order)) as span:
+                self.db[cand] = self.gen_table(table_args,
+                                               constraints,
+                                               exclusive,
+                                               row_num=self.get_row_num(cand, row_num))
+                span.rows = self.db[cand].shape[0]
+            self.high_water[cand] = self.db[cand].shape[0]
+
+    def _gen_db_parallel(self, preload, row_num, workers):
+        """Schedule tables on a process pool following the foreign key DAG.
+        A table is submitted as soon as all its parents are done, and gets
+        only the parent key pools it draws from. Tables are profiled from
+        submission to completion, their columns are not
+        """
+        deps = graph.build_fk_graph(self.schema, preload)
+        graph.check_acyclic(deps)
+        children = graph.children_of(deps)
+        waiting = {t: len(deps[t]) for t in deps}
+        retained = self.retained_columns()
+        options = {'key_strategy': self.key_strategy, 'seed': self.seed,
+                   'compact': self.compact, 'null_rate': self.null_rate,
+                   'distributions': self.distributions, 'fanout': self.fanout}
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            running = {}
+            submitted = {}
+
+            def submit(table):
+                needed = {k: self.get_pool(*k) for k in self.needed_pools(table)}
+                future = pool.submit(_gen_table_task, self.schema, options,
+                                     table, self.get_row_num(table, row_num), needed)
+                running[future] = table
+                submitted[table] = time.perf_counter()
+
+            for t in sorted(t for t in deps if waiting[t] == 0):
+                submit(t)
+            while running:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    table = running.pop(future)
+                    self.db[table] = future.result()
+                    self.high_water[table] = self.db[table].shape[0]
+                    if self.profiler.enabled:
+                        self.profiler.record(time.perf_counter() - submitted[table],
+                                             kind='table', table=table, step=len(self.db),
+                                             steps=len(deps), rows=self.db[table].shape[0])
+                    for c in retained.get(table, []):
+                        self.get_pool(table, c)
+                    for c in sorted(children[table]):
+                        waiting[c] -= 1
+                        if waiting[c] == 0:
+                            submit(c)
+
+    def needed_pools(self, tablename):
+        """(table, column) pools that generating tablename reads"""
+        needed = []
+        for fk in self.schema.get('alter', {}).get(tablename, {}).get('foreign_keys', []):
+            needed.append((fk['referenced'], fk['source_column']))
+        return needed
+
+    def iter_db_chunks(self, preload={}, row_num=DEFAULT_ROW_NUM, chunk_rows=100000):
+        """Generate the database table by table in chunks of at most
+        chunk_rows rows, without keeping the tables in memory. With
+        chunk_rows None, the chunk size is planned to fit MEMORY_BUDGET
+        (see plan_chunk_rows).
+        Only the columns other tables draw from (see retained_columns) are
+        kept, as compact arrays of distinct values.
+        Yields (table name, dataframe chunk)
+        """
+        if chunk_rows is None:
+            rows = self.plan_rows(preload, row_num)
+            chunk_rows = self.plan_chunk_rows(rows) or max(list(rows.values()) + [1])
+        if chunk_rows < 1:
+            raise ValueError("chunk_rows must be positive, got {}".format(chunk_rows))
+        self.reset_db()
+        self.load_preload(preload)
+        retained = self.retained_columns()
+        for p in preload:
+            yield p, self.db[p]
+        for cand in self.get_generation_order(preload):
+            columns = self.plan_table(self.schema['create'][cand],
+                                      self.schema.get('alter', {}).get(cand, {}),
+                                      self.schema.get('exclusive', {}).get(cand, {}))
+            kept = {c: [] for c in retained.get(cand, [])}
+            rows = self.table_rows(cand, columns, self.get_row_num(cand, row_num))
+            self.high_water[cand] = rows
+            for start in range(0, rows, chunk_rows):
+                with self.profiler.span('table', table=cand, start=start,
+                                        total=rows) as span:
+                    chunk = self.gen_rows(cand, columns, min(chunk_rows, rows - start),
+                                          start=start)
+                    span.rows = chunk.shape[0]
+                for c in kept:
+                    kept[c].append(chunk[c])
+                yield cand, chunk
+            for c in kept:
+                values = pd.concat(kept[c], ignore_index=True) if kept[c] else []
+                self.pools[(cand, c)] = cols.distinct_values(values)
+
+    def stream_db_data(self, outpath, preload={}, row_num=DEFAULT_ROW_NUM, chunk_rows=100000,
+                       fmt='csv', writers=0, part_rows=None, **options):
+        """Generate the database in chunks (see iter_db_chunks) and append
+        each chunk to <outpath>/<table>.<ext> as soon as it is made, so
+        memory is bounded by the chunk size instead of the table size.
+        With writers, chunks are handed to that many writer threads and
+        generation goes on while they are written; up to
+        export.QUEUE_CHUNKS chunks per writer wait in memory.
+        writers, part_rows and options are as in export_db
+        """
+        tables = {}
+        with export.ExportPipeline(writers) as pipeline:
+            for tablename, chunk in self.iter_db_chunks(preload, row_num, chunk_rows):
+                if tablename not in tables:
+                    tables[tablename] = export.TableWriter(
+                        fmt, outpath, tablename, self.schema['create'].get(tablename),
+                        part_rows, **options)
+                pipeline.submit(tablename, self._write_chunk, tables[tablename], chunk)
+            for tablename, writer in tables.items():
+                pipeline.submit(tablename, writer.close)
+        self.write_state(outpath, fmt, {t: w.files for t, w in tables.items()}, **options)
+
+    def append_db_data(self, outpath, row_num=DEFAULT_ROW_NUM, tables=None,
+                       chunk_rows=100000):
+        """Add rows to a database exported by export_db or stream_db_data,
+        without reading or rewriting whole tables.
+        Only primary key and referenced columns are read back from the
+        existing files. New rows continue the key sequence from the
+        high-water mark of the table, with the seed and key strategy of
+        the first run, so keys stay unique; any row whose key exists
+        anyway is dropped. Foreign keys draw from old and new parent rows.
+        csv files are appended to, parquet and feather tables get one more
+        file per call, listed in the state file
+        Parameters
+        ----------
+        row_num: int or dict
+            rows to add per table, see get_row_num
+        tables: list
+            tables to extend, all generated tables (or the keys of a
+            row_num dict) by default
+        """
+        state = self.read_state(outpath)
+        fmt = state['format']
+        options = state.get('options', {})
+        self.seed = state['seed']
+        self.key_strategy = state['key_strategy']
+        self.reset_db()
+        self.high_water = dict(state['rows'])
+        if tables is None:
+            tables = list(row_num) if isinstance(row_num, dict) else list(state['rows'])
+        retained = self.retained_columns()
+        for cand in self.get_generation_order():
+            create_sql = self.schema['create'][cand]
+            key_names = list(create_sql['primary_keys'])
+            needed = sorted(set(key_names) | retained.get(cand, set()))
+            existing = None
+            if needed and cand in state['files']:
+                existing = pd.concat([export.read_table(os.path.join(outpath, f),
+                                                        create_sql=create_sql,
+                                                        columns=needed,
+                                                        na_rep=options.get('na_rep'))
+                                      for f in state['files'][cand]], ignore_index=True)
+            kept = {c: [existing[c]] if existing is not None else []
+                    for c in retained.get(cand, [])}
+            if cand in tables and cand in state['rows']:
+                files = self._append_table(outpath, cand, row_num, existing, key_names,
+                                           kept, chunk_rows, fmt, options,
+                                           state['files'][cand])
+                state['files'][cand] += files
+            for c in kept:
+                values = pd.concat(kept[c], ignore_index=True) if kept[c] else []
+                self.pools[(cand, c)] = cols.distinct_values(values)
+        state['rows'] = self.high_water
+        with open(os.path.join(outpath, STATE_FILE), 'w') as f:
+            json.dump(state, f, indent=1)
+
+    def _append_table(self, outpath, tablename, row_num, existing, key_names, kept,
+                      chunk_rows, fmt, options, old_files):
+        """Generate and write the new rows of one table for append_db_data.
+        Returns the new files of the table
+        """
+        if any(spec.split('.')[0] == tablename for spec in self.fanout):
+            raise ValueError("Cannot append to {}, its rows follow a fan-out".format(tablename))
+        columns = self.plan_table(self.schema['create'][tablename],
+                                  self.schema.get('alter', {}).get(tablename, {}),
+                                  self.schema.get('exclusive', {}).get(tablename, {}))
+        start = self.high_water[tablename]
+        key_start = start
+        old_keys = None
+        if existing is not None and key_names:
+            old_keys = pd.MultiIndex.from_frame(existing[key_names].astype(object))
+            key_columns = [kwargs for name, kwargs in columns if kwargs['primary_key']]
+            if len(key_columns) == 1 and key_columns[0].get('choices') is not None:
+                # a key drawn from a parent: take the parent values not used yet
+                used = pd.unique(existing[key_names[0]].dropna().to_numpy())
+                key_columns[0]['excluded'] = np.concatenate(
+                    [np.asarray(key_columns[0].get('excluded', []), dtype=object),
+                     used.astype(object)])
+                key_start = 0
+        files = []
+        path = export.table_path(outpath, tablename, fmt, options.get('compress'))
+        if fmt == 'csv' and old_files == [os.path.basename(path)]:
+            writer = export.open_writer(fmt, path, self.schema['create'][tablename],
+                                        append=True, **options)
+        else:
+            # the table is in parts, or in a format that cannot be appended to
+            path = export.table_path(outpath, tablename, fmt, options.get('compress'), start)
+            files.append(os.path.basename(path))
+            writer = export.open_writer(fmt, path, self.schema['create'][tablename], **options)
+        rows = self.get_row_num(tablename, row_num)
+        try:
+            for offset in range(0, rows, chunk_rows):
+                with self.profiler.span('table', table=tablename, start=start + offset,
+                                        total=start + rows) as span:
+                    chunk = self.gen_rows(tablename, columns, min(chunk_rows, rows - offset),
+                                          start=start + offset, key_start=key_start + offset)
+                    span.rows = chunk.shape[0]
+                if chunk.shape[0] == 0:
+                    break
+                if old_keys is not None:
+                    new_keys = pd.MultiIndex.from_frame(chunk[key_names].astype(object))
+                    chunk = chunk[~new_keys.isin(old_keys)].reset_index(drop=True)
+                for c in kept:
+                    kept[c].append(chunk[c])
+                with self.profiler.span('export', table=tablename, format=fmt,
+                                        rows=chunk.shape[0]):
+                    writer.write(chunk)
+        finally:
+            writer.close()
+        self.high_water[tablename] = start + rows
+        return files
+
+    def load_db(self, loader, preload={}, row_num=DEFAULT_ROW_NUM, chunk_rows=100000,
+                create=True):
+        """Create the tables through a loader (see schema2db.loaders) and
+        stream generated rows straight into the database, chunk by chunk,
+        without writing files in between
+        """
+        if create:
+            tables = [t for t in preload if t in self.schema['create']]
+            loader.create_tables(self.schema, tables + self.get_generation_order(preload))
+        for tablename, chunk in self.iter_db_chunks(preload, row_num, chunk_rows):
+            if tablename in self.schema['create']:
+                with self.profiler.span('export', table=tablename,
+                                        format=type(loader).__name__, rows=chunk.shape[0]):
+                    loader.load(tablename, chunk, self.schema['create'][tablename])
+
+    def get_key_strategy(self, tablename, column=None):
+        """Primary key strategy of a table or one of its columns"""
+        if isinstance(self.key_strategy, str):
+            return self.key_strategy
+        if column and '{}.{}'.format(tablename, column) in self.key_strategy:
+            return self.key_strategy['{}.{}'.format(tablename, column)]
+        return self.key_strategy.get(tablename, 'permutation')
+
+    def get_null_rate(self, tablename, column):
+        """Share of nulls in a nullable column"""
+        if not isinstance(self.null_rate, dict):
+            return self.null_rate
+        if '{}.{}'.format(tablename, column) in self.null_rate:
+            return self.null_rate['{}.{}'.format(tablename, column)]
+        return self.null_rate.get(tablename, rd.NULL_RATE)
+
+    def get_key_generator(self, tablename, columns):
+        """keys.UniqueKeys (keys.SliceKeys for the key of a mutually
+        exclusive table) for the primary key columns of a table. It is
+        kept until the database is reset, so every chunk of the table draws
+        from the same key sequence
+        Parameters
+        ----------
+        columns: list
+            (name, kwargs) of the key columns, kwargs as passed to gen_column_data
+        """
+        names = tuple(name for name, kwargs in columns)
+        if (tablename, names) not in self.key_generators:
+            domains = []
+            for name, kwargs in columns:
+                if isinstance(kwargs.get('choices'), keys.RowKeys):
+                    # keys of a virtual parent, unique and non-null already
+                    domains.append(keys.ChoiceDomain(kwargs['choices']))
+                elif kwargs.get('choices') is not None:
+                    choices = np.asarray(kwargs['choices'])
+                    excluded = kwargs.get('excluded', [])
+                    if len(excluded):
+                        choices = choices[~np.isin(choices, excluded)]
+                    domains.append(keys.ChoiceDomain(pd.unique(choices)))
+                else:
+                    domains.append(keys.KeyDomain(kwargs['datatype'], kwargs['args'],
+                                                  kwargs['signed']))
+            strategy = self.get_key_strategy(tablename, names[0] if len(names) == 1 else None)
+            rng = self.get_rng(tablename, 'keys', *names)
+            keygen = keys.UniqueKeys(domains, strategy=strategy, rng=rng)
+            for i, (name, kwargs) in enumerate(columns):
+                if kwargs.get('partition') is not None:
+                    # the key column of a mutually exclusive table
+                    keygen = keys.SliceKeys(keygen, i, *kwargs['partition'])
+                    break
+            self.key_generators[(tablename, names)] = keygen
+        return self.key_generators[(tablename, names)]
 
     def gen_table(self, create_sql, constrain_sql={},
                   exclusive_sql={}, row_num=50):
         """Generates a single table"""
+        columns = self.plan_table(create_sql, constrain_sql, exclusive_sql)
+        tablename = create_sql.get('tablename')
+        return self.gen_rows(tablename, columns, self.table_rows(tablename, columns, row_num))
+
+    def table_rows(self, tablename, columns, row_num):
+        """Number of rows of a planned table: row_num, unless a foreign
+        key column has a fan-out, or the table is mutually exclusive and
+        its primary key is drawn from the part of its parents' keys in its
+        slice, which may hold fewer keys than row_num (with a warning)
+        """
+        for name, kwargs in columns:
+            if 'fanout' in kwargs:
+                return kwargs['fanout'].size
+        key_columns = [c for c in columns if c[1]['primary_key']]
+        if tablename in self.schema.get('exclusive', {}) and key_columns and \
+                all(kwargs.get('choices') is not None for _, kwargs in key_columns):
+            size = self.get_key_generator(tablename, key_columns).size
+            if row_num > size:
+                warnings.warn("Mutually exclusive table {} has only {} keys in its slice "
+                              "of the parent keys, generating {} rows instead of {}"
+                              .format(tablename, size, size, row_num))
+                return size
+        return row_num
+
+    @staticmethod
+    def column_specs(create_sql, constrain_sql={}):
+        """The part of a table's plan that only depends on the schema
+        Returns
+        -------
+        list of (column name, kwargs for gen_column_data, (referenced table,
+        column) of its foreign key or None)
+        """
         enums = {}
         foreign_keys = {}
-        rows = row_num
-        tabledata = None
         for c in constrain_sql.get('check', []):
             if c['type'] == 'enum':
                 if c['column'] in enums:
@@ -112,8 +670,7 @@ class DBGenerator():
             else:
                 foreign_keys[c['column']] = [c]
 
-        exclusive_tables = exclusive_sql.get('tables', [])
-        exclusive_columns = exclusive_sql.get('columns', [])
+        specs = []
         for col_sql in create_sql['columns']:
             kwargs = {}
             name = col_sql['name']
@@ -122,93 +679,305 @@ class DBGenerator():
             kwargs['signed'] = col_sql['type'].get('signed')
             kwargs['isnull'] = col_sql.get('null')
             kwargs['primary_key'] = name in create_sql['primary_keys']
-
+            fk = None
             if enums.get(name):
-                choices = enums.get(name)[0]['values']
-                kwargs['choices'] = choices
+                kwargs['choices'] = enums.get(name)[0]['values']
             elif foreign_keys.get(name):
                 d = foreign_keys.get(name)[0]
-                choices = self.db[d['referenced']][d['source_column']].tolist()
-                kwargs['choices'] = choices
-            # if this column is subject to exclusion constraints, do something
+                fk = (d['referenced'], d['source_column'])
+            specs.append((name, kwargs, fk))
+        return specs
+
+    def plan_table(self, create_sql, constrain_sql={}, exclusive_sql={}, pool=None):
+        """Work out how every column of a table is generated
+        Parameters
+        ----------
+        pool: callable
+            values a foreign key column draws from, given the referenced
+            table and column. get_pool by default
+        Returns
+        -------
+        list of (column name, kwargs for gen_column_data)
+        """
+        tablename = create_sql.get('tablename')
+        if tablename not in self.column_plans or \
+                self.schema['create'].get(tablename) is not create_sql:
+            specs = self.column_specs(create_sql, constrain_sql)
+            if self.schema['create'].get(tablename) is create_sql:
+                self.column_plans[tablename] = specs
+        else:
+            specs = self.column_plans[tablename]
+        exclusive_columns = exclusive_sql.get('columns', [])
+        pool = pool or self.get_pool
+        columns = []
+        for name, static, fk in specs:
+            kwargs = dict(static)
+            if kwargs['isnull']:
+                kwargs['null_rate'] = self.get_null_rate(tablename, name)
+            if fk is not None:
+                kwargs['choices'] = pool(*fk)
+            # mutually exclusive tables each own a slice of the key space,
+            # choices are cut to the slice, other values are drawn inside it
             if name in exclusive_columns:
-                excluded_values = []
-                unprocessed = 1
-
-                for table in exclusive_tables:
-                    df = self.db.get(table)
-                    if df is not None:
-                        values = df[name].tolist()
-                        excluded_values.extend(values)
-                    else:
-                        unprocessed += 1
+                lower, upper = exclusive_sql['slice']
                 if 'choices' in kwargs:
-                    kwargs['choices'] = [c for c in kwargs['choices'] if c not in excluded_values]
-                    if unprocessed > 0:
-                        # if there are unprocessed tables left, they will share the same choice pool
-                        sample_size = int(len(kwargs['choices']) / unprocessed)
-                        kwargs['choices'] = np.random.choice(kwargs['choices'],
-                                                             sample_size,
-                                                             replace=False)
+                    choices = np.asarray(kwargs['choices'])
+                    kwargs['choices'] = choices[keys.partition_mask(choices, lower, upper)]
                 else:
-                    kwargs['excluded'] = excluded_values
+                    kwargs['partition'] = (lower, upper)
+            spec = '{}.{}'.format(tablename, name)
+            if spec in self.distributions:
+                kwargs['distribution'] = self.distributions[spec]
+            if spec in self.fanout:
+                if fk is None or kwargs['primary_key']:
+                    raise ValueError("Fan-out needs a foreign key column that is not "
+                                     "a primary key, {} is not".format(spec))
+                low, high = self.fanout[spec]
+                rng = self.get_rng(create_sql.get('tablename'), name, 'fanout')
+                kwargs['fanout'] = dist.FanOut(kwargs['choices'], low, high, rng=rng)
+            columns.append((name, kwargs))
+        return columns
 
-            column_data = self.gen_column_data(num_rows=rows, **kwargs)
-            if tabledata is None:
-                tabledata = pd.DataFrame({name: column_data})
-            else:
-                # trim table if the column to be inserted is shorter than
-                # table height
-                if len(column_data) < tabledata.shape[0]:
-                    tabledata = tabledata.head(len(column_data))
-                if len(column_data) > tabledata.shape[0]:
-                    tabledata[name] = column_data[:tabledata.shape[0]]
+    def plan_virtual(self, tablename, row_num=DEFAULT_ROW_NUM):
+        """plan_table for a table that is never materialized. Foreign keys
+        draw the row numbers of the parent and compute its keys from them
+        (keys.RowKeys) instead of reading a pool of generated values
+        Returns
+        -------
+        (columns as plan_table returns them, rows of the table)
+        """
+        key = (tablename, repr(row_num))
+        if key in self.virtual_plans:
+            return self.virtual_plans[key]
+        if tablename in self.schema.get('exclusive', {}):
+            raise NotImplementedError(
+                "Mutually exclusive table {} scans for the keys in its slice, its "
+                "rows cannot be addressed by number".format(tablename))
+        columns = self.plan_table(self.schema['create'][tablename],
+                                  self.schema.get('alter', {}).get(tablename, {}),
+                                  pool=lambda t, c: self.virtual_keys(t, c, row_num))
+        rows = self.table_rows(tablename, columns, self.get_row_num(tablename, row_num))
+        key_columns = [c for c in columns if c[1]['primary_key']]
+        if key_columns:
+            self.get_key_generator(tablename, key_columns).check(rows)
+        self.virtual_plans[key] = (columns, rows)
+        return columns, rows
+
+    def virtual_keys(self, tablename, column, row_num=DEFAULT_ROW_NUM):
+        """Keys of a table by row number, standing in for get_pool. Row j
+        of the table holds the j-th distinct key, so drawing pool position
+        j picks the same key either way
+        """
+        if self.schema['create'][tablename]['primary_keys'] != [column]:
+            raise NotImplementedError(
+                "{}.{} is not the only primary key column of {}, only such keys "
+                "can be computed from a row number".format(tablename, column, tablename))
+        columns, rows = self.plan_virtual(tablename, row_num)
+        key_columns = [c for c in columns if c[1]['primary_key']]
+        return keys.RowKeys(self.get_key_generator(tablename, key_columns), rows)
+
+    def virtual_table(self, tablename, row_num=DEFAULT_ROW_NUM):
+        """VirtualTable of a table of the schema, see VirtualTable"""
+        return VirtualTable(self, tablename, row_num)
+
+    def gen_rows(self, tablename, columns, num_rows=50, start=0, key_start=None):
+        """Generates rows start..start+num_rows-1 of a table planned with
+        plan_table. Primary keys are taken from position key_start of the
+        key sequence, start by default
+        """
+        if key_start is None:
+            key_start = start
+        tabledata = {}
+        # rows holding a value excluded from their column are dropped
+        keep = np.ones(num_rows, dtype=bool)
+        key_columns = [c for c in columns if c[1]['primary_key']]
+        keygen = self.get_key_generator(tablename, key_columns) if key_columns else None
+        if keygen is not None and num_rows > 0:
+            # before any column is made
+            keygen.check(key_start + num_rows)
+        composite = {}
+        if len(key_columns) > 1:
+            composite = self.gen_composite_keys(keygen, key_columns, num_rows, key_start)
+        for name, kwargs in columns:
+            with self.profiler.span('column', table=tablename, column=name,
+                                    start=start) as span:
+                excluded = []
+                if name in composite:
+                    column_data = composite[name]
+                elif 'fanout' in kwargs:
+                    column_data = kwargs['fanout'].take(start, start + num_rows)
+                elif kwargs['primary_key']:
+                    column_data = self.gen_column_data(num_rows=num_rows, keygen=keygen,
+                                                       start=key_start, **kwargs)
                 else:
-                    tabledata[name] = column_data
+                    if kwargs.get('choices') is None:
+                        kwargs = dict(kwargs)
+                        excluded = kwargs.pop('excluded', [])
+                    column_data = self.gen_column_blocks(tablename, name, kwargs,
+                                                         num_rows, start)
+                if len(excluded):
+                    drop = pd.Series(column_data).isin(excluded).to_numpy()
+                    keep[:len(drop)] &= ~drop
+                if self.compact and isinstance(kwargs.get('choices'), keys.RowKeys):
+                    # sized like the parent key column, without reading its keys
+                    column_data = cols.compact_column(column_data, kwargs['datatype'],
+                                                      kwargs['args'], kwargs['signed'],
+                                                      None, True)
+                elif self.compact:
+                    column_data = cols.compact_column(column_data, kwargs['datatype'],
+                                                      kwargs['args'], kwargs['signed'],
+                                                      kwargs.get('choices'),
+                                                      kwargs['primary_key'])
+                span.rows = len(column_data)
+            tabledata[name] = column_data
+        # the table is as long as its shortest column; building the frame
+        # once is much cheaper than inserting columns one by one
+        height = min((len(c) for c in tabledata.values()), default=0)
+        tabledata = pd.DataFrame({name: c[:height] if len(c) > height else c
+                                  for name, c in tabledata.items()})
+        if not keep.all():
+            tabledata = tabledata[keep[:tabledata.shape[0]]].reset_index(drop=True)
         return tabledata
 
+    def gen_column_blocks(self, tablename, name, kwargs, num_rows=50, start=0):
+        """Values of a non key column for rows start..start+num_rows-1.
+        Whole blocks (see block_bounds) are drawn, each from its own random
+        stream, and cut to the requested rows
+        """
+        if num_rows <= 0:
+            return np.array([])
+        first = block_of(start)
+        last = block_of(start + num_rows - 1)
+        blocks = []
+        for b in range(first, last + 1):
+            lower, upper = block_bounds(b)
+            blocks.append(self.gen_column_data(num_rows=upper - lower,
+                                               rng=self.get_rng(tablename, name, b),
+                                               **kwargs))
+        offset = start - block_bounds(first)[0]
+        return np.concatenate(blocks)[offset:offset + num_rows]
+
+    @staticmethod
+    def gen_composite_keys(keygen, columns, num_rows=50, start=0):
+        """Unique combinations of values for a multi column primary key
+        Parameters
+        ----------
+        keygen: keys.UniqueKeys
+            key generator over the domains of the key columns
+        columns: list
+            (name, kwargs) of the key columns, kwargs as passed to gen_column_data
+        Returns
+        -------
+        dict of column name to values
+        """
+        values = keygen.take(start, start + num_rows)
+        return {name: v for (name, kwargs), v in zip(columns, values)}
+
     @staticmethod
     def gen_column_data(datatype='int', args=None, choices=None,
-                        signed=False,
-                        primary_key=False, isnull=True,
+                        signed=None,
+                        primary_key=False, isnull=True, null_rate=rd.NULL_RATE,
                         excluded=[],
-                        num_rows=50):
+                        num_rows=50, vectorized=True,
+                        key_strategy='permutation', keygen=None, start=0,
+                        rng=None, distribution=None, partition=None):
         """
         Parameters
         ----------
-        excluded: list
-            values that should be excluded from the column
+        null_rate: float
+            share of nulls when isnull, drawn as one mask over the column.
+            Nulls are None in the returned object array
+        excluded: list or array
+            values that should be excluded from the column. Membership is
+            checked with np.isin or a set, never by scanning the list
+        vectorized: bool
+            generate the whole column at once with rd.random_array instead
+            of calling the scalar generators once per row
+        key_strategy: str
+            how primary keys are generated when no keygen is given, see
+            keys.UniqueKeys
+        keygen: keys.UniqueKeys
+            key generator of this primary key column
+        start: int
+            row number of the first generated row. Primary keys of rows
+            start..start+num_rows-1 are the same whichever chunk they are
+            generated in
+        rng: numpy.random.Generator
+            source of randomness. The scalar (vectorized=False) generators
+            use the random module and ignore it
+        distribution: str or dict
+            how values are drawn, see schema2db.distributions. Choices are
+            sampled by index, uniformly by default
+        partition: tuple
+            (lower, upper) slice of the key space of a mutually exclusive
+            table (see keys.partition_mask). Values outside it are drawn
+            again, keys are taken from the slice
         """
+        rng = rng or np.random.default_rng()
 
         if choices is not None:
             if len(choices) == 0:
                 raise ValueError('No value to choose from!')
-            choices_mod = [c for c in choices if c not in excluded]
+            choices_mod = choices if isinstance(choices, keys.RowKeys) else np.asarray(choices)
+            if len(excluded):
+                choices_mod = choices_mod[~np.isin(choices_mod, excluded)]
             if primary_key:
                 # if primary key, then there can be no more rows than the number
-                # of choices
-                num_rows = min(num_rows, len(choices_mod))
-                selected = np.random.choice(choices_mod, num_rows, replace=False)
-                return selected
-            return np.random.choice(choices_mod, num_rows, replace=True)
+                # of choices; take fails if there are
+                if keygen is None:
+                    keygen = keys.UniqueKeys([keys.ChoiceDomain(pd.unique(choices_mod))],
+                                             strategy=key_strategy)
+                return keygen.take(start, start + num_rows)[0]
+            datalist = choices_mod[dist.sample_indices(distribution, choices_mod, num_rows, rng)]
+            if isnull:
+                nulls = rd.random_null_mask(num_rows, null_rate, rng)
+                datalist = np.array(datalist, dtype=object)
+                datalist[nulls] = None
+            return datalist
+        elif primary_key:
+            # exactly num_rows distinct keys, never null
+            if keygen is None:
+                keygen = keys.UniqueKeys([keys.KeyDomain(datatype, args, signed)],
+                                         strategy=key_strategy)
+                if partition is not None:
+                    keygen = keys.SliceKeys(keygen, 0, *partition)
+            datalist = keygen.take(start, start + num_rows)[0]
         else:
-            if primary_key:
-                rows = 2 * num_rows
-            else:
-                rows = num_rows
-            datalist = rd.random_list(datatype=datatype, args=args,
-                                      signed=signed, length=rows)
-        if isnull:
-            datalist = [rd.gen_null(x) for x in datalist]
-        if primary_key:
-            # remove spaces if the primary key is of type varchar
-            if datatype == 'varchar':
-                datalist = [''.join(k.split()) for k in datalist]
-            datalist = list(set(datalist))[:min(num_rows, len(set(datalist)))]
-        datalist = [d for d in datalist if d not in excluded]
+            def draw(n):
+                if distribution is not None:
+                    return dist.sample_values(distribution, datatype, args, signed, n, rng)
+                elif vectorized:
+                    return rd.random_array(datatype=datatype, args=args,
+                                           signed=signed, length=n, rng=rng)
+                values = rd.random_list(datatype=datatype, args=args,
+                                        signed=signed, length=n)
+                if datatype.lower() in ['date', 'datetime']:
+                    # same dtype as rd.random_date_array
+                    return np.asarray(values, dtype='datetime64[D]')
+                return np.asarray(values)
+
+            datalist = draw(num_rows)
+            if partition is not None:
+                outside = ~keys.partition_mask(datalist, *partition)
+                for _ in range(MAX_REDRAWS):
+                    if not outside.any():
+                        break
+                    redrawn = draw(int(outside.sum()))
+                    datalist[outside] = redrawn
+                    outside[outside] = ~keys.partition_mask(redrawn, *partition)
+                else:
+                    raise ValueError("Too few {} values fall in the slice of a mutually "
+                                     "exclusive table".format(datatype))
+            if isnull:
+                nulls = rd.random_null_mask(num_rows, null_rate, rng)
+                datalist = np.array(datalist, dtype=object)
+                datalist[nulls] = None
+        datalist = np.asarray(datalist)
+        if len(excluded):
+            datalist = datalist[~pd.Series(datalist).isin(excluded).to_numpy()]
         return datalist
 
-    def parse_exclusive_tables(self, exclusive_list, exclude_on):
+    def parse_exclusive_tables(self, exclusive_list, exclude_on, proportions=None):
         """This adds a special dict to guarantee that multiple tables have foreign
         keys that are mutually exclusive.
         Example: in the example below, the aim is that a userid can show up in only
@@ -231,15 +1000,22 @@ class DBGenerator():
         userid | company_name
           2    |    company
 
-        The choice of which rows stay in which table is arbitrary
+        The choice of which rows stay in which table is arbitrary. Values
+        are hashed to [0, 1), which is cut once into a slice per table
+        (see keys.partition_bounds), so every table only ever draws from
+        its own slice and can be generated without the others.
+        proportions: list or dict
+            relative size of the slices, equal by default
         """
 
         self.schema['exclusive'] = {}
         if isinstance(exclude_on, str):
             exclude_on = [exclude_on]
+        bounds = keys.partition_bounds(exclusive_list, proportions)
         for e in exclusive_list:
             self.schema['exclusive'][e] = {'tables': [ee for ee in exclusive_list if ee != e],
-                                           'columns': exclude_on}
+                                           'columns': exclude_on,
+                                           'slice': bounds[e]}
 
     # ============== Utilities to turn csv into inserts ====== #
     @staticmethod
@@ -262,26 +1038,170 @@ class DBGenerator():
                                                              values)
         return statement
 
-    def table_to_inserts(self, df, tablename, col_types, path=None):
-        dff = df.copy()
-        printed = dff.apply(lambda x: self.to_insert(tablename,
-                                                     col_types, x),
-                            axis=1).tolist()
+    def table_to_inserts(self, df, tablename, col_types, path=None,
+                         batch_size=export.BATCH_SIZE, compress=None):
+        """Write a table as INSERT statements of up to batch_size rows each"""
         if not path:
             path = tablename + '.sql'
-        with open(path, 'w') as f:
-            for p in printed:
-                f.write(p)
-                f.write(';\n')
+        with self.profiler.span('inserts', table=tablename, rows=df.shape[0]):
+            export.write_inserts(df, tablename, col_types, path, batch_size=batch_size,
+                                 compress=compress)
+
+    def db_to_inserts(self, path='', batch_size=export.BATCH_SIZE, writers=0, compress=None):
+        """Write every table to <path>/<table>.sql (.sql.gz or .sql.zst with
+        compress), on writers threads side by side if given
+        """
+        with export.ExportPipeline(writers) as pipeline:
+            for tablename in self.db:
+                columns = self.schema['create'][tablename]['columns']
+                types = {i['name']:i['type']['type'] for i in columns}
+                name = tablename + '.sql'
+                if compress is not None:
+                    name += '.' + export.COMPRESSIONS[compress]
+                pipeline.submit(tablename, self.table_to_inserts, self.db[tablename],
+                                tablename, types, os.path.join(path, name),
+                                batch_size, compress)
+
+
+def block_of(row):
+    """Block holding a row number, see block_bounds"""
+    row = int(row)
+    if row < FIRST_BLOCK_ROWS:
+        return 0
+    if row < BLOCK_ROWS:
+        return row.bit_length() - FIRST_BLOCK_ROWS.bit_length() + 1
+    return row // BLOCK_ROWS + _SMALL_BLOCKS
+
+
+def block_bounds(block):
+    """Rows [lower, upper) of a block: FIRST_BLOCK_ROWS rows twice, then
+    doubling until BLOCK_ROWS, then BLOCK_ROWS each
+    """
+    if block == 0:
+        return 0, FIRST_BLOCK_ROWS
+    if block <= _SMALL_BLOCKS:
+        return FIRST_BLOCK_ROWS << (block - 1), FIRST_BLOCK_ROWS << block
+    lower = (block - _SMALL_BLOCKS) * BLOCK_ROWS
+    return lower, lower + BLOCK_ROWS
+
+
+class VirtualTable():
+    """Any rows of a table, computed on demand from their row numbers.
+    Row i is the same row gen_db_data makes, but neither this table nor
+    the tables it references are generated: values come from the random
+    stream of their block of rows, primary keys from the key
+    permutation at i, and foreign keys from the keys of the parent rows
+    they draw. Separate processes can each take their own range of rows.
+
+    Only foreign keys to single column primary keys are supported, and no
+    mutually exclusive tables, whose rows are dropped by value. Values are
+    the same as gen_db_data, dtypes may differ: foreign keys are not made
+    categorical
+    Parameters
+    ----------
+    db_gen: DBGenerator
+    tablename: str
+    row_num: int or dict
+        rows of this and the referenced tables, as for gen_db_data
+    """
+    def __init__(self, db_gen, tablename, row_num=DEFAULT_ROW_NUM):
+        self.db_gen = db_gen
+        self.tablename = tablename
+        self.columns, self.size = db_gen.plan_virtual(tablename, row_num)
+
+    def __len__(self):
+        return self.size
+
+    def take(self, start, stop):
+        """Rows start..stop-1 as a dataframe"""
+        start, stop = max(start, 0), min(stop, self.size)
+        with self.db_gen.profiler.span('table', table=self.tablename, start=start) as span:
+            df = self.db_gen.gen_rows(self.tablename, self.columns, max(stop - start, 0), start)
+            span.rows = df.shape[0]
+        return df
+
+    def iter_chunks(self, start=0, stop=None, chunk_rows=100000):
+        """Rows start..stop-1 in dataframes of chunk_rows rows"""
+        stop = self.size if stop is None else min(stop, self.size)
+        for s in range(start, stop, chunk_rows):
+            yield self.take(s, min(s + chunk_rows, stop))
+
+    def export(self, outpath, start=0, stop=None, fmt='csv', chunk_rows=100000, **options):
+        """Write rows start..stop-1 to <outpath>/<table>.rows<start>-<stop>.<ext>
+        Returns
+        -------
+        path of the file
+        """
+        stop = self.size if stop is None else min(stop, self.size)
+        path = export.table_path(outpath, self.tablename, fmt, options.get('compress'),
+                                 'rows{}-{}'.format(start, stop))
+        create_sql = self.db_gen.schema['create'][self.tablename]
+        writer = export.open_writer(fmt, path, create_sql, **options)
+        try:
+            for df in self.iter_chunks(start, stop, chunk_rows):
+                with self.db_gen.profiler.span('export', table=self.tablename,
+                                               format=fmt) as span:
+                    writer.write(df)
+                    span.rows = df.shape[0]
+        finally:
+            writer.close()
+        return path
+
+    def keys(self, rows):
+        """Primary key values of rows, for a single column primary key"""
+        key_columns = [c for c in self.columns if c[1]['primary_key']]
+        if len(key_columns) != 1:
+            raise ValueError("{} has no single column primary key".format(self.tablename))
+        keygen = self.db_gen.get_key_generator(self.tablename, key_columns)
+        return keys.RowKeys(keygen, self.size)[rows]
+
 
-    def db_to_inserts(self, path=''):
-        for tablename in self.db:
-            columns = self.schema['create'][tablename]['columns']
-            types = {i['name']:i['type']['type'] for i in columns}
-            self.table_to_inserts(self.db[tablename],
-                                  tablename,
-                                  types,
-                                  os.path.join(path, tablename + '.sql'))
+def _gen_table_task(schema, options, tablename, row_num, pools):
+    """Generate one table in a worker process"""
+    db_gen = DBGenerator(schema, **options)
+    db_gen.pools = pools
+    return db_gen.gen_table(schema['create'][tablename],
+                            schema.get('alter', {}).get(tablename, {}),
+                            schema.get('exclusive', {}).get(tablename, {}),
+                            row_num=row_num)
+
+
+def parse_null_rates(values, tables):
+    """null_rate for DBGenerator from --null-rate arguments, either a
+    bare rate for every column or 'table=rate' / 'table.column=rate'
+    """
+    rates = {}
+    default = None
+    for v in values:
+        if '=' in v:
+            name, rate = v.split('=', 1)
+            rates[name.strip()] = float(rate)
+        else:
+            default = float(v)
+    if not rates:
+        return rd.NULL_RATE if default is None else default
+    if default is not None:
+        for t in tables:
+            rates.setdefault(t, default)
+    return rates
+
+
+def parse_row_nums(rows, table_rows, tables, default=DEFAULT_ROW_NUM):
+    """row_num for gen_db_data from --rows and 'table=rows' arguments,
+    on top of the rows of a config file (a number or a dict)
+    """
+    if rows is not None:
+        default = rows
+    if not table_rows:
+        return default
+    if isinstance(default, dict):
+        row_num = dict(default)
+    else:
+        row_num = {t: default for t in tables}
+    for v in table_rows:
+        name, n = v.split('=', 1)
+        row_num[name.strip()] = int(n)
+    return row_num
 
 
 def main():
@@ -293,9 +1213,125 @@ def main():
                         help='path to the schema file')
     parser.add_argument('destination', type=str,
                         help='destination folder of the database csv files')
+    parser.add_argument('--chunk-rows', type=int, default=None,
+                        help='generate and write tables in chunks of this many rows '
+                        'instead of building whole tables in memory')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes generating independent tables, '
+                        'whole tables are kept in memory so it cannot be combined '
+                        'with --chunk-rows, --append or --row-range')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='random seed, the same seed always gives the same data')
+    parser.add_argument('--format', default='csv', choices=sorted(export.WRITERS),
+                        help='output file format, parquet and feather/arrow need pyarrow')
+    parser.add_argument('--null-rate', action='append', default=[],
+                        help='share of nulls in nullable columns, either a rate for all '
+                        'of them or table=rate / table.column=rate, can be repeated')
+    parser.add_argument('--csv-null', default='',
+                        help='token written for nulls in csv files, empty by default')
+    parser.add_argument('--rows', type=int, default=None,
+                        help='rows per table, {} by default'.format(DEFAULT_ROW_NUM))
+    parser.add_argument('--table-rows', action='append', default=[],
+                        help='rows of one table as table=rows, can be repeated')
+    parser.add_argument('--scale', type=float, default=None,
+                        help='multiply the row count of every table by this factor')
+    parser.add_argument('--memory', type=int, default=MEMORY_BUDGET >> 20,
+                        help='memory budget in MB, larger databases are generated in chunks')
+    parser.add_argument('--append', action='store_true',
+                        help='add --rows/--table-rows rows to the tables already in '
+                        'destination instead of making a new database')
+    parser.add_argument('--config', default=None,
+                        help='json file with any of rows (a number or table to rows), '
+                        'scale, seed, null_rate, key_strategy, distributions and fanout. '
+                        'Command line options take precedence')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='parse the schema file even if it is in the schema cache')
+    parser.add_argument('--clear-cache', action='store_true',
+                        help='empty the schema cache ({}) first'.format(schema_cache.CACHE_DIR))
+    parser.add_argument('--writers', type=int, default=1,
+                        help='threads writing files while generation goes on, 0 writes '
+                        'after each table or chunk is made')
+    parser.add_argument('--compress', default=None, choices=sorted(export.COMPRESSIONS),
+                        help='compress csv files (parquet and arrow files internally)')
+    parser.add_argument('--part-rows', type=int, default=None,
+                        help='split every table into numbered part files of this many rows')
+    parser.add_argument('--profile', action='store_true',
+                        help='print where the time went when done')
+    parser.add_argument('--trace', default=None,
+                        help='write timings of every table, column and export to this '
+                        'file, one json object per line')
+    parser.add_argument('--row-range', nargs=3, default=None,
+                        metavar=('TABLE', 'START', 'STOP'),
+                        help='only write rows START..STOP-1 of TABLE, computed without '
+                        'generating the tables it references')
 
     args = parser.parse_args()
+    if args.workers > 1 and (args.chunk_rows or args.append or args.row_range):
+        # only whole tables are generated in parallel
+        parser.error('--workers cannot be combined with --chunk-rows, --append or --row-range')
 
-    db_gen = DBGenerator(args.schema_file)
-    db_gen.gen_db_data()
-    db_gen.export_db(args.destination)
+    config = {}
+    if args.config:
+        with open(args.config) as f:
+            config = json.load(f)
+    if args.clear_cache:
+        schema_cache.SchemaCache().clear()
+    profiler = None
+    if args.profile or args.trace:
+        profiler = instrument.Profiler(trace=args.trace)
+    db_gen = DBGenerator(args.schema_file,
+                         seed=args.seed if args.seed is not None else config.get('seed'),
+                         key_strategy=config.get('key_strategy', 'permutation'),
+                         null_rate=config.get('null_rate', rd.NULL_RATE),
+                         distributions=config.get('distributions'),
+                         fanout=config.get('fanout'),
+                         scale=args.scale if args.scale is not None else config.get('scale', 1),
+                         cache=not args.no_cache,
+                         profiler=profiler)
+    schema = db_gen.schema
+    if args.null_rate:
+        # table names are only known once the schema is parsed
+        db_gen.null_rate = parse_null_rates(args.null_rate, schema['create'])
+    row_num = parse_row_nums(args.rows, args.table_rows, schema['create'],
+                             config.get('rows', DEFAULT_ROW_NUM))
+    if args.row_range:
+        tablename, start, stop = args.row_range
+        options = {'na_rep': args.csv_null} if args.format == 'csv' else {}
+        if args.compress:
+            options['compress'] = args.compress
+        db_gen.virtual_table(tablename, row_num).export(
+            args.destination, int(start), int(stop), fmt=args.format,
+            chunk_rows=args.chunk_rows or 100000, **options)
+    elif args.append:
+        tables = [v.split('=', 1)[0].strip() for v in args.table_rows] or None
+        db_gen.append_db_data(args.destination, row_num=row_num, tables=tables,
+                              chunk_rows=args.chunk_rows or 100000)
+    else:
+        options = {'na_rep': args.csv_null} if args.format == 'csv' else {}
+        if args.compress:
+            options['compress'] = args.compress
+        chunk_rows = args.chunk_rows
+        rows = db_gen.plan_rows(row_num=row_num)
+        if not chunk_rows:
+            # chunks waiting for a writer thread count against the budget too
+            in_flight = 1 + args.writers * export.QUEUE_CHUNKS
+            chunk_rows = db_gen.plan_chunk_rows(rows, memory=(args.memory << 20) // in_flight)
+            if chunk_rows and args.workers > 1:
+                print('The database does not fit in --memory {} MB, generating it in '
+                      'chunks in one process instead of {} workers'.format(
+                          args.memory, args.workers), file=sys.stderr)
+        if args.workers > 1 and not chunk_rows:
+            db_gen.gen_db_data(row_num=row_num, workers=args.workers)
+            db_gen.export_db(args.destination, fmt=args.format, writers=args.writers,
+                             part_rows=args.part_rows, **options)
+        else:
+            # one chunk per table when it all fits, so writing a table
+            # overlaps generating the next one
+            chunk_rows = chunk_rows or max(list(rows.values()) + [1])
+            db_gen.stream_db_data(args.destination, row_num=row_num, chunk_rows=chunk_rows,
+                                  fmt=args.format, writers=args.writers,
+                                  part_rows=args.part_rows, **options)
+    if profiler is not None:
+        profiler.close()
+        if args.profile:
+            print(profiler.summary(), file=sys.stderr)
@@ -0,0 +1,91 @@
+"""
+Foreign key dependency graph of a parsed schema
+"""
+
+
+def build_fk_graph(schema, preload=()):
+    """Dependencies between the tables to generate
+    Parameters
+    ----------
+    schema: dict
+        parsed schema, as returned by SchemaParser.extract_sql_doc
+    preload: iterable
+        names of tables that are loaded rather than generated. They
+        satisfy any reference to them and are left out of the graph
+    Returns
+    -------
+    dict of table name to the set of tables it has to wait for
+    """
+    graph = {t: set() for t in schema.get('create', {}) if t not in preload}
+    for table, constraints in schema.get('alter', {}).items():
+        if table not in graph:
+            continue
+        for fk in constraints.get('foreign_keys', []):
+            if fk['referenced'] in preload:
+                continue
+            if fk['referenced'] not in graph:
+                raise ValueError("Table {} references {}, which is neither created "
+                                 "nor preloaded".format(table, fk['referenced']))
+            graph[table].add(fk['referenced'])
+    return graph
+
+
+def find_cycle(graph):
+    """A dependency cycle as a list of tables [a, b, ..., a], or None"""
+    visiting, done = [], set()
+    for root in sorted(graph):
+        if root in done:
+            continue
+        # iterative depth first search, the path is kept in visiting
+        stack = [(root, iter(sorted(graph[root])))]
+        visiting.append(root)
+        while stack:
+            node, parents = stack[-1]
+            for p in parents:
+                if p in visiting:
+                    return visiting[visiting.index(p):] + [p]
+                if p not in done and p in graph:
+                    stack.append((p, iter(sorted(graph[p]))))
+                    visiting.append(p)
+                    break
+            else:
+                stack.pop()
+                visiting.pop()
+                done.add(node)
+    return None
+
+
+def check_acyclic(graph):
+    cycle = find_cycle(graph)
+    if cycle:
+        raise ValueError("There are circular dependencies in foreign keys: {}. "
+                         "Please double check your constraints".format(' -> '.join(cycle)))
+
+
+def children_of(graph):
+    """Reverse of graph: table name to the set of tables waiting for it"""
+    children = {t: set() for t in graph}
+    for table, parents in graph.items():
+        for p in parents:
+            if p in children:
+                children[p].add(table)
+    return children
+
+
+def topological_order(graph):
+    """Table names, each after every table it depends on (Kahn's algorithm).
+    Ties are broken by name so the order is stable
+    """
+    check_acyclic(graph)
+    children = children_of(graph)
+    waiting = {t: len(graph[t]) for t in graph}
+    ready = sorted(t for t in graph if waiting[t] == 0)
+    order = []
+    while ready:
+        table = ready.pop(0)
+        order.append(table)
+        for c in sorted(children[table]):
+            waiting[c] -= 1
+            if waiting[c] == 0:
+                ready.append(c)
+    return order
@@ -0,0 +1,172 @@
+"""
+Timings and progress of data generation and export
+
+A DBGenerator given a Profiler records an event for every table (and
+chunk of a table) generated, every column of it, and every table
+exported. Events are dicts such as
+
+    {'kind': 'column', 'table': 'sales', 'column': 'sold', 'rows': 8192,
+     'seconds': 0.002, 'rows/s': 4096000.0, 'max_rss_MB': 210.5}
+
+They are kept for summary(), written one json object per line to a
+trace file when one is given, and passed to the progress callback as
+they happen. Without a profiler the generator uses NULL_PROFILER, whose
+spans do nothing.
+"""
+import sys
+import json
+import time
+try:
+    import resource
+except ImportError:
+    # not on windows
+    resource = None
+
+KINDS = ['db', 'table', 'column', 'export', 'inserts']
+
+
+def max_rss_mb():
+    """Memory high-water mark of the process in MB, None if unknown"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macos, kilobytes elsewhere
+    return rss / 1e6 if sys.platform == 'darwin' else rss / 1e3
+
+
+class Span():
+    """Times the block of a with statement and records an event when it
+    ends. Set rows (and any other field) on it inside the block
+    """
+    def __init__(self, profiler, kind, fields):
+        self.profiler = profiler
+        self.fields = fields
+        self.fields['kind'] = kind
+
+    def __setattr__(self, name, value):
+        if name in ['profiler', 'fields', 'start']:
+            object.__setattr__(self, name, value)
+        else:
+            self.fields[name] = value
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(time.perf_counter() - self.start, **self.fields)
+        return False
+
+
+class _NullSpan():
+    """Span of NULL_PROFILER, ignores everything"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+class Profiler():
+    """Collects events of a DBGenerator
+    Parameters
+    ----------
+    trace: str or file
+        write every event as a line of json to this path or file
+    progress: callable
+        called with every event as soon as it is recorded
+    kinds: list
+        kinds of event to record, all of KINDS by default. Leaving out
+        'column' saves most of the overhead on wide tables
+    """
+    enabled = True
+
+    def __init__(self, trace=None, progress=None, kinds=KINDS):
+        self.events = []
+        self.progress = progress
+        self.kinds = set(kinds)
+        self.own_trace = isinstance(trace, str)
+        self.trace = open(trace, 'w') if self.own_trace else trace
+
+    def span(self, kind, **fields):
+        if kind not in self.kinds:
+            return _NULL_SPAN
+        return Span(self, kind, fields)
+
+    def record(self, seconds, **fields):
+        """Add an event that took seconds"""
+        fields['seconds'] = seconds
+        if fields.get('rows') is not None and seconds > 0:
+            fields['rows/s'] = fields['rows'] / seconds
+        fields['max_rss_MB'] = max_rss_mb()
+        self.events.append(fields)
+        if self.trace is not None:
+            self.trace.write(json.dumps(fields, default=str) + '\n')
+        if self.progress is not None:
+            self.progress(fields)
+
+    def totals(self, kind, by):
+        """Rows and seconds of the events of a kind, added up per value of
+        the by fields, slowest first
+        Returns
+        -------
+        list of (tuple of by values, rows, seconds)
+        """
+        sums = {}
+        for e in self.events:
+            if e['kind'] == kind:
+                key = tuple(e.get(b) for b in by)
+                rows, seconds = sums.get(key, (0, 0.0))
+                sums[key] = (rows + (e.get('rows') or 0), seconds + e['seconds'])
+        return sorted(((k,) + v for k, v in sums.items()), key=lambda x: -x[2])
+
+    def summary(self, top=10):
+        """Text report of where the time went"""
+        lines = []
+        sections = [('table', ['table'], 'generated'), ('export', ['table'], 'exported'),
+                    ('inserts', ['table'], 'written as inserts'),
+                    ('column', ['table', 'column'], 'slowest columns')]
+        for kind, by, title in sections:
+            totals = self.totals(kind, by)
+            if not totals:
+                continue
+            seconds = sum(t[2] for t in totals)
+            lines.append('{}: {} in {:.3f}s'.format(title, len(totals), seconds))
+            for key, rows, secs in totals[:top]:
+                rate = '{:>12.0f} rows/s'.format(rows / secs) if secs > 0 else ''
+                lines.append('  {:<40} {:>10} rows {:>9.3f}s {}'.format(
+                    '.'.join(str(k) for k in key), rows, secs, rate))
+        peak = max_rss_mb()
+        if peak is not None:
+            lines.append('peak memory: {:.1f} MB'.format(peak))
+        return '\n'.join(lines)
+
+    def close(self):
+        if self.own_trace and self.trace is not None:
+            self.trace.close()
+            self.trace = None
+
+
+class NullProfiler():
+    """Profiler that records nothing"""
+    enabled = False
+    events = []
+
+    def span(self, kind, **fields):
+        return _NULL_SPAN
+
+    def record(self, seconds, **fields):
+        pass
+
+    def summary(self, top=10):
+        return ''
+
+    def close(self):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+NULL_PROFILER = NullProfiler()
@@ -0,0 +1,325 @@
+"""
+Unique key generation for primary key columns
+
+Keys are produced from row numbers: row i of a table is mapped to an
+integer code, and the code is turned into a value of the column type.
+Codes never repeat, so N rows always get exactly N distinct keys, and any
+range of rows can be produced on its own in O(range) memory.
+"""
+import numpy as np
+import pandas as pd
+
+STRATEGIES = ['sequential', 'permutation', 'hash']
+
+# codes are computed with uint64 arithmetic, domains are capped below that
+MAX_DOMAIN = 2 ** 62
+# dates used as keys, same span as rd.random_date
+FIRST_DATE = np.datetime64('1900-01-01', 'D')
+LAST_DATE = np.datetime64('2025-12-31', 'D')
+_BASE36 = np.frombuffer(b'0123456789abcdefghijklmnopqrstuvwxyz', dtype=np.uint8)
+# 36 ** 13 > 2 ** 64, so 13 characters hold any hashed code
+_HASH_WIDTH = 13
+
+
+def _mix64(x):
+    """splitmix64 finalizer, a bijection on uint64"""
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xbf58476d1ce4e5b9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94d049bb133111eb)
+    return x ^ (x >> np.uint64(31))
+
+
+def _base36(codes, width):
+    """Fixed width, zero padded base 36 strings of uint64 codes"""
+    codes = np.array(codes, dtype=np.uint64)
+    chars = np.empty((len(codes), width), dtype=np.uint8)
+    for i in range(width - 1, -1, -1):
+        chars[:, i] = _BASE36[codes % np.uint64(36)]
+        codes //= np.uint64(36)
+    return chars.view('S{}'.format(width)).ravel().astype(str)
+
+
+class KeyDomain():
+    """All the distinct values a column of a given sql type can hold as a key.
+    Code 0..size-1 maps to one value each. Ints are signed, as in sql,
+    unless signed is False (an explicit unsigned)
+    """
+    def __init__(self, datatype='int', args=None, signed=None):
+        self.datatype = datatype.lower()
+        args = args or []
+        if self.datatype == 'int':
+            self.size = 2 ** 32 - 1 if signed is False else 2 ** 31 - 1
+        elif self.datatype == 'decimal':
+            if len(args) != 2:
+                raise ValueError("Invalid arguments ({}) for decimal".format(args))
+            self.size = 10 ** args[0] - 1
+            self.scale = 10 ** args[1]
+        elif self.datatype in ['date', 'datetime']:
+            self.size = int((LAST_DATE - FIRST_DATE).astype(int)) + 1
+        elif self.datatype == 'varchar':
+            if len(args) != 1:
+                raise ValueError("Invalid arguments ({}) for varchar".format(args))
+            self.length = args[0]
+            self.width = min(args[0], 12)
+            if self.width < 1:
+                raise ValueError("varchar({}) cannot hold a key".format(args[0]))
+            self.size = 36 ** self.width
+        else:
+            raise ValueError("Data type {} currently not supported".format(datatype))
+        self.size = min(self.size, MAX_DOMAIN)
+
+    def encode(self, codes):
+        """Values for an array of codes"""
+        codes = np.asarray(codes, dtype=np.uint64)
+        if self.datatype == 'int':
+            return codes.astype(np.int64) + 1
+        elif self.datatype == 'decimal':
+            return (codes.astype(np.int64) + 1) / self.scale
+        elif self.datatype in ['date', 'datetime']:
+            return FIRST_DATE + codes.astype(np.int64)
+        return _base36(codes, self.width)
+
+
+class ChoiceDomain():
+    """Key domain made of a fixed pool of values, e.g. a foreign key or enum.
+    A RowKeys pool stays lazy
+    """
+    def __init__(self, choices):
+        self.choices = choices if isinstance(choices, RowKeys) else np.asarray(choices)
+        self.size = len(self.choices)
+
+    def encode(self, codes):
+        return self.choices[np.asarray(codes, dtype=np.int64)]
+
+
+class UniqueKeys():
+    """Unique (possibly composite) keys over one or more key domains
+
+    Strategies
+    ----------
+    sequential: row i gets code i
+    permutation: codes are a keyed pseudo-random permutation of the
+        whole domain (a Feistel network with cycle walking)
+    hash: row i gets a 64 bit hash of i, written as 13 base 36 characters.
+        Only for a single varchar column of length 13 or more
+    """
+    def __init__(self, domains, strategy='permutation', rng=None):
+        if strategy not in STRATEGIES:
+            raise ValueError("Unknown key strategy {}, options are {}".format(strategy,
+                                                                             STRATEGIES))
+        self.domains = domains
+        self.strategy = strategy
+        rng = rng or np.random.default_rng()
+        if strategy == 'hash':
+            if (len(domains) != 1 or not isinstance(domains[0], KeyDomain)
+                    or domains[0].datatype != 'varchar'):
+                raise ValueError("Hashed keys are only supported for a single varchar column")
+            if domains[0].length < _HASH_WIDTH:
+                raise ValueError("Hashed keys need varchar({}) or wider, use the "
+                                 "permutation strategy instead".format(_HASH_WIDTH))
+            self.size = 2 ** 64
+            self.salt = rng.integers(0, 2 ** 64, dtype=np.uint64)
+            return
+        self.size = 1
+        for d in domains:
+            self.size *= d.size
+        self.size = min(self.size, MAX_DOMAIN)
+        if strategy == 'permutation':
+            self.half_bits = max((int(self.size - 1).bit_length() + 1) // 2, 1)
+            self.round_keys = rng.integers(0, 2 ** 64, size=4, dtype=np.uint64)
+
+    def check(self, num_rows):
+        """Fail fast if the domain cannot hold num_rows distinct keys"""
+        if num_rows > self.size:
+            raise ValueError("Cannot generate {} unique keys, the key domain only "
+                             "has {} values".format(num_rows, self.size))
+
+    def _feistel(self, x):
+        half = np.uint64(self.half_bits)
+        mask = np.uint64((1 << self.half_bits) - 1)
+        left = x >> half
+        right = x & mask
+        for k in self.round_keys:
+            left, right = right, left ^ (_mix64(right ^ k) & mask)
+        return (left << half) | right
+
+    def codes(self, start, stop):
+        """Codes of rows start..stop-1"""
+        if stop > start:
+            self.check(stop)
+        return self.codes_of(np.arange(start, stop, dtype=np.uint64))
+
+    def codes_of(self, rows):
+        """Codes of any row numbers, a uint64 array"""
+        if self.strategy == 'sequential':
+            return rows
+        if self.strategy == 'hash':
+            return _mix64(rows + self.salt)
+        # cycle walking keeps the permutation inside [0, size)
+        codes = self._feistel(rows)
+        outside = codes >= np.uint64(self.size)
+        while outside.any():
+            codes[outside] = self._feistel(codes[outside])
+            outside = codes >= np.uint64(self.size)
+        return codes
+
+    def take(self, start, stop):
+        """Key columns for rows start..stop-1, one array per domain"""
+        return self.encode(self.codes(start, stop))
+
+    def take_rows(self, rows):
+        """Key columns for any row numbers, one array per domain"""
+        rows = np.asarray(rows, dtype=np.uint64)
+        if len(rows):
+            self.check(int(rows.max()) + 1)
+        return self.encode(self.codes_of(rows))
+
+    def encode(self, codes):
+        """Key columns of codes"""
+        if self.strategy == 'hash':
+            return [_base36(codes, _HASH_WIDTH)]
+        columns = []
+        for d in reversed(self.domains):
+            size = np.uint64(d.size)
+            columns.append(d.encode(codes % size))
+            codes = codes // size
+        return columns[::-1]
+
+
+class RowKeys():
+    """Primary key values of a table that is never materialized, indexed
+    by row number: keys[rows] is computed from the rows alone. Stands in
+    for the pool of parent keys of a foreign key, row j of the parent
+    being pool entry j
+    Parameters
+    ----------
+    keygen: UniqueKeys
+        key generator of the single column primary key
+    size: int
+        rows of the table
+    """
+    def __init__(self, keygen, size):
+        self.keygen = keygen
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) and (rows.min() < 0 or rows.max() >= self.size):
+            raise IndexError("Row out of range of a table of {} rows".format(self.size))
+        return self.keygen.take_rows(rows)[0]
+
+    def __array__(self, dtype=None, copy=None):
+        # every key at once, only for the few uses that need them all
+        values = self.keygen.take(0, self.size)[0]
+        return values if dtype is None else values.astype(dtype)
+
+
+class SliceKeys():
+    """The keys of a UniqueKeys whose value in one domain falls in the
+    slice [lower, upper) of the key space (see partition_mask), for a
+    mutually exclusive table. Row i gets the i-th such key of the key
+    sequence. The scan resumes where the last take stopped, so taking
+    consecutive chunks costs O(rows / slice width); going back to an
+    earlier row scans from the start again
+    Parameters
+    ----------
+    keygen: UniqueKeys
+    domain: int
+        position of the exclusive column among the key columns
+    """
+    def __init__(self, keygen, domain, lower, upper):
+        self.keygen = keygen
+        self.domains = keygen.domains
+        self.size = keygen.size
+        self.domain = domain
+        self.lower = lower
+        self.upper = upper
+        # rows taken so far, and the key position the next row starts from
+        self.rows = 0
+        self.position = 0
+
+    def check(self, num_rows):
+        self.keygen.check(num_rows)
+
+    def take(self, start, stop):
+        """Key columns for rows start..stop-1, one array per domain"""
+        if start < self.rows:
+            self.rows, self.position = 0, 0
+        skip, need = start - self.rows, max(stop - start, 0)
+        parts = [[] for _ in self.domains]
+        width = max(self.upper - self.lower, 1e-6)
+        while skip + need > 0:
+            if self.position >= self.size:
+                raise ValueError("Cannot generate {} unique keys, the slice of the key "
+                                 "domain only has {} values".format(stop, stop - skip - need))
+            n = int(min(max((skip + need) / width * 1.1, 1024), self.size - self.position))
+            values = self.keygen.take(self.position, self.position + n)
+            found = np.flatnonzero(partition_mask(values[self.domain],
+                                                  self.lower, self.upper))[:skip + need]
+            used = found[min(skip, len(found)):]
+            for part, v in zip(parts, values):
+                part.append(v[used])
+            skip -= min(skip, len(found))
+            need -= len(used)
+            done = skip + need == 0 and len(found)
+            self.position += int(found[-1]) + 1 if done else n
+        self.rows = max(start, stop)
+        return [np.concatenate(p) if p else np.array([], dtype=np.int64) for p in parts]
+
+
+def unique_keys(datatype='int', args=None, signed=None, num_rows=50,
+                strategy='permutation', rng=None):
+    """Exactly num_rows distinct keys of the given type"""
+    return UniqueKeys([KeyDomain(datatype, args, signed)],
+                      strategy=strategy, rng=rng).take(0, num_rows)[0]
+
+
+def partition_bounds(tables, proportions=None):
+    """Disjoint slices [lower, upper) of [0, 1) for tables that share a
+    key space, in proportion to their weights
+    Parameters
+    ----------
+    proportions: list or dict
+        weight of every table, in the order of tables or by name.
+        Equal shares by default
+    Returns
+    -------
+    dict of table name to (lower, upper)
+    """
+    if proportions is None:
+        weights = [1.0] * len(tables)
+    elif isinstance(proportions, dict):
+        weights = [float(proportions.get(t, 0)) for t in tables]
+    else:
+        weights = [float(p) for p in proportions]
+    if len(weights) != len(tables):
+        raise ValueError("Got {} proportions for {} tables".format(len(weights), len(tables)))
+    if min(weights) < 0 or sum(weights) <= 0:
+        raise ValueError("Proportions must not be negative or all 0, got {}".format(weights))
+    ends = np.cumsum(weights) / sum(weights)
+    starts = np.concatenate([[0.0], ends[:-1]])
+    ends[-1] = 1.0
+    return {t: (float(lo), float(hi)) for t, lo, hi in zip(tables, starts, ends)}
+
+
+def partition_mask(values, lower, upper):
+    """Whether each value falls in the slice [lower, upper) of the key
+    space. Values are hashed to a point of [0, 1), the same point in any
+    table, chunk or process, so tables given disjoint slices never share
+    a value. Nulls are always kept
+    """
+    values = pd.Series(values)
+    isnull = values.isna().to_numpy(dtype=bool)
+    if pd.api.types.infer_dtype(values, skipna=True) == 'integer':
+        ints = values.where(~isnull, 0).to_numpy(dtype=np.int64)
+        codes = _mix64(ints.astype(np.uint64))
+    else:
+        # anything else is hashed by its text, so the same value hashes the
+        # same whether its column is typed or object
+        codes = pd.util.hash_array(values.astype(str).to_numpy(dtype=object))
+    points = (codes >> np.uint64(11)) * 2.0 ** -53
+    return isnull | ((points >= lower) & (points < upper))
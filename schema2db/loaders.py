@@ -0,0 +1,345 @@
+"""
+Load generated tables straight into a database
+
+A loader creates the tables of a parsed schema and inserts dataframes
+(whole tables or chunks) into them. DBAPILoader works with any DB-API 2
+connection through batched executemany, SQLiteLoader wraps the sqlite3
+module and PostgresCopyLoader streams rows with COPY FROM STDIN in text
+or binary format.
+"""
+import sqlite3
+import struct
+from decimal import Decimal
+import numpy as np
+import pandas as pd
+
+_STR = np.dtypes.StringDType()
+_PG_EPOCH = np.datetime64('2000-01-01', 'D')
+
+
+def _sql_type(col_type, dialect='sqlite'):
+    datatype = col_type['type']
+    args = [int(a) for a in col_type['args']]
+    if datatype == 'int':
+        # keys of an unsigned int go up to 2 ** 32 - 1, more than a 4 byte int
+        return 'INTEGER' if dialect == 'sqlite' else 'BIGINT'
+    elif datatype == 'decimal':
+        return 'NUMERIC({},{})'.format(*args) if len(args) == 2 else 'NUMERIC'
+    elif datatype == 'varchar':
+        return 'VARCHAR({})'.format(args[0]) if args else 'VARCHAR'
+    elif datatype == 'date':
+        return 'DATE'
+    elif datatype == 'datetime':
+        return 'TIMESTAMP'
+    raise ValueError("Data type {} currently not supported".format(datatype))
+
+
+def create_table_sql(create_sql, dialect='sqlite'):
+    """CREATE TABLE statement of a parsed create block, with NOT NULL and
+    PRIMARY KEY constraints. Foreign keys are not declared, tables are
+    filled parents first
+    """
+    lines = []
+    for col in create_sql['columns']:
+        line = '"{}" {}'.format(col['name'], _sql_type(col['type'], dialect))
+        if col.get('null') is False:
+            line += ' NOT NULL'
+        lines.append(line)
+    if create_sql['primary_keys']:
+        lines.append('PRIMARY KEY ({})'.format(','.join('"{}"'.format(k)
+                                                        for k in create_sql['primary_keys'])))
+    return 'CREATE TABLE "{}" (\n  {}\n)'.format(create_sql['tablename'], ',\n  '.join(lines))
+
+
+def _null_mask(values):
+    """Missing values (NaN/None/NA)"""
+    return values.isna().to_numpy(dtype=bool, copy=True)
+
+
+def python_columns(df, create_sql, dates_as_str=True):
+    """Columns of df as lists of python values, None for nulls, ready to
+    be zipped into executemany parameters
+    """
+    columns = []
+    for col in create_sql['columns']:
+        values = df[col['name']]
+        mask = _null_mask(values)
+        datatype = col['type']['type']
+        if datatype in ['date', 'datetime'] and len(values):
+            unit = 'D' if datatype == 'date' else 's'
+            stamps = pd.to_datetime(values.where(~mask, None)).to_numpy()
+            stamps = stamps.astype('datetime64[{}]'.format(unit))
+            if dates_as_str:
+                out = np.datetime_as_string(stamps, unit=unit).astype(object)
+            else:
+                out = stamps.astype(object)
+        elif datatype == 'int':
+            out = pd.to_numeric(values.where(~mask, 0)).to_numpy().astype(np.int64).astype(object)
+        elif datatype == 'decimal':
+            out = pd.to_numeric(values.where(~mask, 0)).to_numpy().astype(float).astype(object)
+        else:
+            out = values.to_numpy().astype(str).astype(object)
+        out[mask] = None
+        columns.append(out.tolist())
+    return columns
+
+
+class DBAPILoader():
+    """Loads tables through any DB-API 2 connection with batched executemany.
+    Every load call (a whole table or one chunk of it) is inserted and
+    committed in one transaction, a failed chunk is rolled back alone
+    Parameters
+    ----------
+    connection: DB-API 2 connection
+    paramstyle: str
+        'qmark' (?), 'format' (%s) or 'numeric' (:1), as the driver expects
+    dialect: str
+        'sqlite' or 'postgres', only changes column types in CREATE TABLE
+    batch_size: int
+        rows per executemany call
+    """
+    def __init__(self, connection, paramstyle='qmark', dialect='sqlite',
+                 batch_size=10000, dates_as_str=True):
+        if paramstyle not in ['qmark', 'format', 'numeric']:
+            raise ValueError("Unsupported paramstyle {}".format(paramstyle))
+        self.connection = connection
+        self.paramstyle = paramstyle
+        self.dialect = dialect
+        self.batch_size = batch_size
+        self.dates_as_str = dates_as_str
+
+    def create_tables(self, schema, tables=None, drop=False):
+        """Create the tables of a parsed schema, all of them by default"""
+        cursor = self.connection.cursor()
+        for tablename in tables or schema['create']:
+            if drop:
+                cursor.execute('DROP TABLE IF EXISTS "{}"'.format(tablename))
+            cursor.execute(create_table_sql(schema['create'][tablename], self.dialect))
+        self.connection.commit()
+
+    def placeholders(self, n):
+        if self.paramstyle == 'qmark':
+            return ','.join(['?'] * n)
+        elif self.paramstyle == 'format':
+            return ','.join(['%s'] * n)
+        return ','.join([':{}'.format(i + 1) for i in range(n)])
+
+    def insert(self, cursor, tablename, df, create_sql):
+        names = [c['name'] for c in create_sql['columns']]
+        statement = 'INSERT INTO "{}" ({}) VALUES ({})'.format(
+            tablename, ','.join('"{}"'.format(n) for n in names),
+            self.placeholders(len(names)))
+        for b in range(0, df.shape[0], self.batch_size):
+            part = df.iloc[b:b + self.batch_size]
+            rows = list(zip(*python_columns(part, create_sql, self.dates_as_str)))
+            cursor.executemany(statement, rows)
+
+    def load(self, tablename, df, create_sql):
+        """Insert a dataframe (a table or a chunk of it) and commit"""
+        cursor = self.connection.cursor()
+        try:
+            self.insert(cursor, tablename, df, create_sql)
+        except Exception:
+            self.connection.rollback()
+            raise
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+class SQLiteLoader(DBAPILoader):
+    """Loads tables into a sqlite database file (or ':memory:').
+    Durability is relaxed while loading, as the data can be regenerated
+    """
+    def __init__(self, path=':memory:', batch_size=10000):
+        connection = sqlite3.connect(path)
+        connection.execute('PRAGMA synchronous = OFF')
+        connection.execute('PRAGMA journal_mode = MEMORY')
+        super().__init__(connection, paramstyle='qmark', dialect='sqlite',
+                         batch_size=batch_size)
+
+
+# ============== PostgreSQL COPY ====== #
+
+def copy_text(df, create_sql):
+    """Rows of df in PostgreSQL COPY text format: tab separated, \\N for
+    null, with backslash, tab, newline and carriage return escaped
+    """
+    fields = []
+    for col in create_sql['columns']:
+        values = df[col['name']]
+        mask = _null_mask(values)
+        if pd.api.types.is_datetime64_any_dtype(values):
+            unit = 'D' if col['type']['type'] == 'date' else 's'
+            text = np.datetime_as_string(values.to_numpy().astype('datetime64[{}]'.format(unit)),
+                                         unit=unit).astype(_STR)
+        else:
+            text = values.to_numpy().astype(_STR)
+            if col['type']['type'] in ['varchar', 'date', 'datetime']:
+                for char, escaped in [('\\', '\\\\'), ('\t', '\\t'),
+                                      ('\n', '\\n'), ('\r', '\\r')]:
+                    text = np.strings.replace(text, char, escaped)
+        text[mask] = '\\N'
+        fields.append(text)
+    if df.shape[0] == 0:
+        return ''
+    rows = fields[0]
+    for f in fields[1:]:
+        rows = np.strings.add(np.strings.add(rows, '\t'), f)
+    return '\n'.join(rows.tolist()) + '\n'
+
+
+def _numeric_fields(values, precision, scale):
+    """Binary payload of NUMERIC(precision, scale) values: ndigits, weight,
+    sign, dscale, then base 10000 digits, all big endian int16
+    """
+    floats = pd.to_numeric(values).to_numpy(dtype=float, na_value=0)
+    # pad the fraction to whole base 10000 digits
+    pad = (4 - scale % 4) % 4
+    frac_digits = (scale + pad) // 4
+    ndigits = max(-(-(precision + pad) // 4), frac_digits + 1)
+    if precision + pad <= 18:
+        magnitude = np.round(np.abs(floats) * 10 ** scale).astype(np.int64) * 10 ** pad
+        base = np.int64(10000)
+    else:
+        # python ints once the padded value may not fit in 64 bits, scaled
+        # from the shortest repr of the float to avoid rounding errors
+        magnitude = np.array([abs(int(Decimal(repr(f)).scaleb(scale).to_integral_value()))
+                              * 10 ** pad for f in floats.tolist()], dtype=object)
+        base = 10000
+    out = np.empty((len(floats), 4 + ndigits), dtype='>i2')
+    for i in range(ndigits - 1, -1, -1):
+        out[:, 4 + i] = (magnitude % base).astype(np.int16)
+        magnitude = magnitude // base
+    out[:, 0] = ndigits
+    out[:, 1] = ndigits - frac_digits - 1
+    out[:, 2] = np.where(floats < 0, 0x4000, 0)
+    out[:, 3] = scale
+    return out.view(np.uint8).reshape(len(floats), 2 * (4 + ndigits))
+
+
+def _binary_fields(values, col_type, mask):
+    """Binary payload of a column. Returns (bytes buffer, per row payload
+    sizes in the buffer). Fixed width types keep a dummy payload for nulls
+    """
+    datatype = col_type['type']
+    args = [int(a) for a in col_type['args']]
+    n = len(values)
+    if datatype == 'int':
+        data = pd.to_numeric(values.where(~mask, 0)).to_numpy().astype('>i8')
+        return data.view(np.uint8), np.full(n, 8)
+    elif datatype == 'decimal' and len(args) == 2:
+        data = _numeric_fields(values.where(~mask, 0), *args)
+        return data.ravel(), np.full(n, data.shape[1])
+    elif datatype == 'decimal':
+        data = pd.to_numeric(values.where(~mask, 0)).to_numpy().astype('>f8')
+        return data.view(np.uint8), np.full(n, 8)
+    elif datatype in ['date', 'datetime']:
+        stamps = pd.to_datetime(values.where(~mask, None)).to_numpy()
+        if datatype == 'date':
+            days = (stamps.astype('datetime64[D]') - _PG_EPOCH).astype(np.int64)
+            data = np.where(mask, 0, days).astype('>i4')
+            return data.view(np.uint8), np.full(n, 4)
+        micros = (stamps.astype('datetime64[us]') - _PG_EPOCH).astype(np.int64)
+        data = np.where(mask, 0, micros).astype('>i8')
+        return data.view(np.uint8), np.full(n, 8)
+    encoded = [b'' if m else str(v).encode('utf-8') for v, m in zip(values.tolist(), mask)]
+    lengths = np.array([len(e) for e in encoded], dtype=np.int64)
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), lengths
+
+
+def copy_binary(df, create_sql, header=True, trailer=True):
+    """Rows of df in PostgreSQL COPY binary format. Every row is laid out
+    in one preallocated buffer: field count, then length prefixed fields
+    (-1 for null). Ints are sent as int8, so the target columns must be
+    BIGINT as made by create_table_sql(..., 'postgres')
+    """
+    n = df.shape[0]
+    columns = create_sql['columns']
+    parts = []
+    sizes = np.full(n, 2, dtype=np.int64)
+    for col in columns:
+        values = df[col['name']].reset_index(drop=True)
+        mask = _null_mask(values)
+        data, src_lengths = _binary_fields(values, col['type'], mask)
+        lengths = np.where(mask, 0, src_lengths)
+        src_start = np.cumsum(src_lengths) - src_lengths
+        parts.append((data, src_start, lengths, mask))
+        sizes += 4 + lengths
+    row_start = np.cumsum(sizes) - sizes
+    buf = np.zeros(int(sizes.sum()), dtype=np.uint8)
+    # field count of every row
+    count = np.frombuffer(struct.pack('>h', len(columns)), dtype=np.uint8)
+    buf[row_start[:, None] + np.arange(2)] = count
+    pos = row_start + 2
+    for data, src_start, lengths, mask in parts:
+        prefix = np.where(mask, -1, lengths).astype('>i4').view(np.uint8).reshape(n, 4)
+        buf[pos[:, None] + np.arange(4)] = prefix
+        pos = pos + 4
+        total = int(lengths.sum())
+        if total:
+            keep = np.repeat(np.arange(n), lengths)
+            within = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+            buf[pos[keep] + within] = data[src_start[keep] + within]
+        pos = pos + lengths
+    out = buf.tobytes()
+    if header:
+        out = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0) + out
+    if trailer:
+        out += struct.pack('>h', -1)
+    return out
+
+
+class PostgresCopyLoader(DBAPILoader):
+    """Loads tables into PostgreSQL with COPY FROM STDIN
+    Parameters
+    ----------
+    connection: psycopg2 or psycopg (3) connection
+    fmt: str
+        'text' or 'binary' COPY format
+    """
+    def __init__(self, connection, fmt='binary', batch_size=100000):
+        if fmt not in ['text', 'binary']:
+            raise ValueError("Unknown COPY format {}, options are text and binary".format(fmt))
+        super().__init__(connection, paramstyle='format', dialect='postgres',
+                         batch_size=batch_size)
+        self.fmt = fmt
+
+    def insert(self, cursor, tablename, df, create_sql):
+        names = ','.join('"{}"'.format(c['name']) for c in create_sql['columns'])
+        statement = 'COPY "{}" ({}) FROM STDIN{}'.format(
+            tablename, names, ' WITH (FORMAT binary)' if self.fmt == 'binary' else '')
+        chunks = (copy_binary(df.iloc[b:b + self.batch_size], create_sql,
+                              header=b == 0, trailer=b + self.batch_size >= df.shape[0])
+                  if self.fmt == 'binary' else
+                  copy_text(df.iloc[b:b + self.batch_size], create_sql).encode('utf-8')
+                  for b in range(0, max(df.shape[0], 1), self.batch_size))
+        if hasattr(cursor, 'copy'):
+            # psycopg 3
+            with cursor.copy(statement) as copy:
+                for data in chunks:
+                    copy.write(data)
+        elif hasattr(cursor, 'copy_expert'):
+            # psycopg2 reads from a file like object
+            cursor.copy_expert(statement, _ChunkReader(chunks))
+        else:
+            raise ValueError("The connection does not support COPY FROM STDIN")
+
+
+class _ChunkReader():
+    """Minimal file like object over an iterator of bytes"""
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = b''
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            try:
+                self.buffer += next(self.chunks)
+            except StopIteration:
+                break
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
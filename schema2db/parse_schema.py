@@ -1,8 +1,379 @@
+"""
+Parse CREATE TABLE and ALTER TABLE statements of a sql schema file
+
+The file is read in blocks of lines and cut into statements, searching
+for what starts a comment or string or ends a statement with one
+precompiled pattern. Plain statements, the bulk of most files, are then
+matched column by column with a few more patterns; the others are cut
+into tokens and parsed from them. Parsing time and memory grow linearly
+with the file size, and statements can span any number of lines.
+Besides the table level and `alter table` constraints, inline
+`REFERENCES`, `CHECK` and `PRIMARY KEY` column clauses and "quoted",
+`backquoted` or [bracketed] identifiers are understood.
+"""
+import gc
 import re
+import functools
+
+# one alternative per token kind of a statement, whose comments are gone
+# already. Every kind starts with different characters, except the
+# catch-all \S that comes last
+_TOKEN = re.compile(r"""
+    [A-Za-z_][\w$]*(?:\.[A-Za-z_][\w$]*)*
+  | '(?:[^']|'')*'
+  | "(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\]
+  | \d+(?:\.\d*)?
+  | \S
+""", re.VERBOSE | re.DOTALL)
+# files are read in blocks of whole lines of about this many characters
+READ_BLOCK = 1 << 20
+# what starts a comment, a string or a quoted name, or ends a statement
+_STOP = re.compile(r"""--|/\*|[#'"`\[;]""")
+
+# Plain statements, the bulk of most schema files, are matched piece by
+# piece with these patterns instead of being tokenized: columns of a name,
+# a type, its numeric arguments, (not) null and a literal default, primary
+# keys, and alter table actions adding enum checks, foreign keys and
+# primary keys. Anything else is left to the tokens
+_NAME = r"""(?:[A-Za-z_][\w$]*|"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])"""
+_NUMBER = r"\d+(?:\.\d*)?"
+_NAMES = r"(\s*{0}(?:\s*,\s*{0})*\s*)".format(_NAME)
+_VALUE = r"(?:[-+]?\s*{}|'(?:[^']|'')*'|{})".format(_NUMBER, _NAME)
+_PLAIN_CREATE = re.compile(r"\s*create\s+table\s+({0})\s*\(".format(_NAME), re.I)
+_ATTRIBUTE = r"""\s+(?:(not\s+null)|(null)|default\s+(?:
+    ([-+]?)\s*({0})|('(?:[^']|'')*')|([A-Za-z_]\w*)(?!\s*\()))""".format(_NUMBER)
+_PLAIN_ATTRIBUTE = re.compile(_ATTRIBUTE, re.I | re.X)
+# a whole column, with its attributes and the comma or parenthesis after it
+_PLAIN_COLUMN = re.compile(r"""\s*({0})\s+([A-Za-z_]\w*)
+    (?:\s*\(\s*({1})\s*(?:,\s*({1})\s*)?\))?(?:\s+(signed|unsigned)\b)?
+    ((?:{2})*)\s*(?:(?P<more>,)|\)\s*$)""".format(_NAME, _NUMBER, _ATTRIBUTE), re.I | re.X)
+_PLAIN_KEY = re.compile(r"\s*primary\s+key\s*\({}\)\s*(?:(,)|\)\s*$)".format(_NAMES),
+                        re.I)
+_PLAIN_ALTER = re.compile(r"\s*alter\s+table\s+({0})\s*(\()?".format(_NAME), re.I)
+_PLAIN_ACTION = re.compile(r"""\s*add\s+(?:constraint\s+{0}\s+)?(?:
+    check\s*\(\s*({0})\s+in\s*\((\s*{2}(?:\s*,\s*{2})*\s*)\)\s*\)
+  | foreign\s+key\s*\({1}\)\s*references\s+({0})\s*(?:\({1}\))?
+  | primary\s+key\s*\({1}\))""".format(_NAME, _NAMES, _VALUE), re.I | re.X)
+# actions are separated by commas, or follow each other in a block
+_PLAIN_ACTION_END = re.compile(r"\s*(?:(,)|(?=(add)\s)|(\))?\s*$)", re.I)
+
+# sql types with the name gendata knows them by
+TYPE_ALIASES = {'integer': 'int', 'bigint': 'int', 'smallint': 'int', 'tinyint': 'int',
+                'mediumint': 'int', 'numeric': 'decimal', 'timestamp': 'datetime',
+                'char': 'varchar', 'character': 'varchar'}
+# words starting a table constraint rather than a column in create table
+_CONSTRAINT_WORDS = {'constraint', 'primary', 'foreign', 'check', 'unique', 'key',
+                     'index', 'fulltext', 'spatial', 'exclude'}
+
+
+def is_name(token):
+    """True for identifiers and keywords, quoted or not"""
+    return token[0].isalpha() or token[0] in '_"`['
+
+
+def unquote(token):
+    """Identifier without its quotes, string literal without its quotes"""
+    if token[0] == '"':
+        return token[1:-1].replace('""', '"')
+    if token[0] == "'":
+        return token[1:-1].replace("''", "'")
+    if token[0] in '`[':
+        return token[1:-1]
+    return token
+
+
+@functools.lru_cache(maxsize=256)
+def _plain_attributes(text):
+    """null and default of a column from its attributes matched by
+    _PLAIN_COLUMN. Most columns of a file share a few of them; the dict
+    is shared too, callers copy it
+    """
+    attributes = {}
+    for m in _PLAIN_ATTRIBUTE.finditer(text):
+        not_null, null, sign, number, string, word = m.groups()
+        if not_null is not None:
+            attributes['null'] = False
+        elif null is not None:
+            attributes['null'] = True
+        elif number is not None:
+            attributes['default'] = sign + number
+        else:
+            attributes['default'] = string or word
+    return attributes
+
+
+def _closing(opener, text, pos=0):
+    """Index just past the delimiter in text, from pos on, that closes an
+    open comment, string or quoted name, None if text does not close it
+    """
+    if opener == '/*':
+        end = text.find('*/', pos)
+        return None if end < 0 else end + 2
+    close = ']' if opener == '[' else opener
+    while True:
+        end = text.find(close, pos)
+        if end < 0:
+            return None
+        if opener in '\'"' and text[end + 1:end + 2] == close:
+            # a doubled quote stands for the quote itself
+            pos = end + 2
+            continue
+        return end + 1
+
+
+def read_blocks(f, size=READ_BLOCK):
+    """Blocks of whole lines of a text file, of about size characters"""
+    parts = []
+    for block in iter(lambda: f.read(size), ''):
+        end = block.rfind('\n') + 1
+        if end == 0:
+            parts.append(block)
+            continue
+        parts.append(block[:end])
+        yield ''.join(parts)
+        parts = [block[end:]]
+    if parts and parts[0]:
+        yield ''.join(parts)
+
+
+def split_statements(blocks):
+    """Text of every statement of an iterable of lines, or of blocks of
+    whole lines, split on ';'. Comments are replaced by a space, keeping
+    their line breaks so that positions in the text still tell the line.
+    A string or comment left open at the end of a block is continued in
+    the next ones, which are only searched for its end
+    Yields
+    ------
+    (line the text starts on, statement text)
+    """
+    parts = []
+    # what opened a string or comment left open, and its line
+    opener = None
+    open_line = None
+    first = 1
+    # line the block starts on
+    lineno = 1
+    for block in blocks:
+        pos = 0
+        # line of position mark of the block, counted up to it as needed
+        mark, line = 0, lineno
+        if opener is not None:
+            end = _closing(opener, block)
+            if end is None:
+                parts.append(block.count('\n') * '\n' if opener == '/*' else block)
+                lineno += block.count('\n')
+                continue
+            parts.append(' ' + block.count('\n', 0, end) * '\n' if opener == '/*'
+                         else block[:end])
+            opener = None
+            pos = end
+        while True:
+            m = _STOP.search(block, pos)
+            if m is None:
+                parts.append(block[pos:] if pos else block)
+                break
+            start = m.start()
+            stop = m.group()
+            parts.append(block[pos:start])
+            if stop == ';':
+                yield first, ''.join(parts)
+                parts = []
+                line += block.count('\n', mark, start)
+                mark = start
+                first = line
+                pos = start + 1
+            elif stop in ('--', '#'):
+                # up to the end of the line, keeping the line break
+                pos = block.find('\n', start)
+                if pos < 0:
+                    break
+            else:
+                end = _closing(stop, block, start + len(stop))
+                if end is None:
+                    # unterminated: wait for the blocks that close it
+                    opener = stop
+                    line += block.count('\n', mark, start)
+                    mark = start
+                    open_line = line
+                    parts.append(block.count('\n', start) * '\n' if stop == '/*'
+                                 else block[start:])
+                    break
+                parts.append(' ' + block.count('\n', start, end) * '\n' if stop == '/*'
+                             else block[start:end])
+                pos = end
+        lineno += block.count('\n')
+    if opener is not None:
+        raise ValueError("Unterminated {} starting on line {}".format(
+            'comment' if opener == '/*' else 'quote', open_line))
+    if parts:
+        yield first, ''.join(parts)
+
+
+class _Source():
+    """Text of a statement, telling the line of a token for error messages"""
+    def __init__(self, text, first_line):
+        self.text = text
+        self.first_line = first_line
+        self.offsets = None
+
+    def line(self, index):
+        if self.offsets is None:
+            # only worked out when there is an error to report
+            self.offsets = [m.start() for m in _TOKEN.finditer(self.text)]
+        if not self.offsets:
+            return self.first_line
+        offset = self.offsets[min(index, len(self.offsets) - 1)]
+        return self.first_line + self.text.count('\n', 0, offset)
+
+
+class _Cursor():
+    """Position in the tokens of one statement, or a part of it"""
+    def __init__(self, tokens, lowered, source, base=0):
+        self.tokens = tokens
+        # keywords are compared lower cased; quoted tokens keep their
+        # quotes and never match one
+        self.lowered = lowered
+        # the statement, and the index of the first token in it
+        self.source = source
+        self.base = base
+        self.pos = 0
+
+    @classmethod
+    def statement(cls, text, first_line=1):
+        """_Cursor over the tokens of a statement text (see split_statements)"""
+        tokens = _TOKEN.findall(text)
+        lowered = _TOKEN.findall(text.lower())
+        if len(lowered) != len(tokens):
+            # lower casing changed the length of a non ascii name
+            lowered = [t.lower() for t in tokens]
+        return cls(tokens, lowered, _Source(text, first_line))
+
+    def part(self, start, stop):
+        """_Cursor over tokens start..stop-1"""
+        return _Cursor(self.tokens[start:stop], self.lowered[start:stop],
+                       self.source, self.base + start)
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def line(self, pos=None):
+        """Line of the current token (or of token pos), for error messages"""
+        return self.source.line(self.base + (self.pos if pos is None else pos))
+
+    def peek(self, ahead=0):
+        i = self.pos + ahead
+        return self.tokens[i] if i < len(self.tokens) else None
+
+    def peek_lower(self):
+        return self.lowered[self.pos] if self.pos < len(self.tokens) else None
+
+    def next(self):
+        if self.pos >= len(self.tokens):
+            raise ValueError("Unexpected end of statement on line {}".format(self.line()))
+        self.pos += 1
+        return self.tokens[self.pos - 1]
+
+    def at_end(self):
+        return self.pos >= len(self.tokens)
+
+    def at_word(self, *words):
+        """True if the next tokens are these keywords"""
+        if len(words) == 1:
+            return self.pos < len(self.lowered) and self.lowered[self.pos] == words[0]
+        return tuple(self.lowered[self.pos:self.pos + len(words)]) == words
+
+    def accept(self, *words):
+        """Skip the keywords if they come next"""
+        if self.at_word(*words):
+            self.pos += len(words)
+            return True
+        return False
+
+    def at_punct(self, char):
+        return self.pos < len(self.tokens) and self.tokens[self.pos] == char
+
+    def expect_punct(self, char):
+        t = self.next()
+        if t != char:
+            self.pos -= 1
+            raise ValueError("Expected '{}' on line {}, got {}".format(char, self.line(), t))
+
+    def identifier(self):
+        t = self.next()
+        if not is_name(t):
+            self.pos -= 1
+            raise ValueError("Expected a name on line {}, got {}".format(self.line(), t))
+        return unquote(t)
+
+    def group_tokens(self):
+        """Tokens inside the parentheses that come next"""
+        self.expect_punct('(')
+        start = self.pos
+        tokens = self.tokens
+        try:
+            end = tokens.index(')', start)
+        except ValueError:
+            end = -1
+        if end >= 0 and '(' not in tokens[start:end]:
+            # no nested parentheses, the usual case
+            self.pos = end + 1
+            return tokens[start:end]
+        depth = 1
+        for i in range(start, len(tokens)):
+            t = tokens[i]
+            if t == '(':
+                depth += 1
+            elif t == ')':
+                depth -= 1
+                if depth == 0:
+                    self.pos = i + 1
+                    return tokens[start:i]
+        self.pos = start - 1
+        raise ValueError("Unbalanced parentheses on line {}".format(self.line()))
+
+    def group(self):
+        """_Cursor over the tokens inside the parentheses that come next"""
+        tokens = self.group_tokens()
+        return self.part(self.pos - len(tokens) - 1, self.pos - 1)
+
+    def names(self):
+        """Identifiers of a parenthesized list, e.g. (a, b)"""
+        return [unquote(t) for t in self.group_tokens() if is_name(t)]
+
+    def split_commas(self):
+        """_Cursors over the rest of the tokens, between top level commas"""
+        parts = []
+        depth = 0
+        start = self.pos
+        tokens = self.tokens
+        for i in range(self.pos, len(tokens)):
+            t = tokens[i]
+            if t == '(':
+                depth += 1
+            elif t == ')':
+                depth -= 1
+            elif t == ',' and depth == 0:
+                parts.append(self.part(start, i))
+                start = i + 1
+        parts.append(self.part(start, len(tokens)))
+        self.pos = len(tokens)
+        return parts
+
+    def text(self):
+        return ' '.join(self.tokens)
+
 
 class SchemaParser():
-    def __init__(self):
-        pass
+    """
+    Parameters
+    ----------
+    skip_unsupported: bool
+        skip statements other than CREATE TABLE and ALTER TABLE (indexes,
+        views, SET ...) and unsupported ALTER TABLE actions instead of
+        raising NotImplementedError
+    """
+    def __init__(self, skip_unsupported=False):
+        self.skip_unsupported = skip_unsupported
 
     def extract_sql_doc(self, inputfile):
         """ Extract sql components from the entire document
@@ -15,138 +386,409 @@ class SchemaParser():
         Parsed sql components
         """
         with open(inputfile, 'r') as f:
-            inputstr = f.read()
-        blocks = self._clean_doc(inputstr).split(";\n")
+            return self.extract_sql_lines(read_blocks(f))
+
+    def extract_sql_string(self, doc):
+        """Parse sql components from a string, see extract_sql_doc"""
+        return self.extract_sql_lines([doc])
+
+    def extract_sql_lines(self, lines):
+        """Parse sql components from an iterable of lines, or of blocks of
+        whole lines, see extract_sql_doc
+        """
+        # a schema is many small dicts and lists, collecting garbage while
+        # they are made takes longer than making them
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self._extract(lines)
+        finally:
+            if enabled:
+                gc.enable()
+
+    def _extract(self, lines):
         components = {'create': {}, 'alter': {}}
-        for b in blocks:
-            ops, extracted = self.extract_sql_block(b)
-            if components[ops].get(extracted.get('tablename')):
-                raise ValueError("Duplicated blocks {} for {}".format(ops,
-                                                                      extracted.get('tablename')))
+        # primary keys added with alter table, moved to their create block
+        added_keys = {}
+        for first_line, text in split_statements(lines):
+            parsed = self._parse_plain(text)
+            if parsed is None:
+                statement = _Cursor.statement(text, first_line)
+                if not len(statement):
+                    continue
+                parsed = self.parse_statement(statement)
+                if parsed is None:
+                    continue
+            ops, extracted = parsed
+            name = extracted['tablename']
+            if ops == 'create':
+                if name in components['create']:
+                    raise ValueError("Duplicated blocks create for {}".format(name))
+                inline = extracted.pop('constraints')
+                components['create'][name] = extracted
+                if inline['check'] or inline['foreign_keys']:
+                    self._merge_alter(components['alter'], inline)
             else:
-                components[ops][extracted['tablename']] = extracted
+                added_keys.setdefault(name, []).extend(extracted.pop('primary_keys', []))
+                self._merge_alter(components['alter'], extracted)
+        for name, keys in added_keys.items():
+            if keys:
+                if name not in components['create']:
+                    raise ValueError("Primary key added to {}, which is never created"
+                                     .format(name))
+                primary_keys = components['create'][name]['primary_keys']
+                primary_keys.extend(k for k in dict.fromkeys(keys) if k not in primary_keys)
+        self._resolve_references(components)
+        # a constraint declared inline and again with alter table counts once
+        for constraints in components['alter'].values():
+            for kind in ['check', 'foreign_keys']:
+                seen = set()
+                unique = []
+                for constraint in constraints[kind]:
+                    key = tuple((k, tuple(v) if isinstance(v, list) else v)
+                                for k, v in sorted(constraint.items()))
+                    if key not in seen:
+                        seen.add(key)
+                        unique.append(constraint)
+                constraints[kind] = unique
         return components
 
     def extract_sql_block(self, block):
         """ Parse a block of sql commands and return corresponding
         sql components
         """
-        operation = block.split()[0].lower()
-        if operation == 'create':
-            return 'create', self.parse_create_block(block)
-        elif operation == 'alter':
-            return 'alter', self.parse_alter_block(block)
-        else:
-            raise NotImplementedError("{} operation not supported".format(operation))
+        statements = [_Cursor.statement(text, first_line) for first_line, text
+                      in split_statements([block])]
+        statements = [s for s in statements if len(s)]
+        if len(statements) != 1:
+            raise ValueError("Expected one statement, got {}".format(len(statements)))
+        parsed = self.parse_statement(statements[0])
+        if parsed and parsed[0] == 'create':
+            parsed[1].pop('constraints')
+        return parsed
+
+    def parse_statement(self, cursor):
+        """('create' or 'alter', parsed table) of a statement (see
+        split_statements), or None for a skipped statement
+        """
+        if cursor.accept('create'):
+            cursor.accept('temporary') or cursor.accept('temp')
+            if cursor.accept('table'):
+                return 'create', self._parse_create(cursor)
+        elif cursor.accept('alter', 'table'):
+            return 'alter', self._parse_alter(cursor)
+        if self.skip_unsupported:
+            return None
+        raise NotImplementedError("{} operation not supported (line {})".format(
+            ' '.join(cursor.tokens[:2]), cursor.line(0)))
+
+    @staticmethod
+    def _names(text):
+        """Identifiers of a comma separated list"""
+        return [unquote(t) for t in _TOKEN.findall(text) if is_name(t)]
+
+    def _parse_plain(self, text):
+        """parse_statement of a plain statement (see _PLAIN_CREATE and
+        _PLAIN_ALTER) straight from its text, None for any other statement
+        """
+        m = _PLAIN_CREATE.match(text)
+        if m is not None:
+            return self._parse_plain_create(text, m)
+        m = _PLAIN_ALTER.match(text)
+        if m is not None:
+            return self._parse_plain_alter(text, m)
+        return None
+
+    def _parse_plain_create(self, text, m):
+        name = unquote(m.group(1))
+        table = {'columns': [], 'primary_keys': [], 'tablename': name,
+                 'operation': 'create',
+                 'constraints': {'check': [], 'foreign_keys': [], 'tablename': name}}
+        while True:
+            pos = m.end()
+            m = _PLAIN_COLUMN.match(text, pos)
+            if m is None:
+                m = _PLAIN_KEY.match(text, pos)
+                if m is None:
+                    return None
+                table['primary_keys'].extend(self._names(m.group(1)))
+                if m.group(2) is None:
+                    return 'create', table
+                continue
+            colname, datatype, first, second, signed, attributes = m.groups()[:6]
+            datatype = datatype.lower()
+            if colname.lower() in _CONSTRAINT_WORDS or \
+                    datatype in ('character', 'char', 'double'):
+                return None
+            strtype = {'type': TYPE_ALIASES.get(datatype, datatype),
+                       'args': [a for a in (first, second) if a is not None]}
+            if signed is not None:
+                strtype['signed'] = signed.lower() == 'signed'
+            column = {'name': unquote(colname), 'type': strtype, 'null': None}
+            if attributes:
+                column.update(_plain_attributes(attributes))
+            table['columns'].append(column)
+            if m.group('more') is None:
+                return 'create', table
+
+    def _parse_plain_alter(self, text, m):
+        name = unquote(m.group(1))
+        constraints = {'check': [], 'foreign_keys': [], 'tablename': name,
+                       'operation': 'alter'}
+        block = m.group(2) is not None
+        while True:
+            m = _PLAIN_ACTION.match(text, m.end())
+            if m is None:
+                return None
+            column, values, columns, referenced, sources, keys = m.groups()
+            if column is not None:
+                tokens = _TOKEN.findall(values)
+                values = ''.join(unquote(t) if t != ',' else '\0' for t in tokens)
+                constraints['check'].append({'type': 'enum', 'column': unquote(column),
+                                             'values': values.split('\0')})
+            elif referenced is not None:
+                columns = self._names(columns)
+                sources = self._names(sources) if sources is not None \
+                    else [None] * len(columns)
+                if len(sources) != len(columns):
+                    return None
+                constraints['foreign_keys'].extend(
+                    {'column': c, 'source_column': s, 'referenced': unquote(referenced)}
+                    for c, s in zip(columns, sources))
+            else:
+                constraints.setdefault('primary_keys', []).extend(self._names(keys))
+            m = _PLAIN_ACTION_END.match(text, m.end())
+            if m is None:
+                return None
+            comma, action, closing = m.groups()
+            if comma is None and action is None:
+                return ('alter', constraints) if (closing is not None) == block else None
 
     def parse_create_block(self, sql_str):
-        lines = sql_str.split('\n')
-        table = {'columns': [], 'primary_keys': [],
-                 'tablename': self._get_table_name(lines[0]),
-                 'operation': 'create'}
-        for l in lines[1:]:
-            if 'primary key' in l.lower():
-                table['primary_keys'].extend(self._parse_keys(l))
-            elif re.findall("[a-zA-Z]+", l):
-                table['columns'].append(self._parse_items(l))
-        return table
+        return self.extract_sql_block(sql_str)[1]
 
     def parse_alter_block(self, sql_cmds):
-        lines = sql_cmds.split('\n')
-        constraints = {'check': [], 'foreign_keys': [],
-                       'tablename': self._get_table_name(lines[0]),
-                       'operation': 'alter'}
-        for l in lines[1:]:
-            tokens = l.split()
-            if len(tokens) <= 2 or len(tokens[2]) < 3:
-                continue
-            try:
-                if tokens[2][:3].lower() == 'fk_':
-                    constraints['foreign_keys'].append(self._parse_references(l))
-                elif tokens[2][:3].lower() == 'chk':
-                    constraints['check'].append(self._parse_check(l))
-            except: # noqa
-                continue
-        return constraints
+        return self.extract_sql_block(sql_cmds)[1]
+
+    @staticmethod
+    def _merge_alter(alter, constraints):
+        name = constraints['tablename']
+        if name not in alter:
+            alter[name] = {'check': [], 'foreign_keys': [],
+                           'tablename': name, 'operation': 'alter'}
+        alter[name]['check'].extend(constraints['check'])
+        alter[name]['foreign_keys'].extend(constraints['foreign_keys'])
+
+    @staticmethod
+    def _resolve_references(components):
+        """Point 'REFERENCES table' without columns at the table's primary key"""
+        for constraints in components['alter'].values():
+            for fk in constraints['foreign_keys']:
+                if fk['source_column'] is None:
+                    referenced = components['create'].get(fk['referenced'])
+                    if not referenced or len(referenced['primary_keys']) != 1:
+                        raise ValueError("Cannot tell which column of {} {}.{} references"
+                                         .format(fk['referenced'], constraints['tablename'],
+                                                 fk['column']))
+                    fk['source_column'] = referenced['primary_keys'][0]
 
-    def _clean_doc(self, doc):
-        """clean out extra spaces and comment lines
+    def _parse_create(self, cursor):
+        cursor.accept('if', 'not', 'exists')
+        name = cursor.identifier()
+        table = {'columns': [], 'primary_keys': [], 'tablename': name,
+                 'operation': 'create',
+                 'constraints': {'check': [], 'foreign_keys': [], 'tablename': name}}
+        # table options after the column list (ENGINE=...) are ignored
+        for part in cursor.group().split_commas():
+            if len(part):
+                self._parse_definition(part, table)
+        return table
+
+    @staticmethod
+    def _at_constraint(cursor):
+        """True if a definition of a create statement is a table constraint.
+        key, index, unique, ... are also legal column names; they only
+        start a constraint when followed by '(', a keyword, or an index
+        name and its columns
         """
-        lines = doc.split('\n')
-        lines = [" ".join(l.split()) for l in lines
-                 if l and not l.isspace() and l.split()[0] != '--']
-        return '\n'.join(lines)
-
-    def _get_table_name(self, line):
-        words = line.split()
-        if words[1].lower() != 'table'.lower():
-            raise ValueError("You can only create tables, not {}".format(words[1]))
+        word = cursor.peek_lower()
+        if word not in _CONSTRAINT_WORDS:
+            return False
+        after = (cursor.peek(1) or '').lower()
+        if word == 'constraint':
+            return True
+        if word in ('primary', 'foreign'):
+            return after == 'key'
+        if after in ('(', 'key', 'index', 'using'):
+            return word != 'check' or after == '('
+        # KEY idx (a, b) names the columns, a type such as varchar(20) has
+        # numbers in its parentheses
+        inner = cursor.peek(3)
+        return word != 'check' and is_name(after) and cursor.peek(2) == '(' and \
+            inner is not None and is_name(inner)
+
+    def _parse_definition(self, cursor, table):
+        """A column or a table constraint of a create statement"""
+        constraints = table['constraints']
+        if not self._at_constraint(cursor):
+            table['columns'].append(self._parse_column(cursor, table))
+            return
+        if cursor.accept('constraint'):
+            cursor.identifier()
+        if cursor.accept('primary', 'key'):
+            table['primary_keys'].extend(cursor.names())
+        elif cursor.accept('foreign', 'key'):
+            columns = cursor.names()
+            constraints['foreign_keys'].extend(self._parse_references(cursor, columns))
+        elif cursor.accept('check'):
+            constraints['check'].append(self._parse_check(cursor.group()))
+        elif cursor.peek_lower() in _CONSTRAINT_WORDS:
+            # unique constraints and indexes do not change the data
+            pass
         else:
-            return words[2]
-
-    def _extract_datatype(self, words):
-        strtype = {}
-        next_pos = 1
-        strtype['type'] = (re.findall("[a-zA-Z]+", words[0]))[0].lower()
-        strtype['args'] = re.findall("[0-9]+", words[0])
-        if len(words) > 1 and words[1].lower() == 'signed':
+            raise ValueError("Expected a column or a table constraint on line {}, "
+                             "got {}".format(cursor.line(), cursor.text()))
+
+    def _parse_column(self, cursor, table):
+        name = cursor.identifier()
+        column = {'name': name, 'type': self._parse_type(cursor), 'null': None}
+        while not cursor.at_end():
+            word = cursor.peek_lower()
+            if word == 'not' and cursor.accept('not', 'null'):
+                column['null'] = False
+            elif word == 'null':
+                cursor.next()
+                column['null'] = True
+            elif word == 'default':
+                cursor.next()
+                column['default'] = self._parse_default(cursor)
+            elif word == 'primary' and cursor.accept('primary', 'key'):
+                table['primary_keys'].append(name)
+            elif word == 'references':
+                table['constraints']['foreign_keys'].extend(
+                    self._parse_references(cursor, [name]))
+            elif word == 'check':
+                cursor.next()
+                table['constraints']['check'].append(self._parse_check(cursor.group()))
+            elif word == '(':
+                cursor.group_tokens()
+            else:
+                cursor.next()
+        return column
+
+    def _parse_type(self, cursor):
+        t = cursor.next()
+        if not t[0].isalpha():
+            cursor.pos -= 1
+            raise ValueError("Expected a data type on line {}, got {}".format(cursor.line(), t))
+        datatype = t.lower()
+        if datatype in ('character', 'char') and cursor.accept('varying'):
+            datatype = 'varchar'
+        elif datatype == 'double':
+            cursor.accept('precision')
+        strtype = {'type': TYPE_ALIASES.get(datatype, datatype), 'args': []}
+        if cursor.at_punct('('):
+            strtype['args'] = [a for a in cursor.group_tokens() if a[0].isdigit()]
+        word = cursor.peek_lower()
+        if word == 'signed':
             strtype['signed'] = True
-            next_pos += 1
-        elif len(words) > 1 and words[1].lower() == 'unsigned':
+            cursor.next()
+        elif word == 'unsigned':
             strtype['signed'] = False
-            next_pos += 1
-        return strtype, words[next_pos:]
-
-    def _extract_null(self, words):
-        ifnull = None
-        if 'not null' in " ".join([s.lower() for s in words]):
-            ifnull = False
-        elif 'null' in " ".join([s.lower() for s in words]):
-            ifnull = True
-        return ifnull
-
-    def _extract_default(self, words):
-        lower_cased = [w.lower() for w in words]
-        if 'default' in lower_cased:
-            idx = lower_cased.index('default')
-            if len(words) > idx + 1:
-                return words[idx+1]
-        return None
+            cursor.next()
+        return strtype
+
+    @staticmethod
+    def _parse_default(cursor):
+        text = cursor.next()
+        if text in ('-', '+') and not cursor.at_end():
+            text += cursor.next()
+        elif cursor.at_punct('('):
+            # a function call such as now()
+            text += '(' + cursor.group().text() + ')'
+        return text
 
-    def _parse_items(self, l):
-        c = l.split()
-        cmds = []
-        cmds = {'name': c[0]}
-        cmds['type'], cmd_remaining = self._extract_datatype(c[1:])
-        cmds['null'] = self._extract_null(cmd_remaining)
-        default_value = self._extract_default(cmd_remaining)
-        if default_value:
-            cmds['default'] = default_value
-        return cmds
-
-    def _parse_keys(self, l):
-        tokens = re.findall("[a-zA-Z0-9]+", l)
-        return [t for t in tokens if t.lower() not in('primary', 'key')]
-
-    def _clean_token(self, s):
-        return re.sub(r'\W+', '', s)
-
-    def _parse_references(self, l):
-        """Extract foreign keys. This piece of code isn't riguous at all
-        TODO: make this method more generalized
+    def _parse_references(self, cursor, columns):
+        """Foreign keys of columns from a REFERENCES clause"""
+        if not cursor.accept('references'):
+            raise ValueError("Expected REFERENCES on line {}".format(cursor.line()))
+        referenced = cursor.identifier()
+        sources = cursor.names() if cursor.at_punct('(') else [None] * len(columns)
+        if len(sources) != len(columns):
+            raise ValueError("Foreign key ({}) references {} columns of {}".format(
+                ', '.join(columns), len(sources), referenced))
+        # ON DELETE/UPDATE, MATCH and DEFERRABLE options
+        while True:
+            if cursor.accept('on'):
+                cursor.next()
+                if not (cursor.accept('set', 'null') or cursor.accept('set', 'default') or
+                        cursor.accept('no', 'action') or cursor.accept('cascade') or
+                        cursor.accept('restrict')):
+                    raise ValueError("Unknown foreign key action on line {}".format(
+                        cursor.line()))
+            elif cursor.accept('match') or cursor.accept('initially'):
+                cursor.next()
+            elif not (cursor.accept('not', 'deferrable') or cursor.accept('deferrable')):
+                break
+        return [{'column': c, 'source_column': s, 'referenced': referenced}
+                for c, s in zip(columns, sources)]
+
+    @staticmethod
+    def _parse_check(cursor):
+        """An enum check, `column IN (values)`, or any other expression kept
+        as its sql text
         """
-        tokens = l.split()
-        return {'column': self._clean_token(tokens[-4]),
-                'source_column': self._clean_token(tokens[-1]),
-                'referenced': tokens[-2]}
+        tokens = cursor.tokens
+        if len(tokens) >= 3 and is_name(tokens[0]) and cursor.lowered[1] == 'in' and \
+                tokens[2] == '(':
+            cursor.pos = 2
+            values = [''.join(unquote(t) for t in part.tokens)
+                      for part in cursor.group().split_commas() if len(part)]
+            if cursor.at_end():
+                return {'type': 'enum', 'column': unquote(tokens[0]), 'values': values}
+        return {'type': 'expression', 'column': None, 'sql': ' '.join(tokens)}
 
-    def _parse_check(self, l):
-        tokens = l.split()
-        try:
-            indx = [t.lower() for t in tokens].index('in')
-        except ValueError:
-            raise ValueError("Please check the grammar for CHECK")
-        column = self._clean_token(tokens[indx-1])
-        candidate_values = ' '.join(tokens[indx+1:]).split(",")
-        values = [t.rstrip(" )';").lstrip(" ('") for t in candidate_values]
-        return {'type': 'enum', 'column': column, 'values': values}
+    def _parse_alter(self, cursor):
+        cursor.accept('only')
+        cursor.accept('if', 'exists')
+        name = cursor.identifier()
+        constraints = {'check': [], 'foreign_keys': [], 'tablename': name,
+                       'operation': 'alter'}
+        if cursor.at_punct('('):
+            # alter table t ( add constraint ... add constraint ... )
+            cursor = cursor.group()
+        while not cursor.at_end():
+            if cursor.at_punct(','):
+                cursor.next()
+                continue
+            start = cursor.pos
+            if not cursor.accept('add'):
+                self._unsupported_alter(cursor, start)
+                continue
+            if cursor.accept('constraint'):
+                cursor.identifier()
+            if cursor.accept('primary', 'key'):
+                constraints.setdefault('primary_keys', []).extend(cursor.names())
+            elif cursor.accept('foreign', 'key'):
+                columns = cursor.names()
+                constraints['foreign_keys'].extend(self._parse_references(cursor, columns))
+            elif cursor.accept('check'):
+                constraints['check'].append(self._parse_check(cursor.group()))
+                cursor.accept('not', 'valid')
+            else:
+                self._unsupported_alter(cursor, start)
+        return constraints
+
+    def _unsupported_alter(self, cursor, start):
+        if not self.skip_unsupported:
+            raise NotImplementedError("Unsupported alter table action on line {}: {}"
+                                      .format(cursor.line(start), cursor.tokens[start]))
+        if cursor.pos == start:
+            cursor.next()
+        # up to the next action, with or without a comma in between
+        while not cursor.at_end() and not cursor.at_punct(',') and \
+                not cursor.at_word('add'):
+            if cursor.at_punct('('):
+                cursor.group()
+            else:
+                cursor.next()
@@ -1,18 +1,20 @@
+import os
 import random
 import string
-import requests
-import re
+import numpy as np
 
-# https://stackoverflow.com/questions/18834636/random-word-generator-python
+# Word list used to build varchar values. It ships with the package as a
+# newline separated ascii file (the FreeBSD web2 dictionary, letters only)
+# and is only read the first time a varchar is generated. Point
+# SCHEMA2DB_WORDS to another file to use a different corpus.
+WORDS_PATH = os.environ.get('SCHEMA2DB_WORDS',
+                            os.path.join(os.path.dirname(__file__), 'data', 'words.txt'))
 
-word_site = "http://svnweb.freebsd.org/csrg/share/dict/words?view=co&content-type=text/plain"
-
-
-response = requests.get(word_site)
-WORDS = response.content.splitlines()
-WORDS = [' '.join(re.findall("[a-zA-Z]+", str(w, 'utf-8'))) for w in WORDS]
 SUPPORTED_TYPE = ['varchar', 'int', 'decimal', 'date']
 
+# share of nulls in a nullable column unless told otherwise
+NULL_RATE = 0.2
+
 
 def random_int(lower=-10000, upper=10000, signed=True):
     """Random integer"""
@@ -35,8 +37,9 @@ def random_varchar(length=10, superrandom=False):
         w = ''
         num = int(length/20) + 1
         num = 2
+        words = get_words()
         for i in range(num):
-            w += random.choice(WORDS) + ' '
+            w += words[random.randrange(len(words))] + ' '
         w = w.strip()
         return w[:min(len(w), length)]
 
@@ -69,8 +72,10 @@ def random_decimal(total_dig=8, right_dig=6, signed=True):
 
 
 def random_date():
-    """Random date"""
-    return "{}-{}-{}".format(random.randint(1900, 2025),
+    """Random date as a zero padded 'YYYY-MM-DD' string, as
+    random_date_array dates print
+    """
+    return "{:04d}-{:02d}-{:02d}".format(random.randint(1900, 2025),
                              random.randint(1, 12),
                              random.randint(1, 28))
 
@@ -105,6 +110,171 @@ def random_list(datatype='int', args=None, signed=True, length=50):
         raise ValueError("Data type {} currently not supported".format(datatype))
 
 
+# ============== Batched generators ====== #
+# The functions below fill a whole column at once with a
+# numpy.random.Generator instead of calling the scalar version per row.
+
+def random_int_array(size, lower=-10000, upper=10000, signed=True, rng=None):
+    """Array of random integers, same range as random_int"""
+    rng = rng or np.random.default_rng()
+    if not signed:
+        lower = 0
+    return rng.integers(lower, upper, size=size, endpoint=True)
+
+
+def random_varchar_array(size, length=10, superrandom=False, rng=None):
+    """Array of random varchar strings, same rules as random_varchar"""
+    rng = rng or np.random.default_rng()
+    if superrandom:
+        alphabet = np.frombuffer((string.ascii_lowercase + ' ').encode(), dtype=np.uint8)
+        width = max(min(length, 20), 1)
+        lengths = rng.integers(1, width, size=size, endpoint=True)
+        chars = alphabet[rng.integers(0, len(alphabet), size=(size, width))]
+        chars[np.arange(width) >= lengths[:, None]] = 0
+        return chars.view('S{}'.format(width)).ravel().astype(str)
+    words = get_words()
+    first = words.sample(size, rng)
+    second = words.sample(size, rng)
+    return words.join(first, second, max(length, 1))
+
+
+def random_decimal_array(size, total_dig=8, right_dig=6, signed=True, rng=None):
+    """Array of random decimal floats
+    The values are drawn as fixed-point integers scaled by 10 ** right_dig,
+    so every value has at most total_dig digits
+    """
+    if total_dig < right_dig:
+        raise ValueError("Invalid decimal format decimal({}, {})".format(total_dig, right_dig))
+    rng = rng or np.random.default_rng()
+    bound = 10 ** total_dig - 1
+    lower = -bound if signed else 0
+    if bound < 2 ** 63:
+        scaled = rng.integers(lower, bound, size=size, endpoint=True)
+    else:
+        scaled = np.floor(rng.uniform(lower, bound, size=size))
+    return scaled / 10 ** right_dig
+
+
+def random_date_array(size, rng=None):
+    """Array of random datetime64[D] dates, same range as random_date"""
+    rng = rng or np.random.default_rng()
+    years = rng.integers(1900, 2025, size=size, endpoint=True)
+    months = rng.integers(1, 12, size=size, endpoint=True)
+    days = rng.integers(1, 28, size=size, endpoint=True)
+    first = ((years - 1970) * 12 + months - 1).astype('datetime64[M]')
+    return first.astype('datetime64[D]') + (days - 1)
+
+
+def random_null_mask(size, rate=NULL_RATE, rng=None):
+    """Boolean array, True for the rows that should be null. Each row is
+    null with probability rate
+    """
+    if not 0 <= rate <= 1:
+        raise ValueError("Null rate must be between 0 and 1, got {}".format(rate))
+    rng = rng or np.random.default_rng()
+    return rng.random(size) < rate
+
+
+def random_array(datatype='int', args=None, signed=True, length=50, rng=None):
+    """Random numpy array of given data type. Batched version of random_list
+    Parameters
+       datatype (str): data type, options are ['int', 'varchar', 'decimal', 'date']
+       args (list): arguments for this data type
+       signed (bool): whether the number should be signed.
+          Only valid for int and decimal
+       length (int): length of the array
+       rng (numpy.random.Generator): source of randomness
+    Returns
+       A numpy array of given type
+    """
+    dtype = datatype.lower()
+    if dtype == 'int':
+        return random_int_array(length, signed=signed, rng=rng)
+    elif dtype == 'varchar':
+        if len(args) != 1:
+            raise ValueError("Invalid arguments ({}) for varchar".format(args))
+        return random_varchar_array(length, length=args[0], rng=rng)
+    elif dtype == 'decimal':
+        if len(args) != 2:
+            raise ValueError("Invalid arguments ({}) for varchar".format(args))
+        return random_decimal_array(length, total_dig=args[0],
+                                    right_dig=args[1],
+                                    signed=signed, rng=rng)
+    elif dtype == 'date' or dtype == 'datetime':
+        return random_date_array(length, rng=rng)
+    else:
+        raise ValueError("Data type {} currently not supported".format(datatype))
+
+
+class WordCorpus():
+    """Word list kept as one contiguous, memory-mapped byte buffer plus an
+    array of word offsets, so sampling never creates a python str per word
+    """
+    def __init__(self, path=WORDS_PATH):
+        self.buffer = np.memmap(path, dtype=np.uint8, mode='r')
+        ends = np.flatnonzero(self.buffer == ord('\n'))
+        if len(self.buffer) and self.buffer[-1] != ord('\n'):
+            ends = np.append(ends, len(self.buffer))
+        starts = np.concatenate(([0], ends[:-1] + 1))
+        keep = ends > starts
+        self.starts = starts[keep]
+        self.lengths = (ends - starts)[keep]
+        if len(self.starts) == 0:
+            raise ValueError("Word list {} is empty".format(path))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i):
+        start = self.starts[i]
+        return bytes(self.buffer[start:start + self.lengths[i]]).decode('ascii')
+
+    def sample(self, size, rng=None):
+        """Indices of size randomly chosen words"""
+        rng = rng or np.random.default_rng()
+        return rng.integers(0, len(self), size=size)
+
+    def join(self, first, second, width, batch=1 << 16):
+        """Vectorized equivalent of (words[first] + ' ' + words[second])[:width]
+        Returns a fixed width unicode array
+        """
+        width = int(min(width, 2 * self.lengths.max() + 1))
+        out = np.zeros((len(first), width), dtype=np.uint8)
+        pos = np.arange(width)
+        last = len(self.buffer) - 1
+        for b in range(0, len(first), batch):
+            l1 = self.lengths[first[b:b + batch]][:, None]
+            s1 = self.starts[first[b:b + batch]][:, None]
+            l2 = self.lengths[second[b:b + batch]][:, None]
+            s2 = self.starts[second[b:b + batch]][:, None]
+            in_first = pos < l1
+            in_second = (pos > l1) & (pos - l1 - 1 < l2)
+            src = np.where(in_first, s1 + pos, s2 + pos - l1 - 1)
+            chars = np.where(in_first | in_second, self.buffer[np.clip(src, 0, last)], 0)
+            # the separating space is dropped when the cut falls right after it
+            chars[(pos == l1) & (l1 + 1 < width)] = ord(' ')
+            out[b:b + batch] = chars
+        return out.view('S{}'.format(width)).ravel().astype(str)
+
+
+_WORDS = None
+
+
+def get_words():
+    """Return the word corpus, loading it on first use"""
+    global _WORDS
+    if _WORDS is None:
+        _WORDS = WordCorpus(WORDS_PATH)
+    return _WORDS
+
+
+def __getattr__(name):
+    # WORDS used to be a module level list filled at import time
+    if name == 'WORDS':
+        return get_words()
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
 def gen_null(entry, threshold=0.8):
     """Randomly return null or the input as is"""
     if random.random() > threshold:
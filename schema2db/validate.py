@@ -0,0 +1,347 @@
+"""
+Check that tables satisfy the constraints of their schema
+
+Tables are fed chunk by chunk, so outputs larger than memory can be
+checked from their files. Each chunk is checked column by column with
+vectorized operations:
+
+- not null: columns declared not null, and primary key columns
+- check: enum checks (c in (...)), other check expressions are skipped
+- primary key: uniqueness of every key. Keys are compared by a 64 bit
+  hash, and the rows whose hashes collide are read again to compare
+  their values
+- foreign key: every non-null value is a value of the referenced column
+- exclusive: tables of an exclusive_list share no value of exclude_on
+- missing table: a table of the schema without a file, for exported folders
+
+Primary key hashes (8 bytes per row) and the distinct values of foreign
+key, referenced and exclusive columns are kept until finish(), so tables
+can be fed in any order. Values are compared after normalization, whole
+numbers as int64 and anything else as text, so the same value matches
+whichever dtype its file or dataframe stored it with.
+
+    python -m schema2db.validate schema.sql outputfolder/
+"""
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+import schema2db.export as export
+from schema2db.gendata import DBGenerator, STATE_FILE
+
+SAMPLES = 5
+
+
+def normalize(values):
+    """Values as int64 when they are all whole numbers, as strings
+    otherwise. Returns (values, null mask), nulls are 0 or ''
+    """
+    values = pd.Series(values)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        values = pd.Series(np.asarray(values, dtype=object))
+    isnull = values.isna().to_numpy(dtype=bool)
+    kind = pd.api.types.infer_dtype(values, skipna=True)
+    if kind in ['integer', 'empty']:
+        return values.where(~isnull, 0).to_numpy(dtype=np.int64), isnull
+    if kind in ['floating', 'mixed-integer-float', 'decimal']:
+        floats = values.where(~isnull, 0).to_numpy(dtype=float)
+        if np.isfinite(floats).all() and (floats == np.floor(floats)).all():
+            return floats.astype(np.int64), isnull
+    return values.astype(str).where(~isnull, '').to_numpy(dtype=object), isnull
+
+
+def hash_rows(df, columns):
+    """uint64 hash of the normalized values of columns in every row"""
+    normalized = pd.DataFrame({c: normalize(df[c])[0] for c in columns})
+    return pd.util.hash_pandas_object(normalized, index=False).to_numpy()
+
+
+class _Distinct():
+    """Distinct normalized values of a column with their row counts,
+    collected chunk by chunk and merged when asked
+    """
+    def __init__(self):
+        self.parts = []
+
+    def add(self, values):
+        values, isnull = normalize(values)
+        counts = pd.Series(values[~isnull]).value_counts(sort=False)
+        self.parts.append(counts)
+
+    def merged(self):
+        """Series of row count by value"""
+        if not self.parts:
+            return pd.Series([], dtype=np.int64)
+        if len(self.parts) > 1:
+            # every part has the same kind of index unless the column
+            # changed dtype between chunks, compare as text then
+            kinds = {p.index.dtype == object for p in self.parts}
+            parts = self.parts if len(kinds) == 1 else \
+                [p.set_axis(p.index.astype(str)) for p in self.parts]
+            self.parts = [pd.concat(parts).groupby(level=0, sort=False).sum()]
+        return self.parts[0]
+
+
+class Validator():
+    """Checks tables against a parsed schema
+    Parameters
+    ----------
+    schema: dict
+        parsed schema, as returned by SchemaParser.extract_sql_doc, with
+        'exclusive' when tables are mutually exclusive
+    samples: int
+        offending values (or row numbers, for nulls) kept per violation
+    """
+    def __init__(self, schema, samples=SAMPLES):
+        self.schema = schema
+        self.samples = samples
+        self.violations = {}
+        self.rows = {}
+        self.key_hashes = {}
+        self.distinct = {}
+        # columns whose distinct values are needed by a foreign key or an
+        # exclusive table
+        self.tracked = set()
+        for table, constraints in schema.get('alter', {}).items():
+            for fk in constraints.get('foreign_keys', []):
+                self.tracked.add((table, fk['column']))
+                self.tracked.add((fk['referenced'], fk['source_column']))
+        for table, exclusive in schema.get('exclusive', {}).items():
+            self.tracked.update((table, c) for c in exclusive['columns'])
+
+    def add(self, constraint, table, columns, count, samples):
+        """Add count violations of a constraint"""
+        if not count:
+            return
+        key = (constraint, table, tuple(columns))
+        entry = self.violations.setdefault(key, {'constraint': constraint, 'table': table,
+                                                 'columns': list(columns), 'count': 0,
+                                                 'samples': []})
+        entry['count'] += int(count)
+        room = self.samples - len(entry['samples'])
+        entry['samples'] += [s.item() if hasattr(s, 'item') else s
+                             for s in list(samples)[:max(room, 0)]]
+
+    def feed(self, table, df):
+        """Check one chunk of a table"""
+        create_sql = self.schema['create'].get(table)
+        if create_sql is None:
+            raise ValueError("Table {} is not in the schema".format(table))
+        offset = self.rows.get(table, 0)
+        self.rows[table] = offset + df.shape[0]
+        constraints = self.schema.get('alter', {}).get(table, {})
+        keys = create_sql['primary_keys']
+        enums = {c['column']: c['values'] for c in constraints.get('check', [])
+                 if c['type'] == 'enum'}
+        for col in create_sql['columns']:
+            name = col['name']
+            if name not in df:
+                self.add('missing column', table, [name], df.shape[0], [])
+                continue
+            values = df[name]
+            isnull = values.isna().to_numpy(dtype=bool)
+            # null is None when the schema does not say, the column may be null
+            if (col.get('null') is False or name in keys) and isnull.any():
+                # samples are row numbers
+                self.add('not null', table, [name], isnull.sum(),
+                         offset + np.flatnonzero(isnull)[:self.samples])
+            if name in enums:
+                self._check_enum(table, name, values, enums[name])
+            if (table, name) in self.tracked:
+                self.distinct.setdefault((table, name), _Distinct()).add(values)
+        if keys and all(k in df for k in keys):
+            self.key_hashes.setdefault(table, []).append(hash_rows(df, keys))
+
+    def _check_enum(self, table, name, values, allowed):
+        values, isnull = normalize(values)
+        choices, _ = normalize(pd.Series(allowed, dtype=object))
+        if values.dtype != choices.dtype:
+            # compare as text, e.g. ints against check (c in ('0', '1'))
+            values = values.astype(str)
+            choices = choices.astype(str)
+        bad = ~isnull & ~pd.Series(values).isin(choices).to_numpy()
+        if bad.any():
+            self.add('check', table, [name], bad.sum(), pd.unique(values[bad])[:self.samples])
+
+    def finish(self, chunks=None):
+        """Run the checks that need whole tables and return the violations,
+        see feed
+        Parameters
+        ----------
+        chunks: callable
+            the chunks of a table again, given its name, to compare the
+            keys whose hashes collide. Without it they are reported as
+            'primary key hash', possible duplicates
+        Returns
+        -------
+        list of dicts with constraint, table, columns, count and samples
+        """
+        for table, parts in self.key_hashes.items():
+            hashes = pd.Series(np.concatenate(parts))
+            collided = pd.unique(hashes[hashes.duplicated()].to_numpy())
+            if not len(collided):
+                continue
+            keys = self.schema['create'][table]['primary_keys']
+            if chunks is None:
+                self.add('primary key hash', table, keys,
+                         hashes.isin(collided).sum() - len(collided), [])
+            else:
+                self._check_keys(table, keys, collided, chunks(table))
+        self.key_hashes = {}
+        for table, constraints in self.schema.get('alter', {}).items():
+            for fk in constraints.get('foreign_keys', []):
+                self._check_reference(table, fk)
+        self._check_exclusive()
+        return list(self.violations.values())
+
+    def _merged(self, table, column):
+        distinct = self.distinct.get((table, column))
+        if distinct is None:
+            return pd.Series([], dtype=np.int64)
+        return distinct.merged()
+
+    def _check_reference(self, table, fk):
+        if table not in self.rows:
+            return
+        child = self._merged(table, fk['column'])
+        if fk['referenced'] not in self.rows:
+            self.add('foreign key', table, [fk['column']], child.sum(), child.index[:self.samples])
+            return
+        parent = self._merged(fk['referenced'], fk['source_column'])
+        child_values, parent_values = _comparable(child.index, parent.index)
+        missing = ~pd.Index(child_values).isin(parent_values)
+        self.add('foreign key', table, [fk['column']], child[missing].sum(),
+                 child.index[missing][:self.samples])
+
+    def _check_exclusive(self):
+        exclusive = self.schema.get('exclusive', {})
+        done = set()
+        for table in sorted(exclusive):
+            for other in sorted(exclusive[table]['tables']):
+                if (other, table) in done or table not in self.rows or other not in self.rows:
+                    continue
+                done.add((table, other))
+                for c in exclusive[table]['columns']:
+                    ours = self._merged(table, c).index
+                    theirs = self._merged(other, c).index
+                    ours, theirs = _comparable(ours, theirs)
+                    shared = ours[pd.Index(ours).isin(theirs)]
+                    self.add('exclusive', table + ',' + other, [c], len(shared),
+                             shared[:self.samples])
+
+    def _check_keys(self, table, keys, hashes, chunks):
+        """Compare the keys of the rows whose key hash is one of hashes"""
+        found = []
+        for df in chunks:
+            hit = np.isin(hash_rows(df, keys), hashes)
+            if hit.any():
+                found.append(pd.DataFrame({k: normalize(df.loc[hit, k])[0] for k in keys}))
+        rows = pd.concat(found, ignore_index=True)
+        duplicated = rows.duplicated()
+        samples = [tuple(x.item() if hasattr(x, 'item') else x for x in r) for r in
+                   rows[duplicated].drop_duplicates().head(self.samples).itertuples(index=False)]
+        self.add('primary key', table, keys, duplicated.sum(),
+                 [r[0] if len(r) == 1 else r for r in samples])
+
+
+def _comparable(a, b):
+    """Two indexes of normalized values, as text if one holds ints and
+    the other strings
+    """
+    a = np.asarray(a)
+    b = np.asarray(b)
+    if len(a) and len(b) and (a.dtype == object) != (b.dtype == object):
+        return a.astype(str), b.astype(str)
+    return a, b
+
+
+def validate_db(schema, db, samples=SAMPLES):
+    """Violations of the constraints of schema in a dict of table name to
+    dataframe, such as DBGenerator.db. See Validator
+    """
+    validator = Validator(schema, samples)
+    for table, df in db.items():
+        validator.feed(table, df)
+    return validator.finish(lambda t: [db[t]])
+
+
+def table_files(outpath, tables):
+    """Files of every table in a folder written by export_db or
+    stream_db_data, from its state file or else by the table names
+    Returns
+    -------
+    (dict of table name to paths, null token of csv files or None)
+    """
+    state_path = os.path.join(outpath, STATE_FILE)
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+        files = {t: [os.path.join(outpath, f) for f in state['files'][t]
+                     if os.path.exists(os.path.join(outpath, f))]
+                 for t in state['files']}
+        return files, state.get('options', {}).get('na_rep')
+    files = {}
+    for t in tables:
+        for fmt in ['csv', 'parquet', 'feather']:
+            for compress in [None] + list(export.COMPRESSIONS):
+                path = export.table_path(outpath, t, fmt, compress)
+                if os.path.exists(path):
+                    files[t] = [path]
+    return files, None
+
+
+def validate_files(schema, outpath, chunk_rows=100000, samples=SAMPLES):
+    """Violations of the constraints of schema in the tables exported to
+    outpath, read chunk_rows rows at a time
+    """
+    files, na_rep = table_files(outpath, schema['create'])
+
+    def chunks(table):
+        for path in files[table]:
+            yield from export.iter_table(path, create_sql=schema['create'][table],
+                                         na_rep=na_rep, chunk_rows=chunk_rows)
+    validator = Validator(schema, samples)
+    for table in schema['create']:
+        if not files.get(table):
+            validator.add('missing table', table, [], 1, [])
+    for table in files:
+        for chunk in chunks(table):
+            validator.feed(table, chunk)
+    return validator.finish(chunks)
+
+
+def report(violations):
+    """Text report, one line per violated constraint"""
+    if not violations:
+        return 'no violations'
+    lines = []
+    for v in violations:
+        if v['constraint'] == 'missing table':
+            lines.append('{:<15} {}: no file'.format(v['constraint'], v['table']))
+            continue
+        lines.append('{:<15} {}({}): {} rows, e.g. {}'.format(
+            v['constraint'], v['table'], ','.join(v['columns']), v['count'], v['samples']))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check exported tables against their schema')
+    parser.add_argument('schema_file', help='schema the tables were generated from')
+    parser.add_argument('folder', help='folder the tables were exported to')
+    parser.add_argument('--exclusive', nargs='+', default=None,
+                        help='tables that must not share values of --exclude-on')
+    parser.add_argument('--exclude-on', nargs='+', default=None)
+    parser.add_argument('--chunk-rows', type=int, default=100000)
+    args = parser.parse_args()
+
+    schema = DBGenerator(args.schema_file, exclusive_list=args.exclusive,
+                         exclude_on=args.exclude_on).schema
+    violations = validate_files(schema, args.folder, chunk_rows=args.chunk_rows)
+    print(report(violations))
+    if violations:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,13 +2,14 @@ from distutils.core import setup
 
 required_pkgs = [
     "pandas",
-    "numpy"
+    "numpy>=2"
 ]
 
 setup (
     name='schema2db',
     version='0.0.1',
     packages=['schema2db'],
+    package_data={'schema2db': ['data/words.txt']},
     install_requires=required_pkgs,
     entry_points = {
         'console_scripts': ['schema2dbdata=schema2db.gendata:main']
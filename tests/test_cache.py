@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+from schema2db.cache import SchemaCache
+from schema2db.gendata import DBGenerator
+
+SCHEMA = os.path.join(os.path.dirname(__file__), 'testdata', 'testschema1.sql')
+
+
+def test_cache_hit_gives_the_same_plans(tmp_path):
+    cache = SchemaCache(str(tmp_path))
+    first = DBGenerator(SCHEMA, cache=cache)
+    assert len(cache.entries()) == 1
+    second = DBGenerator(SCHEMA, cache=cache)
+    assert second.schema == first.schema
+    assert second.order == first.order
+
+
+@pytest.mark.skipif(os.geteuid() == 0, reason='root writes read-only directories')
+def test_read_only_cache_is_skipped(tmp_path):
+    tmp_path.chmod(0o500)
+    try:
+        cache = SchemaCache(str(tmp_path / 'cache'))
+        db_gen = DBGenerator(SCHEMA, cache=cache)
+    finally:
+        tmp_path.chmod(0o700)
+    assert sorted(db_gen.schema['create']) == ['prices', 'sales']
+    assert cache.entries() == []
+
+
+def test_unusable_cache_path_is_skipped(tmp_path):
+    # a file where the cache directory should be
+    blocker = tmp_path / 'cache'
+    blocker.write_text('')
+    cache = SchemaCache(str(blocker / 'schema2db'))
+    db_gen = DBGenerator(SCHEMA, cache=cache)
+    assert sorted(db_gen.schema['create']) == ['prices', 'sales']
+    assert cache.store('key', {}) is False
+    assert cache.load('key') is None
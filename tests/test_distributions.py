@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from schema2db.distributions import FanOut, sample_indices, sample_values
+from schema2db.gendata import DBGenerator
+from schema2db.parse_schema import SchemaParser
+
+SCHEMA = """
+create table p (id int not null, primary key (id));
+create table c (id int not null, pid int not null references p (id),
+                st varchar(5) not null check (st in ('a', 'b', 'c')), primary key (id));
+"""
+
+
+def parse(doc):
+    return SchemaParser().extract_sql_string(doc)
+
+
+def test_zipf_indices_are_seeded_and_skewed():
+    choices = np.arange(100)
+    spec = {'type': 'zipf', 's': 1.0}
+    first = sample_indices(spec, choices, 100000, np.random.default_rng(1))
+    again = sample_indices(spec, choices, 100000, np.random.default_rng(1))
+    assert (first == again).all()
+    counts = np.bincount(first, minlength=100)
+    # choice k (from 1) has weight 1 / k
+    shares = 1 / np.arange(1, 101) / (1 / np.arange(1, 101)).sum()
+    assert np.abs(counts[:5] / 100000 - shares[:5]).max() < 0.01
+    assert counts[0] > counts[1] > counts[9] > counts[99]
+
+
+def test_weighted_indices_follow_the_weights():
+    choices = np.array(['x', 'y', 'z'])
+    spec = {'type': 'weighted', 'weights': {'x': 9, 'y': 1}}
+    indices = sample_indices(spec, choices, 100000, np.random.default_rng(2))
+    counts = np.bincount(indices, minlength=3)
+    assert counts[2] == 0
+    assert abs(counts[0] / 100000 - 0.9) < 0.01
+    with pytest.raises(ValueError, match='Got 2 weights for 3 choices'):
+        sample_indices({'type': 'weighted', 'weights': [1, 2]}, choices, 10)
+
+
+def test_skewed_values_stay_in_the_column_range():
+    values = sample_values('zipf', 'int', [], False, 10000, np.random.default_rng(3))
+    assert values.min() >= 1 and values.max() <= 10000
+    assert (values == 1).mean() > 0.5
+
+
+def test_fanout_counts_stay_within_bounds():
+    parents = np.arange(1000) * 10
+    fanout = FanOut(parents, 2, 5, rng=np.random.default_rng(4))
+    children = fanout.take(0, fanout.size)
+    assert len(children) == fanout.size
+    # laid out parent by parent, every parent between 2 and 5 times
+    assert (np.diff(children) >= 0).all()
+    counts = np.unique(children, return_counts=True)[1]
+    assert len(counts) == 1000 and counts.min() == 2 and counts.max() == 5
+    assert (fanout.take(100, 200) == children[100:200]).all()
+    with pytest.raises(ValueError, match='Invalid fan-out'):
+        FanOut(parents, 3, 2)
+
+
+def test_generated_fanout_and_distribution():
+    options = {'distributions': {'c.st': {'type': 'weighted', 'weights': {'a': 1, 'b': 3}}},
+               'fanout': {'c.pid': (1, 5)}}
+    db_gen = DBGenerator(parse(SCHEMA), seed=1, **options)
+    db_gen.gen_db_data(row_num=500)
+    child = db_gen.db['c']
+    counts = child['pid'].astype('int64').value_counts()
+    assert len(counts) == 500 and counts.min() >= 1 and counts.max() <= 5
+    assert child.shape[0] == counts.sum()
+    assert set(child['st'].astype(str)) == {'a', 'b'}
+    again = DBGenerator(parse(SCHEMA), seed=1, **options)
+    again.gen_db_data(row_num=500)
+    assert again.db['c'].equals(child)
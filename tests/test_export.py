@@ -0,0 +1,57 @@
+import os
+from decimal import Decimal
+
+import pandas as pd
+import pytest
+
+from schema2db.export import arrow_schema, insert_statements, to_arrow
+from schema2db.gendata import DBGenerator, STATE_FILE
+from schema2db.parse_schema import SchemaParser
+
+
+def test_insert_statements_quote_strings_and_write_nulls():
+    df = pd.DataFrame({'id': pd.array([1, 2, 3], dtype='UInt32'),
+                       'name': pd.array(["it's", None, ''], dtype='string'),
+                       'price': [Decimal('12.50'), Decimal('-0.05'), None],
+                       'day': pd.to_datetime(['2001-03-07', None, '1999-12-31']),
+                       'at': pd.to_datetime(['2001-03-07 08:09:10', '2000-01-01 00:00:00', None])})
+    col_types = {'id': 'int', 'name': 'varchar', 'price': 'decimal', 'day': 'date',
+                 'at': 'datetime'}
+    assert list(insert_statements(df, 't', col_types, batch_size=2)) == [
+        "INSERT INTO t (id,name,price,day,at) VALUES\n"
+        "(1,'it''s',12.50,'2001-03-07','2001-03-07 08:09:10'),\n"
+        "(2,NULL,-0.05,NULL,'2000-01-01 00:00:00');\n",
+        "INSERT INTO t (id,name,price,day,at) VALUES\n"
+        "(3,'',NULL,'1999-12-31',NULL);\n"]
+    assert list(insert_statements(df.iloc[:0], 't', col_types)) == []
+
+
+SCHEMA = """
+create table p (id int not null, name varchar(10) null, primary key (id));
+create table c (id int not null, pid int null references p (id), price decimal(8,2) null,
+                day date null, at datetime null, primary key (id));
+"""
+
+
+def test_parquet_parts_read_back_as_the_tables(tmp_path):
+    pa = pytest.importorskip('pyarrow')
+    import pyarrow.parquet as pq
+    schema = SchemaParser().extract_sql_string(SCHEMA)
+    db_gen = DBGenerator(schema, seed=1)
+    db_gen.gen_db_data(row_num=300)
+    db_gen.export_db(str(tmp_path), fmt='parquet', compress='zstd', part_rows=128, writers=2)
+    names = ['{}.part{:05d}.parquet'.format(t, i) for t in ['c', 'p'] for i in range(3)]
+    assert sorted(os.listdir(tmp_path)) == names + [STATE_FILE]
+    for tablename in ['p', 'c']:
+        parts = [pq.ParquetFile(tmp_path / '{}.part{:05d}.parquet'.format(tablename, i))
+                 for i in range(3)]
+        assert [part.metadata.num_rows for part in parts] == [128, 128, 44]
+        assert parts[0].metadata.row_group(0).column(0).compression == 'ZSTD'
+        table = pa.concat_tables(part.read() for part in parts)
+        create_sql = schema['create'][tablename]
+        # parquet has no second timestamps, the rest keeps its type
+        expected = to_arrow(db_gen.db[tablename], create_sql)
+        assert table.cast(arrow_schema(create_sql)).equals(expected)
+    assert table.schema.field('price').type == pa.decimal128(8, 2)
+    assert table.schema.field('day').type == pa.date32()
+    assert all(0 < table.column(c).null_count < 300 for c in ['pid', 'price', 'day', 'at'])
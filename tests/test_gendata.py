@@ -0,0 +1,188 @@
+import json
+
+import pandas as pd
+import pytest
+
+from schema2db.export import read_table
+from schema2db.gendata import DBGenerator, STATE_FILE
+from schema2db.parse_schema import SchemaParser
+
+ENUM_KEYS = """
+create table t (a int not null, b int not null, primary key (a, b));
+alter table t add constraint ca check (a in (1, 2));
+alter table t add constraint cb check (b in (1, 2, 3));
+"""
+
+
+def parse(doc):
+    return SchemaParser().extract_sql_string(doc)
+
+
+def test_composite_enum_keys_fail_instead_of_truncating():
+    db_gen = DBGenerator(parse(ENUM_KEYS), seed=1)
+    db_gen.gen_db_data(row_num=6)
+    assert len(db_gen.db['t'].drop_duplicates()) == 6
+    with pytest.raises(ValueError, match='Cannot generate 10 unique keys'):
+        db_gen.gen_db_data(row_num=10)
+
+
+NULLABLE_REFERENCES = """
+create table p (id int not null, primary key (id));
+create table c (id int not null, pid int null references p (id),
+                st varchar(5) null check (st in ('a', 'b')), primary key (id));
+"""
+
+
+def test_nullable_foreign_key_and_enum_columns_get_nulls():
+    db_gen = DBGenerator(parse(NULLABLE_REFERENCES), seed=1, null_rate={'c': 0.5})
+    db_gen.gen_db_data(row_num=20000)
+    child = db_gen.db['c']
+    for column in ['pid', 'st']:
+        assert 0.45 < child[column].isna().mean() < 0.55
+    assert child['pid'].dropna().isin(db_gen.db['p']['id']).all()
+    assert set(child['st'].dropna()) == {'a', 'b'}
+    assert db_gen.db['c']['id'].notna().all()
+
+
+EXCLUSIVE = """
+create table users (userid int not null, primary key (userid));
+create table individual (userid int not null references users (userid),
+                         name varchar(20), primary key (userid));
+create table company (cid int not null, userid int not null, primary key (cid));
+create table shop (userid int not null, primary key (userid));
+"""
+EXCLUSIVE_ROWS = {'users': 3000, 'individual': 900, 'company': 1000, 'shop': 1000}
+
+
+def exclusive_generator(**options):
+    return DBGenerator(parse(EXCLUSIVE), seed=1, exclude_on='userid',
+                       exclusive_list=['individual', 'company', 'shop'], **options)
+
+
+def test_exclusive_tables_are_disjoint_and_full():
+    db_gen = exclusive_generator()
+    db_gen.gen_db_data(row_num=EXCLUSIVE_ROWS)
+    assert {t: len(df) for t, df in db_gen.db.items()} == EXCLUSIVE_ROWS
+    users = [set(db_gen.db[t]['userid']) for t in ['individual', 'company', 'shop']]
+    assert not users[0] & users[1] and not users[0] & users[2] and not users[1] & users[2]
+    assert db_gen.db['shop']['userid'].is_unique
+    assert db_gen.db['individual']['userid'].isin(db_gen.db['users']['userid']).all()
+
+
+def test_exclusive_table_keyed_on_a_parent_gets_its_slice():
+    db_gen = exclusive_generator()
+    with pytest.warns(UserWarning, match='individual has only'):
+        db_gen.gen_db_data(row_num=100)
+    individual = db_gen.db['individual']
+    assert 0 < len(individual) < 100
+    assert individual['userid'].is_unique
+    assert individual['userid'].isin(db_gen.db['users']['userid']).all()
+    assert len(db_gen.db['company']) == len(db_gen.db['shop']) == 100
+    assert db_gen.high_water['individual'] == len(individual)
+
+
+def test_exclusive_tables_do_not_depend_on_chunks_or_workers():
+    whole = exclusive_generator()
+    whole.gen_db_data(row_num=EXCLUSIVE_ROWS)
+    parallel = exclusive_generator()
+    parallel.gen_db_data(row_num=EXCLUSIVE_ROWS, workers=2)
+    chunks = {}
+    for tablename, chunk in exclusive_generator().iter_db_chunks(row_num=EXCLUSIVE_ROWS,
+                                                                chunk_rows=333):
+        chunks.setdefault(tablename, []).append(chunk)
+    for tablename, df in whole.db.items():
+        assert parallel.db[tablename].equals(df)
+        chunked = pd.concat(chunks[tablename], ignore_index=True)
+        assert chunked.astype(object).equals(df.astype(object))
+
+
+def test_blocks_cover_every_row_once():
+    from schema2db.gendata import BLOCK_ROWS, block_bounds, block_of
+    upper = 0
+    for block in range(block_of(3 * BLOCK_ROWS) + 1):
+        lower, next_upper = block_bounds(block)
+        assert lower == upper
+        assert block_of(lower) == block and block_of(next_upper - 1) == block
+        upper = next_upper
+
+
+def test_chunks_across_block_bounds_match_the_whole_table():
+    whole = DBGenerator(parse(NULLABLE_REFERENCES), seed=1)
+    whole.gen_db_data(row_num=20000)
+    chunks = {}
+    for tablename, chunk in DBGenerator(parse(NULLABLE_REFERENCES), seed=1).iter_db_chunks(
+            row_num=20000, chunk_rows=1000):
+        chunks.setdefault(tablename, []).append(chunk)
+    for tablename, df in whole.db.items():
+        chunked = pd.concat(chunks[tablename], ignore_index=True)
+        assert chunked.astype(object).equals(df.astype(object))
+
+
+APPEND = """
+create table p (id int not null, name varchar(10), primary key (id));
+create table c (id int not null, pid int not null references p (id), primary key (id));
+"""
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'parquet'])
+def test_append_keeps_keys_unique_and_counts_rows(tmp_path, fmt):
+    if fmt == 'parquet':
+        pytest.importorskip('pyarrow')
+    outpath = str(tmp_path)
+    DBGenerator(parse(APPEND), seed=1).stream_db_data(outpath, row_num=300, chunk_rows=128,
+                                                      fmt=fmt)
+    DBGenerator(parse(APPEND)).append_db_data(outpath, row_num={'p': 50, 'c': 200})
+    with open(tmp_path / STATE_FILE) as f:
+        state = json.load(f)
+    assert state['rows'] == {'p': 350, 'c': 500}
+    db = {t: pd.concat([read_table(str(tmp_path / name)) for name in files],
+                       ignore_index=True)
+          for t, files in state['files'].items()}
+    assert len(state['files']['p']) == (1 if fmt == 'csv' else 2)
+    assert len(db['p']) == 350 and db['p']['id'].is_unique
+    assert len(db['c']) == 500 and db['c']['id'].is_unique
+    assert db['c']['pid'].isin(db['p']['id']).all()
+    # the new rows also point at the new parent rows
+    new_parents = db['p']['id'][300:]
+    assert db['c']['pid'][300:].isin(new_parents).any()
+
+
+VIRTUAL = """
+create table p (id int not null, name varchar(10) null, primary key (id));
+create table c (id int not null, pid int not null references p (id), price decimal(8,2) null,
+                day date null, primary key (id));
+"""
+
+
+def test_virtual_rows_match_the_generated_table():
+    row_num = {'p': 500, 'c': 1000}
+    db_gen = DBGenerator(parse(VIRTUAL), seed=1)
+    db_gen.gen_db_data(row_num=row_num)
+    virtual = DBGenerator(parse(VIRTUAL), seed=1).virtual_table('c', row_num=row_num)
+    assert len(virtual) == 1000
+    # blocks of 128, 256, 512, ... rows: 100..700 crosses two bounds
+    rows = virtual.take(100, 700)
+    expected = db_gen.db['c'].iloc[100:700].reset_index(drop=True)
+    assert rows.shape == expected.shape
+    for name in expected:
+        assert rows[name].astype(object).tolist() == expected[name].astype(object).tolist()
+    assert rows['pid'].isin(db_gen.db['p']['id']).all()
+
+
+PLANNED = """
+create table p (id int not null, primary key (id));
+create table c (id int not null, pid int not null references p (id), primary key (id));
+create table o (id int not null, primary key (id));
+"""
+
+
+def test_plan_rows_applies_scale_and_table_rows():
+    db_gen = DBGenerator(parse(PLANNED), seed=1, scale=2.5)
+    rows = db_gen.plan_rows(row_num={'p': 40, 'c': 10})
+    # o is not in the dict and gets the default 100 rows
+    assert rows == {'p': 100, 'o': 250, 'c': 25}
+    assert list(rows).index('p') < list(rows).index('c')
+    db_gen.gen_db_data(row_num={'p': 40, 'c': 10})
+    assert {t: df.shape[0] for t, df in db_gen.db.items()} == rows
+    fanout = DBGenerator(parse(PLANNED), seed=1, scale=2, fanout={'c.pid': (1, 3)})
+    assert fanout.plan_rows(row_num=30)['c'] == 120
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from schema2db import keys
+
+
+@pytest.mark.parametrize('signed, upper', [(None, 2 ** 31 - 1), (True, 2 ** 31 - 1),
+                                            (False, 2 ** 32 - 1)])
+def test_int_keys_stay_in_the_column_range(signed, upper):
+    domain = keys.KeyDomain('int', [], signed)
+    assert domain.size == upper
+    values = keys.UniqueKeys([domain], rng=np.random.default_rng(0)).take(0, 200000)[0]
+    assert values.min() >= 1 and values.max() <= upper
+    # half the unsigned range lies above the signed maximum
+    assert (values.max() > 2 ** 31 - 1) == (signed is False)
+
+
+def test_composite_keys_are_unique():
+    domains = [keys.ChoiceDomain(['a', 'b', 'c']), keys.KeyDomain('int', [], None)]
+    a, b = keys.UniqueKeys(domains, rng=np.random.default_rng(0)).take(0, 30000)
+    assert len(set(zip(a, b))) == 30000
+
+
+def test_too_many_keys_fail():
+    with pytest.raises(ValueError, match='only has 46021 values'):
+        keys.unique_keys('date', num_rows=46022)
+    keygen = keys.UniqueKeys([keys.ChoiceDomain([1, 2]), keys.ChoiceDomain([1, 2, 3])])
+    with pytest.raises(ValueError, match='Cannot generate 10 unique keys'):
+        keygen.take(0, 10)
+
+
+def test_slice_keys_fall_in_the_slice_in_any_chunking():
+    keygen = keys.UniqueKeys([keys.KeyDomain('int', [], None)], rng=np.random.default_rng(0))
+    sliced = keys.SliceKeys(keygen, 0, 0.25, 0.5)
+    whole = sliced.take(0, 50000)[0]
+    assert len(set(whole)) == 50000
+    assert keys.partition_mask(whole, 0.25, 0.5).all()
+    chunks = [sliced.take(i, min(i + 7000, 50000))[0] for i in range(0, 50000, 7000)]
+    assert (np.concatenate(chunks) == whole).all()
+    assert (sliced.take(20000, 20010)[0] == whole[20000:20010]).all()
+
+
+def test_partition_mask_splits_values_between_slices():
+    values = np.arange(100000)
+    bounds = keys.partition_bounds(['a', 'b', 'c'], [2, 1, 1])
+    masks = [keys.partition_mask(values, *bounds[t]) for t in 'abc']
+    assert (sum(m.astype(int) for m in masks) == 1).all()
+    assert 0.48 < masks[0].mean() < 0.52
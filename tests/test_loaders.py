@@ -0,0 +1,88 @@
+import struct
+
+import numpy as np
+import pandas as pd
+
+from schema2db.gendata import DBGenerator
+from schema2db.loaders import SQLiteLoader, copy_binary, _numeric_fields
+from schema2db.parse_schema import SchemaParser
+
+SCHEMA = """
+create table p (id int not null, name varchar(10) null, primary key (id));
+create table c (id int not null, pid int null references p (id), price decimal(8,2) null,
+                day date null, at datetime null, primary key (id));
+"""
+
+
+def parse(doc):
+    return SchemaParser().extract_sql_string(doc)
+
+
+def test_numeric_fields_are_base_10000_digits():
+    out = _numeric_fields(pd.Series([12.5, -0.05, 0]), 6, 2)
+    words = out.view('>i2').tolist()
+    # ndigits, weight, sign, dscale, digits; the fraction padded to 4 digits
+    assert words == [[2, 0, 0, 2, 12, 5000],
+                     [2, 0, 0x4000, 2, 0, 500],
+                     [2, 0, 0, 2, 0, 0]]
+    wide = _numeric_fields(pd.Series([123456789012345.25]), 20, 2)
+    assert wide.view('>i2').tolist() == [[6, 4, 0, 2, 0, 123, 4567, 8901, 2345, 2500]]
+
+
+def test_copy_binary_encodes_numerics_dates_and_nulls():
+    create_sql = {'tablename': 't', 'primary_keys': ['id'], 'columns': [
+        {'name': 'id', 'type': {'type': 'int', 'args': []}},
+        {'name': 'price', 'type': {'type': 'decimal', 'args': ['6', '2']}},
+        {'name': 'day', 'type': {'type': 'date', 'args': []}},
+        {'name': 'name', 'type': {'type': 'varchar', 'args': ['5']}}]}
+    df = pd.DataFrame({'id': [1, 2],
+                       'price': [12.5, None],
+                       'day': pd.to_datetime(['2000-01-02', None]),
+                       'name': ['ab', None]})
+    numeric = struct.pack('>6h', 2, 0, 0, 2, 12, 5000)
+    expected = (b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+                + struct.pack('>h', 4)
+                + struct.pack('>iq', 8, 1)
+                + struct.pack('>i', len(numeric)) + numeric
+                + struct.pack('>ii', 4, 1)
+                + struct.pack('>i', 2) + b'ab'
+                + struct.pack('>h', 4)
+                + struct.pack('>iq', 8, 2)
+                + struct.pack('>iii', -1, -1, -1)
+                + struct.pack('>h', -1))
+    assert copy_binary(df, create_sql) == expected
+    assert copy_binary(df.iloc[:0], create_sql, header=False) == struct.pack('>h', -1)
+
+
+def test_sqlite_load_matches_generated_data():
+    schema = parse(SCHEMA)
+    db_gen = DBGenerator(schema, seed=1)
+    db_gen.gen_db_data(row_num=300)
+    expected = db_gen.db
+    loader = SQLiteLoader(':memory:')
+    DBGenerator(schema, seed=1).load_db(loader, row_num=300, chunk_rows=128)
+    for tablename, df in expected.items():
+        names = [col['name'] for col in schema['create'][tablename]['columns']]
+        loaded = pd.DataFrame(loader.connection.execute(
+            'SELECT {} FROM "{}" ORDER BY id'.format(','.join(names), tablename)).fetchall(),
+            columns=names)
+        df = df.sort_values('id', ignore_index=True)
+        assert loaded.shape == df.shape
+        for name in names:
+            values = df[name]
+            mask = values.isna().to_numpy()
+            assert loaded[name].isna().to_numpy().tolist() == mask.tolist()
+            got = loaded[name][~mask].tolist()
+            kept = values[~mask]
+            if name in ['day', 'at']:
+                unit = 'D' if name == 'day' else 's'
+                want = np.datetime_as_string(kept.to_numpy().astype('datetime64[{}]'.format(unit)),
+                                             unit=unit).tolist()
+            elif name == 'price':
+                want = kept.astype(float).tolist()
+            elif name == 'name':
+                want = kept.astype(str).tolist()
+            else:
+                want = kept.astype('int64').tolist()
+            assert got == want
+    loader.close()
@@ -0,0 +1,137 @@
+import time
+
+import pytest
+
+from schema2db.parse_schema import SchemaParser, split_statements, _Cursor
+
+
+def parse(doc, **options):
+    return SchemaParser(**options).extract_sql_string(doc)
+
+
+def statements(lines):
+    return [(line, _Cursor.statement(text).tokens) for line, text in split_statements(lines)]
+
+
+def test_strings_and_comments_span_lines():
+    lines = ["a 'x\n", "y'' z\n", "w' b /* c\n", "d */ e `q\n", "r` ; -- f;\n", "g # h\n"]
+    expected = [(1, ['a', "'x\ny'' z\nw'", 'b', 'e', '`q\nr`']), (5, ['g'])]
+    assert statements(lines) == expected
+    # the same in one block
+    assert statements([''.join(lines)]) == expected
+
+
+def test_error_lines():
+    doc = 'create table t (a int);\n/* a\ncomment */ create table u (\n  b int,\n  (c) int);'
+    with pytest.raises(ValueError, match='Expected a name on line 5'):
+        parse(doc)
+    with pytest.raises(ValueError, match='Expected a name on line 5'):
+        SchemaParser().extract_sql_lines(doc.splitlines(keepends=True))
+
+
+def test_unterminated_comment():
+    with pytest.raises(ValueError, match='Unterminated comment starting on line 2'):
+        parse('create table t (a int);\n/* open\nstill open\n')
+
+
+def test_long_comment_parses_in_linear_time():
+    def seconds(lines):
+        doc = '/*\n' + 'a comment line ; -- \'"\n' * lines + '*/\ncreate table t (a int);\n'
+        start = time.perf_counter()
+        schema = parse(doc)
+        assert list(schema['create']) == ['t']
+        return time.perf_counter() - start
+
+    small = min(seconds(10000) for _ in range(3))
+    large = min(seconds(100000) for _ in range(3))
+    # quadratic scanning took minutes for 100k lines
+    assert large < small * 30
+
+
+def test_keywords_as_column_names():
+    schema = parse('create table kv (key varchar(20) not null, index int, unique int,\n'
+                   '  value varchar(100), primary key (key), key idx_value (value),\n'
+                   '  unique key u (index), index (unique), unique (value),\n'
+                   '  constraint c check (index in (1, 2)));')
+    table = schema['create']['kv']
+    assert [c['name'] for c in table['columns']] == ['key', 'index', 'unique', 'value']
+    assert table['primary_keys'] == ['key']
+    assert schema['alter']['kv']['check'] == [
+        {'type': 'enum', 'column': 'index', 'values': ['1', '2']}]
+
+
+def test_quoted_identifiers_and_strings():
+    schema = parse('create table "Order Items" (\n'
+                   '  "id" int not null primary key,\n'
+                   "  `note` varchar(20) default 'it''s; -- not a comment',\n"
+                   '  [qty] int check (qty in (1, 2, 3)) -- a comment; (\n'
+                   ');')
+    table = schema['create']['Order Items']
+    assert [c['name'] for c in table['columns']] == ['id', 'note', 'qty']
+    assert table['columns'][1]['default'] == "'it''s; -- not a comment'"
+    assert table['primary_keys'] == ['id']
+    assert schema['alter']['Order Items']['check'] == [
+        {'type': 'enum', 'column': 'qty', 'values': ['1', '2', '3']}]
+
+
+ALTER_FORMS = """
+create table p (id int not null, code int not null);
+create table c (id int not null, pid int references p (id), primary key (id));
+alter table p add constraint pk_p primary key (id);
+ALTER TABLE c ADD CONSTRAINT fk_c FOREIGN KEY (pid) REFERENCES p (id);
+alter table p (
+   add constraint chk_code check (code in (1, 2))
+);
+"""
+
+
+def test_alter_forms():
+    schema = parse(ALTER_FORMS)
+    assert schema['create']['p']['primary_keys'] == ['id']
+    # declared inline and again with alter table
+    assert schema['alter']['c']['foreign_keys'] == [
+        {'column': 'pid', 'referenced': 'p', 'source_column': 'id'}]
+    assert schema['alter']['p']['check'] == [
+        {'type': 'enum', 'column': 'code', 'values': ['1', '2']}]
+
+
+def test_unsupported_statements():
+    with pytest.raises(NotImplementedError, match='line 2'):
+        parse('create table t (a int);\ncreate index i on t (a);')
+    schema = parse('create table t (a int);\ncreate index i on t (a);', skip_unsupported=True)
+    assert list(schema['create']) == ['t']
+    with pytest.raises(ValueError, match='Expected a name on line 1'):
+        parse('create table t (a int, (b) int);')
+
+
+PLAIN = [
+    'create table t (a int not null, "b c" varchar(20) null default \'x\'\'y\', '
+    'd decimal(9, 2) unsigned default -1.5, e date, primary key (a, "b c"))',
+    'CREATE TABLE `t` (\n  `a` INT(11) SIGNED NOT NULL DEFAULT 0,\n  [b] Text null\n)',
+    'create table t (a int default current_date not null)',
+    'alter table t (\n add constraint c check (a in (1, -2, \'x,y\'))\n'
+    ' add constraint f foreign key (a, b) references p (x, y)\n)',
+    'alter table t add constraint f foreign key (a) references p, add primary key (a)',
+    'alter table t add check (b in (\'a\', \'it\'\'s\'))',
+]
+
+
+@pytest.mark.parametrize('text', PLAIN)
+def test_plain_statements_parse_as_tokens_do(text):
+    parser = SchemaParser()
+    plain = parser._parse_plain(text)
+    assert plain is not None
+    assert plain == parser.parse_statement(_Cursor.statement(text))
+
+
+@pytest.mark.parametrize('text', [
+    'create table t (a int, key varchar(5))',
+    'create table t (a int references p (id))',
+    'create table t (a int default now())',
+    'create table t (a int) engine=innodb',
+    'create table t (a character varying(5))',
+    'alter table t add constraint c check (a > 1)',
+    'alter table t (add constraint f foreign key (a) references p (b) on delete cascade)',
+])
+def test_other_statements_are_left_to_the_tokens(text):
+    assert SchemaParser()._parse_plain(text) is None
@@ -0,0 +1,33 @@
+import random
+
+import numpy as np
+import pytest
+
+import schema2db.randomdata as rd
+from schema2db.export import sql_literals
+from schema2db.gendata import DBGenerator
+
+TYPES = [('int', []), ('decimal', [8, 2]), ('varchar', [10]), ('date', []),
+         ('datetime', [])]
+
+
+def test_scalar_dates_are_zero_padded():
+    random.seed(1)
+    dates = rd.random_list('date', length=1000)
+    # the same text numpy prints for the dates
+    assert dates == np.datetime_as_string(np.array(dates, dtype='datetime64[D]')).tolist()
+    assert all(len(d) == 10 for d in dates)
+
+
+@pytest.mark.parametrize('datatype, args', TYPES)
+def test_scalar_and_vectorized_columns_look_the_same(datatype, args):
+    random.seed(1)
+    columns = [DBGenerator.gen_column_data(datatype, args, signed=True, isnull=False,
+                                           num_rows=500, vectorized=vectorized,
+                                           rng=np.random.default_rng(1))
+               for vectorized in [True, False]]
+    assert columns[0].dtype == columns[1].dtype
+    if datatype in ['date', 'datetime']:
+        literals = [sql_literals(c, datatype).tolist() for c in columns]
+        lengths = {len(literal) for column in literals for literal in column}
+        assert lengths == {12 if datatype == 'date' else 21}
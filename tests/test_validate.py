@@ -0,0 +1,85 @@
+import numpy as np
+
+from schema2db.gendata import DBGenerator
+from schema2db.parse_schema import SchemaParser
+from schema2db.validate import validate_db, validate_files
+
+SCHEMA = """
+create table p (id int not null, note varchar(10), primary key (id));
+create table c (id int not null, pid int null references p (id),
+                st varchar(5) not null check (st in ('a', 'b')), primary key (id));
+"""
+
+
+def generated(rows=2000):
+    db_gen = DBGenerator(SchemaParser().extract_sql_string(SCHEMA), seed=1)
+    db_gen.gen_db_data(row_num=rows)
+    return db_gen.schema, {t: df.copy() for t, df in db_gen.db.items()}
+
+
+def constraints(violations):
+    return sorted((v['constraint'], v['table'], tuple(v['columns'])) for v in violations)
+
+
+def test_generated_data_is_valid():
+    schema, db = generated()
+    assert validate_db(schema, db) == []
+
+
+def test_columns_without_null_clause_may_be_null():
+    schema, db = generated()
+    db['p']['note'] = db['p']['note'].astype(object)
+    db['p'].loc[::3, 'note'] = None
+    assert validate_db(schema, db) == []
+    db['c']['st'] = db['c']['st'].astype(object)
+    db['c'].loc[::5, 'st'] = None
+    assert constraints(validate_db(schema, db)) == [('not null', 'c', ('st',))]
+
+
+def test_duplicate_keys_are_found():
+    schema, db = generated()
+    db['p'].loc[[5, 6], 'id'] = db['p']['id'][4]
+    violations = validate_db(schema, db)
+    assert constraints(violations) == [('primary key', 'p', ('id',))]
+    assert violations[0]['count'] == 2
+    assert violations[0]['samples'] == [int(db['p']['id'][4])]
+
+
+def test_key_hash_collisions_are_not_duplicates(monkeypatch):
+    schema, db = generated()
+
+    def colliding(df, columns):
+        return np.zeros(df.shape[0], dtype=np.uint64)
+    monkeypatch.setattr('schema2db.validate.hash_rows', colliding)
+    assert validate_db(schema, db) == []
+
+
+def test_exported_folder_is_checked(tmp_path):
+    schema, db = generated()
+    db_gen = DBGenerator(schema, seed=1)
+    db_gen.gen_db_data(row_num=2000)
+    db_gen.export_db(str(tmp_path), part_rows=700)
+    assert validate_files(schema, str(tmp_path), chunk_rows=500) == []
+    for f in tmp_path.glob('p.*'):
+        f.unlink()
+    assert ('missing table', 'p', ()) in constraints(validate_files(schema, str(tmp_path)))
+
+
+def test_empty_folder_is_not_valid(tmp_path):
+    schema, db = generated()
+    assert constraints(validate_files(schema, str(tmp_path))) == [
+        ('missing table', 'c', ()), ('missing table', 'p', ())]
+
+
+def test_foreign_key_and_enum_violations_are_found():
+    schema, db = generated()
+    # nulls in a nullable foreign key are no violation
+    assert db['c']['pid'].isna().any()
+    db['c']['pid'] = db['c']['pid'].astype(object)
+    db['c']['st'] = db['c']['st'].astype(object)
+    db['c'].loc[3, 'pid'] = -1
+    db['c'].loc[[4, 8], 'st'] = 'z'
+    violations = {v['constraint']: v for v in validate_db(schema, db)}
+    assert sorted(violations) == ['check', 'foreign key']
+    assert violations['foreign key']['count'] == 1
+    assert violations['check']['count'] == 2